@@ -4,17 +4,90 @@ MonotaRO Q&A System - Flask Backend
 電商客服シミュ レーション Web アプリケーション
 """
 
+import json
 import os
-from flask import Flask, render_template, request, jsonify
+import time
+import prefork
+from flask import Flask, Response, render_template, request, jsonify, g, send_file, stream_with_context
 from flask_cors import CORS
-from inference import get_inference_engine
+from inference import ERRORS, METRICS, get_inference_engine
+from profiling import PROFILE_KINDS, RequestProfiler
+from session_store import SessionStore, is_valid_session_id
 
 # Flask アプリケーション
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['X-Session-ID'], supports_credentials=True)
 
 # 設定
 app.config['JSON_AS_ASCII'] = False
+DEBUG = os.environ.get('DEBUG', 'true').lower() == 'true'
+# ワーカープロセス数 (2 以上でプリフォーク方式のマルチプロセス起動、デバッグモードは無効)
+WORKERS = max(1, int(os.environ.get('WORKERS', 1)))
+# ワーカーあたりの torch スレッド数 (0: CPU コア数 / ワーカー数)
+TORCH_THREADS = int(os.environ.get('TORCH_THREADS', 0))
+# 一括予測 API の上限件数と、1 回の推論にまとめる件数
+SCORE_BATCH_MAX_ITEMS = int(os.environ.get('SCORE_BATCH_MAX_ITEMS', 10000))
+SCORE_BATCH_SIZE = int(os.environ.get('SCORE_BATCH_SIZE', 64))
+# このプロセスのワーカー番号 (プリフォーク時のみ)
+worker_index = None
+# 管理 API (/api/admin/*) とプロファイル指定ヘッダーの認証トークン (未設定の場合はローカルホストからのみ許可)
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+ADMIN_TOKEN_HEADER = 'X-Admin-Token'
+# リクエスト単位のプロファイル (ヘッダーで指定、または管理 API で設定したサンプリング率で取得)
+PROFILE_HEADER = 'X-Profile'
+profiler = RequestProfiler(
+    directory=os.environ.get('PROFILE_DIR') or None,
+    capacity=int(os.environ.get('PROFILE_BUFFER_SIZE', 50)),
+    sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+    kind=os.environ.get('PROFILE_KIND', 'cprofile').lower(),
+)
+
+# セッション設定 (ヘッダー優先、なければ Cookie)
+SESSION_HEADER = 'X-Session-ID'
+SESSION_COOKIE = 'mo_session_id'
+
+session_store = SessionStore(
+    max_sessions=int(os.environ.get('SESSION_MAX', 10000)),
+    ttl_seconds=int(os.environ.get('SESSION_TTL', 1800)),
+    max_history=int(os.environ.get('SESSION_MAX_HISTORY', 20)),
+)
+
+
+def get_session():
+    """リクエストに対応する対話セッションを取得 (なければ作成)"""
+    if 'dialogue_session' not in g:
+        # 形式が正しい ID だけを使う (未知・期限切れの ID は get_or_create が新しい ID に置き換える)
+        candidates = (request.headers.get(SESSION_HEADER), request.cookies.get(SESSION_COOKIE))
+        session_id = next((sid for sid in candidates if is_valid_session_id(sid)), None)
+        session, created = session_store.get_or_create(session_id)
+        g.dialogue_session = session
+        g.session_created = created
+    return g.dialogue_session
+
+
+@app.after_request
+def attach_session_id(response):
+    """セッション ID を Cookie とヘッダーで返す"""
+    session = g.get('dialogue_session')
+    if session is not None:
+        response.headers[SESSION_HEADER] = session.session_id
+        if g.get('session_created') or request.cookies.get(SESSION_COOKIE) != session.session_id:
+            response.set_cookie(SESSION_COOKIE, session.session_id,
+                                max_age=session_store.ttl_seconds, httponly=True, samesite='Lax')
+    return response
+
+
+def is_admin_request() -> bool:
+    """管理 API を許可するか (ADMIN_TOKEN が一致、未設定ならローカルホストからのリクエスト)"""
+    if ADMIN_TOKEN:
+        return request.headers.get(ADMIN_TOKEN_HEADER) == ADMIN_TOKEN
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+
+# プロセス起動と同時にバックグラウンドでモデルのロードを開始する
+# (デバッグ時のリローダー監視プロセスはリクエストを処理しないため除く)
+if not (__name__ == '__main__' and DEBUG and WORKERS == 1 and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'):
+    get_inference_engine()
 
 
 @app.route('/')
@@ -50,7 +123,9 @@ def select_category():
             return jsonify({"error": "category_id が必要です"}), 400
         
         engine = get_inference_engine()
-        result = engine.set_category(category_id)
+        session = get_session()
+        with session.lock:
+            result = engine.set_category(category_id, session)
         
         return jsonify(result)
     
@@ -69,7 +144,9 @@ def select_product():
             return jsonify({"error": "product_name が必要です"}), 400
         
         engine = get_inference_engine()
-        result = engine.set_product(product_name)
+        session = get_session()
+        with session.lock:
+            result = engine.set_product(product_name, session)
         
         return jsonify(result)
     
@@ -77,38 +154,174 @@ def select_product():
         return jsonify({"error": str(e)}), 500
 
 
+def read_chat_message():
+    """リクエストからチャットメッセージを取得
+
+    Returns:
+        (message, error)。不正な場合は error に返すレスポンス
+    """
+    data = request.get_json(silent=True)
+
+    if not isinstance(data, dict) or 'message' not in data:
+        return None, (jsonify({"error": "メッセージが必要です"}), 400)
+
+    if not isinstance(data['message'], str):
+        return None, (jsonify({"error": "メッセージは文字列で指定してください"}), 400)
+
+    message = data['message'].strip()
+
+    if not message:
+        return None, (jsonify({"error": "空のメッセージは送信できません"}), 400)
+
+    if len(message) > 1000:
+        return None, (jsonify({"error": "メッセージが長すぎます"}), 400)
+
+    return message, None
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Server-Sent Events の 1 イベント"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     """チャット API"""
     try:
-        data = request.get_json()
-        
-        if not data or 'message' not in data:
-            return jsonify({"error": "メッセージが必要です"}), 400
-        
-        message = data['message'].strip()
-        
-        if not message:
-            return jsonify({"error": "空のメッセージは送信できません"}), 400
-        
-        if len(message) > 1000:
-            return jsonify({"error": "メッセージが長すぎます"}), 400
+        message, error = read_chat_message()
+        if error:
+            return error
         
         engine = get_inference_engine()
-        result = engine.generate_response(message)
+        session = get_session()
+        header = request.headers.get(PROFILE_HEADER)
+        kind = profiler.select(header if header and is_admin_request() else None)
+        profile_id = None
+        with session.lock:
+            if kind is None:
+                result = engine.generate_response(message, session)
+            else:
+                result, profile_id = profiler.run(kind, engine.generate_response, message, session,
+                                                  meta={"path": request.path, "session_id": session.session_id})
         
-        return jsonify(result)
+        response = jsonify(result)
+        if profile_id is not None:
+            response.headers['X-Profile-ID'] = profile_id
+        return response
     
     except Exception as e:
+        ERRORS.inc("request")
+        print(f"[Error] {str(e)}")
+        return jsonify({"error": "サーバーエラーが発生しました"}), 500
+
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """チャット API (Server-Sent Events)
+
+    回答 (answer) → 満足度 (satisfaction) → 知識グラフ推論 (insight) の順に、
+    各段階が終わった時点でイベントを送る。最後に /api/chat と同じ内容の done を送る。
+    """
+    try:
+        message, error = read_chat_message()
+        if error:
+            return error
+
+        engine = get_inference_engine()
+        session = get_session()
+        header = request.headers.get(PROFILE_HEADER)
+        kind = profiler.select(header if header and is_admin_request() else None)
+    except Exception as e:
+        ERRORS.inc("request")
         print(f"[Error] {str(e)}")
         return jsonify({"error": "サーバーエラーが発生しました"}), 500
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+    def stages():
+        try:
+            for event, data in engine.generate_response_stages(message, session):
+                yield event, data
+        except Exception as e:
+            ERRORS.inc("request")
+            print(f"[Error] {str(e)}")
+            yield "error", {"error": "サーバーエラーが発生しました"}
+
+    if kind is not None:
+        # プロファイルは全段階の実行を対象とし、X-Profile-ID をヘッダーで返すため、
+        # 全段階が終わってからイベントをまとめて送る
+        with session.lock:
+            collected, profile_id = profiler.run(kind, lambda: list(stages()),
+                                                 meta={"path": request.path, "session_id": session.session_id})
+        if profile_id is not None:
+            headers['X-Profile-ID'] = profile_id
+        body = "".join(sse_event(event, data) for event, data in collected)
+        return Response(body, mimetype='text/event-stream', headers=headers)
+
+    def events():
+        # セッションのロックはストリームの送信が終わるまで保持する
+        with session.lock:
+            for event, data in stages():
+                yield sse_event(event, data)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers=headers)
+
+
+@app.route('/api/score_batch', methods=['POST'])
+def score_batch():
+    """対話単位の満足度一括予測 API (セッションを使わない)
+
+    リクエスト: {"items": [{"dialogue": "Q:...|||A:...", "category": "...", "id": 任意}, ...]}
+    SCORE_BATCH_SIZE 件ごとに推論し、結果を 1 行 1 件の NDJSON で逐次返す。
+    最後の行はスループット (dialogues_per_s) を含む集計。
+    """
+    data = request.get_json(silent=True)
+    items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "items が必要です"}), 400
+    if len(items) > SCORE_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"items は {SCORE_BATCH_MAX_ITEMS} 件までです"}), 400
+    for i, item in enumerate(items):
+        dialogue = item.get('dialogue') if isinstance(item, dict) else None
+        if not (isinstance(dialogue, str) and dialogue.strip()) and not (
+                isinstance(dialogue, list) and dialogue and all(isinstance(t, str) for t in dialogue)):
+            return jsonify({"error": f"items[{i}].dialogue が必要です"}), 400
+
+    engine = get_inference_engine()
+    pairs = [(item['dialogue'], item.get('category') or "") for item in items]
+
+    def lines():
+        start = time.perf_counter()
+        for offset in range(0, len(pairs), SCORE_BATCH_SIZE):
+            try:
+                results = engine.score_dialogues(pairs[offset:offset + SCORE_BATCH_SIZE])
+            except Exception as e:
+                ERRORS.inc("request")
+                print(f"[Error] {str(e)}")
+                yield json.dumps({"error": "サーバーエラーが発生しました", "index": offset}, ensure_ascii=False) + "\n"
+                return
+            for i, result in enumerate(results, start=offset):
+                line = {"index": i, **result}
+                if 'id' in items[i]:
+                    line["id"] = items[i]['id']
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+        elapsed = time.perf_counter() - start
+        yield json.dumps({
+            "done": True,
+            "dialogues": len(pairs),
+            "elapsed_s": round(elapsed, 3),
+            "dialogues_per_s": round(len(pairs) / elapsed, 1) if elapsed > 0 else None,
+        }) + "\n"
+
+    return Response(stream_with_context(lines()), mimetype='application/x-ndjson')
 
 
 @app.route('/api/reset', methods=['POST'])
 def reset_dialogue():
     """対話をリセット"""
     engine = get_inference_engine()
-    result = engine.reset_dialogue()
+    session = get_session()
+    with session.lock:
+        result = engine.reset_dialogue(session)
     return jsonify(result)
 
 
@@ -116,11 +329,16 @@ def reset_dialogue():
 def get_status():
     """現在の状態を取得"""
     engine = get_inference_engine()
+    session = get_session()
     return jsonify({
-        "current_category": engine.current_category,
-        "current_product": engine.current_product,
-        "model_loaded": engine.model_loaded,
-        "dialogue_length": len(engine.dialogue_history),
+        "session_id": session.session_id,
+        "current_category": session.current_category,
+        "current_product": session.current_product,
+        "model_loaded": engine.is_ready and engine.model_loaded,
+        "model_status": engine.status,
+        "precision": engine.precision,
+        "dialogue_length": len(session.dialogue_history),
+        "active_sessions": session_store.count(),
     })
 
 
@@ -128,22 +346,94 @@ def get_status():
 def health_check():
     """ヘルスチェック"""
     engine = get_inference_engine()
+    readiness = engine.get_readiness()
     return jsonify({
-        "status": "healthy",
+        # loading: モデルをロード中 (ルールベースで応答) / ready / degraded: モデルなしで稼働
+        "status": readiness["status"],
         "service": "MonotaRO Q&A System",
-        "model_loaded": engine.model_loaded,
+        "model_loaded": engine.is_ready and engine.model_loaded,
+        "readiness": readiness,
+        "model": engine.get_model_info(),
+        "sessions": session_store.stats(),
+        "batching": engine.get_batching_stats(),
+        "prediction_cache": engine.get_cache_stats(),
+        "cascade": engine.get_cascade_stats(),
+        "kg_table": engine.get_kg_table_stats(),
+        "process": {"pid": os.getpid(), "worker": worker_index, "workers": WORKERS},
     })
 
 
+@app.route('/api/admin/profiling', methods=['GET', 'POST'])
+def profiling_settings():
+    """プロファイルの設定 (POST で変更) と保存済みプロファイルの一覧"""
+    if not is_admin_request():
+        return jsonify({"error": "管理 API へのアクセスが許可されていません"}), 403
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "JSON オブジェクトが必要です"}), 400
+        try:
+            profiler.configure(sample_rate=data.get('sample_rate'), kind=data.get('kind'),
+                               header_enabled=data.get('header_enabled'))
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+    return jsonify({"settings": profiler.settings(), "kinds": list(PROFILE_KINDS), "profiles": profiler.entries()})
+
+
+@app.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+def download_profile(profile_id):
+    """プロファイルのダウンロード (cprofile: pstats 形式 .prof、torch: Chrome トレース .json)"""
+    if not is_admin_request():
+        return jsonify({"error": "管理 API へのアクセスが許可されていません"}), 403
+    trace = profiler.trace(profile_id)
+    if trace is None:
+        return jsonify({"error": "プロファイルが見つかりません"}), 404
+    path, content_type, filename = trace
+    return send_file(path, mimetype=content_type, as_attachment=True, download_name=filename)
+
+
+@app.route('/api/admin/profiles/<profile_id>/summary', methods=['GET'])
+def profile_summary(profile_id):
+    """プロファイルの要約 (関数・演算ごとの時間の上位、テキスト)"""
+    if not is_admin_request():
+        return jsonify({"error": "管理 API へのアクセスが許可されていません"}), 403
+    meta = profiler.get(profile_id)
+    if meta is None:
+        return jsonify({"error": "プロファイルが見つかりません"}), 404
+    return Response(meta["summary"], content_type='text/plain; charset=utf-8')
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """段階ごとのレイテンシとカウンタ (Prometheus テキスト形式、プリフォーク時は全ワーカーの合計)"""
+    return Response(METRICS.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8080))
-    debug = os.environ.get('DEBUG', 'true').lower() == 'true'
+    debug = DEBUG and WORKERS == 1
     
     print("=" * 60)
     print(" MonotaRO Q&A System (E-Commerce Customer Service)")
     print("=" * 60)
     print(f" URL: http://localhost:{port}")
     print(f" Debug: {debug}")
+    print(f" Workers: {WORKERS}")
     print("=" * 60)
     
-    app.run(host='0.0.0.0', port=port, debug=debug)
+    if WORKERS > 1:
+        # モデル・カタログ・検索インデックスをマスターでロードし終えてから fork する
+        engine = get_inference_engine()
+        engine.wait_until_ready()
+        torch_threads = TORCH_THREADS or prefork.default_torch_threads(WORKERS)
+
+        def on_worker_start(index):
+            global worker_index
+            worker_index = index
+            session_store.shard = (index, WORKERS)
+            METRICS.set_slot(index + 1)
+            engine.after_fork(torch_threads)
+
+        prefork.serve(app, '0.0.0.0', port, WORKERS, SESSION_HEADER, SESSION_COOKIE, on_worker_start)
+    else:
+        app.run(host='0.0.0.0', port=port, debug=debug)
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Dynamic Micro-Batching
+同時に届いた推論リクエストをまとめて 1 回のフォワードで処理するスケジューラ
+
+最大バッチサイズに達するか、最初のリクエストから最大待ち時間が経過した時点で
+キューをフラッシュし、結果をそれぞれの呼び出し元に返す。
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class BatchQueueFull(Exception):
+    """キューが上限に達してリクエストを受け付けられない"""
+
+
+class MicroBatcher:
+    """動的マイクロバッチング
+
+    Args:
+        process_fn: アイテムのリストを受け取り、同じ順序で結果のリストを返す関数
+        max_batch_size: 1 バッチの最大アイテム数
+        max_wait_ms: 最初のアイテム到着からフラッシュまでの最大待ち時間 (ミリ秒)
+        max_queue: 待ち行列の最大長 (超えると BatchQueueFull)
+    """
+
+    def __init__(self, process_fn, max_batch_size=16, max_wait_ms=5.0, max_queue=256, name="batcher"):
+        self.process_fn = process_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_queue = max(1, int(max_queue))
+        self.name = name
+
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._start_lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+        self._stopped = False
+
+        # 統計
+        self._stats_lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.errors = 0
+        self.batches = 0
+        self.flush_full = 0
+        self.flush_timeout = 0
+        self.max_batch_seen = 0
+        self.batch_size_counts = {}
+        self.total_queue_wait = 0.0
+        self.total_process_time = 0.0
+
+    # ------------------------------------------
+    # 公開 API
+    # ------------------------------------------
+    def submit(self, item) -> Future:
+        """アイテムをキューに追加し、結果を受け取る Future を返す"""
+        self._ensure_worker()
+        future = Future()
+        try:
+            self._queue.put_nowait((item, future, time.perf_counter()))
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            raise BatchQueueFull(f"{self.name}: queue is full ({self.max_queue})")
+        with self._stats_lock:
+            self.submitted += 1
+        return future
+
+    def predict(self, item, timeout=30.0):
+        """submit して結果を待つ"""
+        return self.submit(item).result(timeout=timeout)
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            items = sum(size * n for size, n in self.batch_size_counts.items())
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "max_queue": self.max_queue,
+                "queue_depth": self._queue.qsize(),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "errors": self.errors,
+                "batches": self.batches,
+                "avg_batch_size": round(items / self.batches, 3) if self.batches else 0.0,
+                "max_batch_seen": self.max_batch_seen,
+                "flush_full": self.flush_full,
+                "flush_timeout": self.flush_timeout,
+                "avg_queue_wait_ms": round(self.total_queue_wait / items * 1000.0, 3) if items else 0.0,
+                "avg_batch_time_ms": round(self.total_process_time / self.batches * 1000.0, 3) if self.batches else 0.0,
+                "batch_size_histogram": {str(k): v for k, v in sorted(self.batch_size_counts.items())},
+            }
+
+    def close(self):
+        """ワーカーを停止"""
+        self._stopped = True
+
+    # ------------------------------------------
+    # ワーカー
+    # ------------------------------------------
+    def _ensure_worker(self):
+        # fork 後の子プロセスにはスレッドが引き継がれないため、PID が変わったら起動し直す
+        pid = os.getpid()
+        if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+                return
+            if self._worker_pid != pid:
+                self._queue = queue.Queue(maxsize=self.max_queue)
+            self._stopped = False
+            self._worker_pid = pid
+            self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._worker.start()
+
+    def _collect_batch(self):
+        """最初のアイテムを待ち、サイズ上限か待ち時間上限までアイテムを集める"""
+        try:
+            first = self._queue.get(timeout=0.5)
+        except queue.Empty:
+            return None, None
+
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        reason = "full" if len(batch) >= self.max_batch_size else "timeout"
+        return batch, reason
+
+    def _run(self):
+        while not self._stopped:
+            batch, reason = self._collect_batch()
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            items = [item for item, _, _ in batch]
+            try:
+                results = self.process_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"{self.name}: expected {len(items)} results, got {len(results)}")
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                with self._stats_lock:
+                    self.errors += 1
+                continue
+            finished = time.perf_counter()
+
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+            with self._stats_lock:
+                size = len(batch)
+                self.batches += 1
+                self.completed += size
+                self.max_batch_seen = max(self.max_batch_seen, size)
+                self.batch_size_counts[size] = self.batch_size_counts.get(size, 0) + 1
+                self.total_queue_wait += sum(started - enqueued for _, _, enqueued in batch)
+                self.total_process_time += finished - started
+                if reason == "full":
+                    self.flush_full += 1
+                else:
+                    self.flush_timeout += 1
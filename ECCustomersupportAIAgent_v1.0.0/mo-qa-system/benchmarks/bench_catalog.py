@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Catalog Loading Benchmark
+product_data.json の全件パースと、バイナリカタログのメモリマップ + 遅延デコードの比較
+
+各方式を別プロセスで起動し、カタログを開くまでの時間と RSS の増加量、
+商品選択時 (set_product) のレコード取得時間を計測する。
+
+使い方:
+    python benchmarks/bench_catalog.py
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from bench_utils import QA_SYSTEM_DIR, percentile
+
+from catalog import BinaryCatalog, JsonCatalog
+
+JSON_PATH = os.path.join(QA_SYSTEM_DIR, "product_data.json")
+BINARY_PATH = os.path.join(QA_SYSTEM_DIR, "product_catalog.bin")
+
+
+def rss_mb() -> float:
+    """現在の RSS (MB)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def probe(mode: str, lookups: int) -> dict:
+    """子プロセス側: カタログを開き、商品レコードを取得する"""
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    catalog = BinaryCatalog(BINARY_PATH) if mode == "binary" else JsonCatalog(JSON_PATH)
+    categories = catalog.categories()
+    products = [(c, p) for c in categories for p in catalog.products(c)]
+    load_ms = (time.perf_counter() - start) * 1000
+    rss_after_load = rss_mb()
+
+    latencies = []
+    for i in range(lookups):
+        category, product = products[i % len(products)]
+        start = time.perf_counter()
+        info = catalog.get(category, product)
+        info.get("params", {}), info.get("qa", [])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "mode": mode,
+        "products": len(products),
+        "load_ms": round(load_ms, 2),
+        "rss_delta_mb": round(rss_after_load - rss_before, 1),
+        "rss_after_lookups_mb": round(rss_mb() - rss_before, 1),
+        "lookup_p50_ms": round(percentile(latencies, 50), 3),
+        "lookup_p99_ms": round(percentile(latencies, 99), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="カタログ読み込みのベンチマーク")
+    parser.add_argument("--lookups", type=int, default=200, help="商品レコードの取得回数")
+    parser.add_argument("--probe", choices=["json", "binary"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        print(json.dumps(probe(args.probe, args.lookups)))
+        return
+
+    for path in (JSON_PATH, BINARY_PATH):
+        if not os.path.exists(path):
+            print(f"!!! {path} がありません。generate_data.py を先に実行してください。")
+            return
+
+    results = []
+    for mode in ("json", "binary"):
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--probe", mode, "--lookups", str(args.lookups)],
+            capture_output=True, text=True, check=True,
+        )
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    print("=" * 72)
+    print(" Catalog Loading Benchmark (product_data.json vs binary catalog)")
+    print("=" * 72)
+    print(f" JSON   : {os.path.getsize(JSON_PATH) / 1024 / 1024:6.1f} MB  {JSON_PATH}")
+    print(f" Binary : {os.path.getsize(BINARY_PATH) / 1024 / 1024:6.1f} MB  {BINARY_PATH}")
+    print(f" {'mode':<8}{'open (ms)':>12}{'RSS +MB':>10}{'RSS +MB*':>10}{'get p50':>10}{'get p99':>10}")
+    for r in results:
+        print(f" {r['mode']:<8}{r['load_ms']:>12.1f}{r['rss_delta_mb']:>10.1f}{r['rss_after_lookups_mb']:>10.1f}"
+              f"{r['lookup_p50_ms']:>10.3f}{r['lookup_p99_ms']:>10.3f}")
+    print(f" * after {args.lookups} product lookups (get = set_product のレコード取得, ms)")
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Hot Path Micro-benchmarks
+MonotaROInference の主要な処理を、シード固定の入力で個別に計測する。
+
+- detect_intent / _check_obvious_sentiment (キーワード照合を含む)
+- _find_best_match_qa (Q&A 20 件 / 2000 件の商品)
+- トークナイザーの encode (短文 / 長文)
+- HighAccuracyClassifierV2 の forward (系列長 × バッチサイズ)
+- predict_kg_tail (知識グラフのエンティティ名 / 事前計算表にあるカタログ商品名)
+
+各処理は 1 回の計測が約 --min-time 秒になるよう呼び出し回数を決め、--repeats 回計測した
+1 呼び出しあたりの最短時間 (best_us) と中央値 (median_us) を JSON に保存する。
+ベースライン (--baseline) があれば best_us を比較し、--max-regression-pct を超えて遅くなった処理が
+あれば終了コード 1。ベースラインは実行環境に依存するため、同じマシンで --save-baseline で作成する。
+モデル・知識グラフがロードできない場合、該当する処理は skipped になる。
+
+使い方:
+    python benchmarks/bench_hot_paths.py --save-baseline
+    python benchmarks/bench_hot_paths.py --max-regression-pct 15 --output hot_paths.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+os.environ.setdefault("BATCHING", "false")
+
+from bench_utils import BENCH_DIR
+
+import inference
+from retrieval import QAIndex
+from session_store import DialogueSession
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "hot_paths_baseline.json")
+SEQ_LENGTHS = (32, 64, 128, 256)
+BATCH_SIZES = (1, 8, 32)
+
+# シード固定の入力を組み立てる語彙
+PRODUCTS = ["ヘルメット", "安全靴", "作業手袋", "電動ドリル", "インパクトドライバー", "脚立", "防塵マスク", "LEDライト"]
+PARAMS = ["価格", "重さ", "サイズ", "材質", "電圧", "保証期間", "在庫", "納期", "色", "対応規格"]
+QUESTION_TEMPLATES = ["{product}の{param}を教えてください", "{product}の{param}はどのくらいですか？",
+                      "この{product}は{param}について確認できますか", "{param}が知りたいです（{product}）"]
+MESSAGES = ["在庫はありますか？", "いつ届きますか？", "サイズを教えてください", "返品できますか？",
+            "とても助かりました。ありがとうございます！", "商品が壊れていました。最悪です。",
+            "こんにちは", "おすすめはどれですか", "価格はいくらですか", "品質は大丈夫でしょうか"]
+
+
+def make_qa_list(rng, size):
+    qa_list = []
+    for i in range(size):
+        product = rng.choice(PRODUCTS)
+        param = rng.choice(PARAMS)
+        question = rng.choice(QUESTION_TEMPLATES).format(product=product, param=param)
+        qa_list.append({"q": f"{question} (型番 {i})", "a": f"{product}の{param}は仕様書 {i} をご確認ください。"})
+    return qa_list
+
+
+def make_messages(rng, count):
+    """定型メッセージに商品・パラメータを混ぜた問い合わせ文"""
+    return [f"{rng.choice(MESSAGES)} {rng.choice(PRODUCTS)}の{rng.choice(PARAMS)}について" for _ in range(count)]
+
+
+def measure(fn, inputs, min_time, repeats):
+    """inputs を順に fn に渡し、1 呼び出しあたりの時間 (μs) の最短値と中央値"""
+    n = len(inputs)
+    # 呼び出し回数を決める (1 回の計測が min_time 秒以上)
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for i in range(calls):
+            fn(inputs[i % n])
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or calls >= 1_000_000:
+            break
+        calls *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / elapsed) + 1))
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for i in range(calls):
+            fn(inputs[i % n])
+        samples.append((time.perf_counter() - start) / calls * 1e6)
+    samples.sort()
+    return {"best_us": round(samples[0], 3), "median_us": round(samples[len(samples) // 2], 3),
+            "calls": calls, "repeats": repeats}
+
+
+def build_cases(engine, rng):
+    """(名前, 関数, 入力リスト) または (名前, None, スキップ理由)"""
+    messages = make_messages(rng, 256)
+    cases = [
+        ("detect_intent", engine.detect_intent, messages),
+        ("check_obvious_sentiment", engine._check_obvious_sentiment, messages),
+    ]
+
+    for label, size in (("small", 20), ("large", 2000)):
+        qa_list = make_qa_list(rng, size)
+        session = DialogueSession(f"bench-{label}")
+        session.current_qa_list = qa_list
+        session.current_qa_index = QAIndex(qa_list)
+        queries = [rng.choice(qa_list)["q"][:-6] if i % 2 == 0 else message
+                   for i, message in enumerate(messages)]
+        cases.append((f"find_best_match_qa[{label}={size}]",
+                      lambda query, session=session: engine._find_best_match_qa(query, session), queries))
+
+    if engine.tokenizer is None:
+        cases.append(("tokenizer_encode", None, "tokenizer not loaded"))
+    else:
+        long_messages = [" ".join(make_messages(rng, 8)) for _ in range(64)]
+        cases.append(("tokenizer_encode[short]", engine._encode_segment, messages))
+        cases.append(("tokenizer_encode[long]", engine._encode_segment, long_messages))
+
+    if engine.model is None:
+        cases.append(("classifier_forward", None, "model not loaded"))
+    else:
+        torch = inference.torch
+        generator = torch.Generator().manual_seed(rng.randrange(2 ** 31))
+        vocab_size = engine.tokenizer.vocab_size
+
+        def forward(batch):
+            input_ids, attention_mask, topics = batch
+            with torch.no_grad(), inference.autocast_context(engine.device, engine.precision):
+                return engine.model(input_ids.to(engine.device), attention_mask.to(engine.device),
+                                    topics.to(engine.device))
+
+        for seq_len in SEQ_LENGTHS:
+            for batch_size in BATCH_SIZES:
+                batch = (torch.randint(5, vocab_size, (batch_size, seq_len), generator=generator),
+                         torch.ones((batch_size, seq_len), dtype=torch.long),
+                         torch.randint(0, len(inference.CATEGORY_LIST), (batch_size,), generator=generator))
+                cases.append((f"classifier_forward[seq={seq_len},batch={batch_size}]", forward, [batch]))
+
+    if not engine.kg_loaded:
+        cases.append(("predict_kg_tail", None, "knowledge graph not loaded"))
+    else:
+        entities = sorted(engine.kg_e2id)
+        pairs = [(rng.choice(entities), rng.choice(["属性", "カテゴリ"])) for _ in range(64)]
+        cases.append(("predict_kg_tail", lambda pair: engine.predict_kg_tail(*pair), pairs))
+        if engine.kg_table:
+            keys = sorted(engine.kg_table)
+            cases.append(("predict_kg_tail[table]", lambda key: engine.predict_kg_tail(*key),
+                          [rng.choice(keys) for _ in range(64)]))
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description="推論エンジンの主要処理のマイクロベンチマーク")
+    parser.add_argument("--seed", type=int, default=0, help="入力を生成する乱数シード")
+    parser.add_argument("--repeats", type=int, default=5, help="各処理の計測回数")
+    parser.add_argument("--min-time", type=float, default=0.2, help="1 回の計測の最短時間 (秒)")
+    parser.add_argument("--only", default=None, help="名前にこの文字列を含む処理だけを計測")
+    parser.add_argument("--output", default=None, help="結果を保存する JSON")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="比較するベースラインの JSON")
+    parser.add_argument("--save-baseline", action="store_true", help="今回の結果をベースラインとして保存")
+    parser.add_argument("--max-regression-pct", type=float, default=20.0, help="許容する best_us の悪化率 (%)")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    engine = inference.MonotaROInference()
+    cases = build_cases(engine, random.Random(args.seed))
+
+    results = {}
+    skipped = {}
+    for name, fn, inputs in cases:
+        if args.only and args.only not in name:
+            continue
+        if fn is None:
+            skipped[name] = inputs
+            continue
+        for item in inputs[:8]:
+            fn(item)  # ウォームアップ
+        results[name] = measure(fn, inputs, args.min_time, args.repeats)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "torch": getattr(inference.torch, "__version__", None),
+            "cpus": os.cpu_count(),
+            "device": engine.device,
+            "precision": engine.precision,
+            "quantization": engine.quantization,
+            "seed": args.seed,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+        "skipped": skipped,
+    }
+
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print("=" * 86)
+    print(f" Hot Path Micro-benchmarks (seed {args.seed}, {args.repeats} repeats, device {engine.device})")
+    print("=" * 86)
+    print(f" {'case':<44}{'best us':>11}{'median us':>11}{'baseline':>11}{'change':>9}")
+    regressions = []
+    for name, r in results.items():
+        base = (baseline or {}).get("results", {}).get(name)
+        if base:
+            change = (r["best_us"] - base["best_us"]) / base["best_us"] * 100
+            flag = " !" if change > args.max_regression_pct else ""
+            if flag:
+                regressions.append((name, change))
+            print(f" {name:<44}{r['best_us']:>11.2f}{r['median_us']:>11.2f}{base['best_us']:>11.2f}"
+                  f"{change:>+8.1f}%{flag}")
+        else:
+            print(f" {name:<44}{r['best_us']:>11.2f}{r['median_us']:>11.2f}{'-':>11}{'-':>9}")
+    for name, reason in skipped.items():
+        print(f" {name:<44}  skipped ({reason})")
+    print("=" * 86)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f" Results: {args.output}")
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f" Baseline saved: {args.baseline}")
+    elif baseline is None:
+        print(f" No baseline at {args.baseline} (create one with --save-baseline)")
+
+    if regressions:
+        for name, change in regressions:
+            print(f"!!! {name}: {change:+.1f}% (> {args.max_regression_pct}%)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Metrics Overhead Benchmark
+メトリクスの記録 (Histogram.observe / Counter.inc) 1 回あたりの時間と、
+応答 1 件あたりの記録回数から、常時有効にした場合のオーバーヘッドを見積もる。
+
+reproduce/data/valid の対話を generate_response で再生し、メトリクスの有効・無効を
+交互に切り替えて応答時間も比較する (こちらは実行ごとのばらつきを含む参考値)。
+見積もったオーバーヘッドが --max-overhead-pct を超えた場合は終了コード 1。
+
+使い方:
+    python benchmarks/bench_metrics_overhead.py --limit 100 --max-overhead-pct 1
+"""
+
+import argparse
+import sys
+import time
+
+from bench_utils import load_dialogues, split_turns
+
+import generate_data
+import inference
+from metrics import Histogram, MetricsRegistry
+from session_store import DialogueSession
+
+
+def ns_per_call(fn, iterations):
+    """fn() 1 回あたりの時間 (ns、空ループの時間を除く)"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        pass
+    empty = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return max(0.0, time.perf_counter() - start - empty) / iterations * 1e9
+
+
+def recorded_events():
+    """これまでに記録されたヒストグラムの観測数とカウンタの加算回数の合計"""
+    total = 0
+    for metric in inference.METRICS._metrics:
+        for label_value in metric._offsets:
+            if isinstance(metric, Histogram):
+                total += metric.snapshot(label_value)["count"]
+            else:
+                total += metric.value(label_value)
+    return total
+
+
+def replay(engine, conversations):
+    """対話を再生し、応答ごとの時間 (ms) を返す"""
+    samples = []
+    for i, (category, product, questions) in enumerate(conversations):
+        session = DialogueSession(f"bench-{i}")
+        if category is not None:
+            engine.set_category(category, session)
+            if product is not None:
+                engine.set_product(product, session)
+        for question in questions:
+            start = time.perf_counter()
+            engine.generate_response(question, session)
+            samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="メトリクス記録のオーバーヘッドのベンチマーク")
+    parser.add_argument("--limit", type=int, default=100, help="再生する対話数")
+    parser.add_argument("--iterations", type=int, default=200000, help="記録 1 回の時間を測る繰り返し回数")
+    parser.add_argument("--rounds", type=int, default=3, help="有効・無効を交互に再生する回数")
+    parser.add_argument("--max-overhead-pct", type=float, default=1.0, help="許容する応答時間に対するオーバーヘッド (%)")
+    args = parser.parse_args()
+
+    # 記録 1 回あたりの時間 (アプリのレジストリを汚さないよう、別のレジストリで測る)
+    registry = MetricsRegistry()
+    histogram = registry.histogram("bench_seconds", "bench", label="stage", label_values=("a",))
+    counter = registry.counter("bench_total", "bench")
+    observe_ns = ns_per_call(lambda: histogram.observe("a", 0.003), args.iterations)
+    inc_ns = ns_per_call(counter.inc, args.iterations)
+    registry.enabled = False
+    disabled_ns = ns_per_call(lambda: histogram.observe("a", 0.003), args.iterations)
+
+    engine = inference.MonotaROInference()
+    conversations = []
+    for row in load_dialogues("valid", limit=args.limit):
+        category = row.get("first_category", "")
+        category_id = product = None
+        if category in inference.CATEGORY_LIST:
+            category_id = inference.CATEGORY_LIST.index(category)
+            product = generate_data.extract_product_name(row.get("keywords", ""))
+            if (category, product) not in inference.CATALOG:
+                product = None
+        conversations.append((category_id, product, [q for q, _ in split_turns(row.get("sent", ""))]))
+    if not conversations:
+        print("!!! reproduce/data/valid の対話がありません。")
+        sys.exit(1)
+
+    # ウォームアップ後、有効・無効を交互に再生 (推論結果キャッシュは毎回クリア)
+    replay(engine, conversations[:10])
+    enabled_ms, disabled_ms = [], []
+    events_per_response = 0.0
+    for _ in range(args.rounds):
+        for enabled, samples in ((True, enabled_ms), (False, disabled_ms)):
+            inference.METRICS.enabled = enabled
+            engine.prediction_cache.invalidate()
+            before = recorded_events()
+            round_samples = replay(engine, conversations)
+            if enabled:
+                events_per_response = (recorded_events() - before) / len(round_samples)
+            samples.extend(round_samples)
+    inference.METRICS.enabled = True
+
+    mean_enabled = sum(enabled_ms) / len(enabled_ms)
+    mean_disabled = sum(disabled_ms) / len(disabled_ms)
+    estimated_us = events_per_response * max(observe_ns, inc_ns) / 1000
+    estimated_pct = estimated_us / (mean_disabled * 1000) * 100
+    measured_pct = (mean_enabled - mean_disabled) / mean_disabled * 100
+
+    print("=" * 64)
+    print(f" Metrics Overhead Benchmark ({len(enabled_ms) // args.rounds} responses x {args.rounds} rounds)")
+    print("=" * 64)
+    print(f" Histogram.observe      : {observe_ns:8.0f} ns/call")
+    print(f" Counter.inc            : {inc_ns:8.0f} ns/call")
+    print(f" observe (disabled)     : {disabled_ns:8.0f} ns/call")
+    print(f" Events per response    : {events_per_response:8.1f}")
+    print(f" Mean response (on/off) : {mean_enabled:8.3f} / {mean_disabled:.3f} ms")
+    print(f" Estimated overhead     : {estimated_us:8.2f} us/response ({estimated_pct:.3f}%)")
+    print(f" Measured difference    : {measured_pct:+8.2f}% (run-to-run noise included)")
+    print(f" Model-based: {engine.model_loaded} | Knowledge graph: {engine.kg_loaded}")
+    print("=" * 64)
+
+    if estimated_pct > args.max_overhead_pct:
+        print(f"!!! overhead {estimated_pct:.3f}% exceeds {args.max_overhead_pct}%")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
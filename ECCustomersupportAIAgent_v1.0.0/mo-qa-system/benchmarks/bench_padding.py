@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Padding Benchmark
+固定長 (max_length=256) パディングと動的パディング + 長さバケットの比較
+
+reproduce/data/valid の対話をチャット時と同じ形式の入力に変換し、
+レイテンシと推定 FLOPs を比較する。
+
+使い方:
+    python benchmarks/bench_padding.py --limit 200 --batch-size 16
+"""
+
+import argparse
+import os
+import time
+
+# ベンチマーク中はマイクロバッチを介さず直接推論する
+os.environ.setdefault("BATCHING", "false")
+
+from bench_utils import build_chat_inputs, load_dialogues, summarize_ms
+
+import inference
+from inference import MonotaROInference, CATEGORY_LIST, LENGTH_BUCKETS, MAX_SEQ_LENGTH
+
+
+def encoder_flops(seq_len, config):
+    """エンコーダ 1 系列あたりの推定 FLOPs (積和 = 2 FLOPs)"""
+    h = config.hidden_size
+    ffn = config.intermediate_size
+    per_layer = 8 * seq_len * h * h + 4 * seq_len * h * ffn + 4 * seq_len * seq_len * h
+    return config.num_hidden_layers * per_layer
+
+
+def run_fixed(engine, batches):
+    """従来方式: 全系列を max_length=256 までパディング"""
+    latencies, flops, tokens = [], 0, 0
+    config = engine.model.backbone.config
+    for batch in batches:
+        start = time.perf_counter()
+        encoded = engine.tokenizer(
+            [text for text, _ in batch],
+            max_length=MAX_SEQ_LENGTH,
+            truncation=True,
+            padding='max_length',
+            return_tensors='pt'
+        )
+        topics = inference.torch.tensor([topic for _, topic in batch])
+        with inference.torch.no_grad():
+            logits = engine.model(encoded['input_ids'], encoded['attention_mask'], topics)
+            logits.argmax(dim=1).tolist()
+        latencies.append(time.perf_counter() - start)
+        flops += len(batch) * encoder_flops(MAX_SEQ_LENGTH, config)
+        tokens += len(batch) * MAX_SEQ_LENGTH
+    return latencies, flops, tokens
+
+
+def run_dynamic(engine, batches):
+    """新方式: 長さバケットごとに最長系列までパディング"""
+    latencies, flops, tokens = [], 0, 0
+    config = engine.model.backbone.config
+    for batch in batches:
+        start = time.perf_counter()
+        id_lists = engine.tokenizer(
+            [text for text, _ in batch], max_length=MAX_SEQ_LENGTH, truncation=True)['input_ids']
+        engine._forward_token_batch(id_lists, [topic for _, topic in batch])
+        latencies.append(time.perf_counter() - start)
+
+        lengths = [len(ids) for ids in id_lists]
+        buckets = {}
+        for length in lengths:
+            bucket = next((b for b in LENGTH_BUCKETS if length <= b), LENGTH_BUCKETS[-1])
+            buckets.setdefault(bucket, []).append(length)
+        for bucket_lengths in buckets.values():
+            padded = max(bucket_lengths)
+            flops += len(bucket_lengths) * encoder_flops(padded, config)
+            tokens += len(bucket_lengths) * padded
+    return latencies, flops, tokens
+
+
+def report(name, latencies, flops, tokens, n_inputs):
+    summary = summarize_ms(latencies)
+    total = sum(latencies)
+    print(f" {name:<22} total={total:8.2f}s  mean={summary['mean_ms']:8.2f}ms  "
+          f"p50={summary['p50_ms']:8.2f}ms  p95={summary['p95_ms']:8.2f}ms  "
+          f"tokens={tokens:>9,}  GFLOPs={flops / 1e9:10.1f}  "
+          f"throughput={n_inputs / total if total else 0:7.1f}/s")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="固定長パディング vs 動的パディングのベンチマーク")
+    parser.add_argument("--limit", type=int, default=200, help="使用する対話数")
+    parser.add_argument("--batch-size", type=int, default=16, help="バッチ推論時のバッチサイズ")
+    args = parser.parse_args()
+
+    rows = load_dialogues("valid", limit=args.limit)
+    if not rows:
+        print("!!! reproduce/data/valid に対話データがありません。gen_monotaro_mock_data.py を先に実行してください。")
+        return
+
+    engine = MonotaROInference()
+    if engine.model is None:
+        print("!!! モデルがロードできないためベンチマークを実行できません。")
+        return
+
+    inputs = build_chat_inputs(rows, CATEGORY_LIST)
+    lengths = [len(ids) for ids in engine.tokenizer(
+        [text for text, _ in inputs], max_length=MAX_SEQ_LENGTH, truncation=True)['input_ids']]
+
+    print("=" * 60)
+    print(" Padding Benchmark (fixed max_length=256 vs dynamic)")
+    print("=" * 60)
+    print(f" Dialogues: {len(rows)} | Model inputs: {len(inputs)}")
+    print(f" Token length: mean={sum(lengths) / len(lengths):.1f}, max={max(lengths)}")
+    print(f" Length buckets: {LENGTH_BUCKETS}")
+    print("-" * 60)
+
+    for batch_size in sorted({1, args.batch_size}):
+        batches = [inputs[i:i + batch_size] for i in range(0, len(inputs), batch_size)]
+        print(f"[batch_size={batch_size}]")
+        fixed_time = report("fixed (max_length)", *run_fixed(engine, batches), len(inputs))
+        fixed_flops = sum(encoder_flops(MAX_SEQ_LENGTH, engine.model.backbone.config) for _ in inputs)
+        dyn_latencies, dyn_flops, dyn_tokens = run_dynamic(engine, batches)
+        dyn_time = report("dynamic + buckets", dyn_latencies, dyn_flops, dyn_tokens, len(inputs))
+        print(f" -> speedup x{fixed_time / dyn_time:.2f}, FLOPs saved {100 * (1 - dyn_flops / fixed_flops):.1f}%")
+        print("-" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Prediction Cache Benchmark
+reproduce/data/valid の対話をチャットと同じ手順で再生し、推論結果キャッシュの
+ヒット率とモデル推論時間を計測する。
+
+使い方:
+    python benchmarks/bench_prediction_cache.py --limit 500
+"""
+
+import argparse
+import os
+import time
+
+os.environ.setdefault("BATCHING", "false")
+
+from bench_utils import load_dialogues, split_turns
+
+from inference import MonotaROInference, CATEGORY_LIST
+from session_store import DialogueSession
+
+
+def replay(engine, rows):
+    """全ターンのモデル入力を推論し、経過時間を返す"""
+    start = time.perf_counter()
+    for row in rows:
+        session = DialogueSession("bench")
+        category = row.get("first_category", "")
+        session.current_category = CATEGORY_LIST.index(category) if category in CATEGORY_LIST else 0
+        for question, answer in split_turns(row.get("sent", "")):
+            session.append_history(f"Q: {question}")
+            engine._predict_model((engine._encode_dialogue(question, session), session.current_category))
+            session.append_history(f"A: {answer}")
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="推論結果キャッシュのベンチマーク")
+    parser.add_argument("--limit", type=int, default=500, help="使用する対話数")
+    args = parser.parse_args()
+
+    rows = load_dialogues("valid", limit=args.limit)
+    if not rows:
+        print("!!! reproduce/data/valid に対話データがありません。gen_monotaro_mock_data.py を先に実行してください。")
+        return
+
+    engine = MonotaROInference()
+    if engine.model is None:
+        print("!!! モデルがロードできないためベンチマークを実行できません。")
+        return
+
+    cache = engine.prediction_cache
+    max_entries = cache.max_entries
+    cache.max_entries = 0
+    uncached_time = replay(engine, rows)
+
+    cache.max_entries = max_entries
+    cache.invalidate()
+    cached_time = replay(engine, rows)
+    stats = cache.stats()
+
+    print("=" * 60)
+    print(" Prediction Cache Benchmark")
+    print("=" * 60)
+    print(f" Dialogues: {len(rows)} | Lookups: {stats['hits'] + stats['misses']} | Entries: {stats['entries']}")
+    print(f" Without cache    : {uncached_time * 1000:9.1f} ms")
+    print(f" With cache       : {cached_time * 1000:9.1f} ms")
+    print(f" Hit rate         : {stats['hit_rate'] * 100:.1f}%")
+    print(f" Speedup          : x{uncached_time / cached_time:.2f}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
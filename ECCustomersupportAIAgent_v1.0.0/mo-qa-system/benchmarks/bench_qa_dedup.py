@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - QA Deduplication Benchmark
+重複を含む従来の Q&A リスト (出現回数ぶん展開) と、generate_data.py が出力する
+重複除去済みリストで、_find_best_match_qa の検索時間と回答を比較する。
+
+使い方:
+    python benchmarks/bench_qa_dedup.py --limit 1000
+"""
+
+import argparse
+import time
+
+from bench_utils import load_dialogues
+from bench_retrieval import build_queries, legacy_best_match
+
+from inference import CATALOG, QA_MATCH_THRESHOLD
+from retrieval import QAIndex
+
+
+def expand(qa_list):
+    """出現回数ぶん展開した従来形式の Q&A リスト"""
+    return [{"q": qa["q"], "a": qa["a"]} for qa in qa_list for _ in range(qa.get("count", 1))]
+
+
+def run(queries, qa_lists):
+    """インデックス構築と、difflib 総当たり・インデックス検索の時間を計測"""
+    start = time.perf_counter()
+    indexes = {key: QAIndex(qa_list) for key, qa_list in qa_lists.items()}
+    build_time = time.perf_counter() - start
+
+    scan_time = 0.0
+    index_time = 0.0
+    answers = []
+    for category, product, question in queries:
+        start = time.perf_counter()
+        legacy_best_match(question, qa_lists[(category, product)])
+        scan_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        answers.append(indexes[(category, product)].best_answer(question, QA_MATCH_THRESHOLD))
+        index_time += time.perf_counter() - start
+    return build_time, scan_time, index_time, answers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Q&A 重複除去のベンチマーク")
+    parser.add_argument("--limit", type=int, default=1000, help="使用する対話数")
+    args = parser.parse_args()
+
+    if not len(CATALOG):
+        print("!!! product_data.json がありません。generate_data.py を先に実行してください。")
+        return
+
+    queries = build_queries(load_dialogues("valid", limit=args.limit))
+    if not queries:
+        print("!!! 検索クエリを作成できませんでした。")
+        return
+
+    deduped = {}
+    for category, product, _ in queries:
+        if (category, product) not in deduped:
+            deduped[(category, product)] = CATALOG.get(category, product)["qa"]
+    expanded = {key: expand(qa_list) for key, qa_list in deduped.items()}
+
+    before = run(queries, expanded)
+    after = run(queries, deduped)
+    same = sum(int(a == b) for a, b in zip(before[3], after[3]))
+
+    n = len(queries)
+    pairs_before = sum(len(v) for v in expanded.values())
+    pairs_after = sum(len(v) for v in deduped.values())
+    print("=" * 64)
+    print(" QA Deduplication Benchmark (_find_best_match_qa)")
+    print("=" * 64)
+    print(f" Queries: {n} | Products: {len(deduped)} | QA pairs: {pairs_before} -> {pairs_after}")
+    print(f" {'':<18}{'with duplicates':>18}{'deduplicated':>16}")
+    print(f" {'index build (ms)':<18}{before[0] * 1000:>18.1f}{after[0] * 1000:>16.1f}")
+    print(f" {'difflib (ms/q)':<18}{before[1] / n * 1000:>18.3f}{after[1] / n * 1000:>16.3f}")
+    print(f" {'index (ms/q)':<18}{before[2] / n * 1000:>18.3f}{after[2] / n * 1000:>16.3f}")
+    print(f" Same answer      : {same / n * 100:.1f}%")
+    print("=" * 64)
+
+
+if __name__ == "__main__":
+    main()
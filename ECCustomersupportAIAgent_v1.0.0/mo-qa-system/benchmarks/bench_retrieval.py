@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Retrieval Benchmark
+従来の difflib 総当たり検索と、n-gram TF-IDF インデックス検索の比較
+
+reproduce/data/valid の質問を、同じ商品の Q&A リストに対して検索する。
+
+使い方:
+    python benchmarks/bench_retrieval.py --limit 1000
+"""
+
+import argparse
+import time
+from difflib import SequenceMatcher
+
+from bench_utils import load_dialogues, split_turns
+
+import generate_data
+from inference import CATALOG, QA_MATCH_THRESHOLD
+from retrieval import QAIndex
+
+
+def legacy_best_match(query, qa_list, threshold=QA_MATCH_THRESHOLD):
+    """従来の _find_best_match_qa (全 QA ペアと SequenceMatcher で比較)"""
+    best_ratio = 0.0
+    best_answer = None
+    for qa in qa_list:
+        ratio = SequenceMatcher(None, query, qa["q"]).ratio()
+        if ratio > best_ratio:
+            best_ratio = ratio
+            best_answer = qa["a"]
+    if best_ratio > threshold:
+        return best_answer
+    return None
+
+
+def build_queries(rows):
+    """(カテゴリ, 商品, 質問) のリスト (カタログに存在する商品のみ)"""
+    queries = []
+    for row in rows:
+        category = row.get("first_category", "")
+        product = generate_data.extract_product_name(row.get("keywords", ""))
+        if (category, product) not in CATALOG:
+            continue
+        for question, _ in split_turns(row.get("sent", "")):
+            queries.append((category, product, question))
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Q&A 検索のベンチマーク")
+    parser.add_argument("--limit", type=int, default=1000, help="使用する対話数")
+    args = parser.parse_args()
+
+    if not len(CATALOG):
+        print("!!! product_data.json がありません。generate_data.py を先に実行してください。")
+        return
+
+    queries = build_queries(load_dialogues("valid", limit=args.limit))
+    if not queries:
+        print("!!! 検索クエリを作成できませんでした。")
+        return
+
+    qa_lists = {}
+    for category, product, _ in queries:
+        if (category, product) not in qa_lists:
+            qa_lists[(category, product)] = CATALOG.get(category, product)["qa"]
+
+    start = time.perf_counter()
+    indexes = {key: QAIndex(qa_list) for key, qa_list in qa_lists.items()}
+    build_time = time.perf_counter() - start
+
+    legacy_time = 0.0
+    index_time = 0.0
+    agree = 0
+    matched_legacy = 0
+    matched_index = 0
+    for category, product, question in queries:
+        qa_list = qa_lists[(category, product)]
+
+        start = time.perf_counter()
+        legacy = legacy_best_match(question, qa_list)
+        legacy_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        indexed = indexes[(category, product)].best_answer(question, QA_MATCH_THRESHOLD)
+        index_time += time.perf_counter() - start
+
+        agree += int(legacy == indexed)
+        matched_legacy += int(legacy is not None)
+        matched_index += int(indexed is not None)
+
+    n = len(queries)
+    qa_sizes = [len(qa_list) for qa_list in qa_lists.values()]
+    print("=" * 60)
+    print(" Retrieval Benchmark (difflib linear scan vs n-gram index)")
+    print("=" * 60)
+    print(f" Queries: {n} | Products: {len(indexes)} | QA pairs/product: mean={sum(qa_sizes) / len(qa_sizes):.1f}, max={max(qa_sizes)}")
+    print(f" Index build      : {build_time * 1000:9.1f} ms ({len(indexes)} products)")
+    print(f" difflib scan     : {legacy_time * 1000:9.1f} ms ({legacy_time / n * 1000:.3f} ms/query)")
+    print(f" n-gram index     : {index_time * 1000:9.1f} ms ({index_time / n * 1000:.3f} ms/query)")
+    print(f" Speedup          : x{legacy_time / index_time:.1f}")
+    print(f" Match rate       : difflib={matched_legacy / n * 100:.1f}%  index={matched_index / n * 100:.1f}%")
+    print(f" Same answer      : {agree / n * 100:.1f}%")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
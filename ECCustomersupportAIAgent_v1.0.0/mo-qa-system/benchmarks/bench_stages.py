@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Response Stage Benchmark
+reproduce/data/valid の対話を generate_response で再生し、応答の debug に含まれる
+段階ごとの時間 (answer / satisfaction / knowledge_graph / total) と partial の割合を集計する。
+
+満足度のモデル推論と知識グラフ推論は並行に実行されるため、total は各段階の合計
+(逐次実行した場合の見積もり) より短くなる。
+
+使い方:
+    python benchmarks/bench_stages.py --limit 200 --timeout-ms 2000
+"""
+
+import argparse
+
+from bench_utils import load_dialogues, percentile, split_turns
+
+import generate_data
+import inference
+from session_store import DialogueSession
+
+STAGES = ("answer", "satisfaction", "knowledge_graph", "total")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="応答の段階ごとの時間のベンチマーク")
+    parser.add_argument("--limit", type=int, default=200, help="使用する対話数")
+    parser.add_argument("--timeout-ms", type=float, default=None, help="STAGE_TIMEOUT_MS の上書き")
+    args = parser.parse_args()
+
+    if args.timeout_ms is not None:
+        inference.STAGE_TIMEOUT_MS = args.timeout_ms
+    engine = inference.MonotaROInference()
+
+    timings = {stage: [] for stage in STAGES}
+    sequential = []
+    partial = 0
+    timed_out = {}
+    responses = 0
+    for i, row in enumerate(load_dialogues("valid", limit=args.limit)):
+        session = DialogueSession(f"bench-{i}")
+        category = row.get("first_category", "")
+        if category in inference.CATEGORY_LIST:
+            engine.set_category(inference.CATEGORY_LIST.index(category), session)
+            product = generate_data.extract_product_name(row.get("keywords", ""))
+            if (category, product) in inference.CATALOG:
+                engine.set_product(product, session)
+        for question, _ in split_turns(row.get("sent", "")):
+            result = engine.generate_response(question, session)
+            debug = result["debug"]
+            for stage, value in debug["timings_ms"].items():
+                timings[stage].append(value)
+            sequential.append(sum(v for k, v in debug["timings_ms"].items() if k != "total"))
+            partial += int(result["partial"])
+            for stage in debug["timed_out"]:
+                timed_out[stage] = timed_out.get(stage, 0) + 1
+            responses += 1
+
+    if not responses:
+        print("!!! reproduce/data/valid の対話がありません。")
+        return
+
+    print("=" * 64)
+    print(f" Response Stage Benchmark ({responses} responses, timeout {inference.STAGE_TIMEOUT_MS:.0f} ms)")
+    print("=" * 64)
+    print(f" {'stage (ms)':<22}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for stage in STAGES:
+        samples = timings[stage]
+        if samples:
+            print(f" {stage:<22}{len(samples):>8}{percentile(samples, 50):>10.2f}"
+                  f"{percentile(samples, 95):>10.2f}{percentile(samples, 99):>10.2f}")
+    print(f" {'sum of stages':<22}{len(sequential):>8}{percentile(sequential, 50):>10.2f}"
+          f"{percentile(sequential, 95):>10.2f}{percentile(sequential, 99):>10.2f}")
+    print(f" Model-based: {engine.model_loaded} | Knowledge graph: {engine.kg_loaded}")
+    print(f" Partial responses: {partial} ({partial / responses * 100:.1f}%) {timed_out or ''}")
+    print("=" * 64)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Startup Benchmark
+app.py をサブプロセスで起動し、起動から最初のチャット応答までの時間と、
+モデルのロード完了 (/api/health の status が loading 以外になる) までの時間を計測する。
+
+BACKGROUND_LOADING=true (バックグラウンドロード) と false (起動時に同期ロード) を比較する。
+
+使い方:
+    python benchmarks/bench_startup.py --port 18080
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from bench_utils import QA_SYSTEM_DIR
+
+
+def request_json(url, payload=None, timeout=5.0):
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=timeout) as res:
+        return json.loads(res.read().decode("utf-8"))
+
+
+def measure(background: bool, port: int, timeout: float, extra_env: dict) -> dict:
+    env = dict(os.environ, PORT=str(port), DEBUG="false",
+               BACKGROUND_LOADING="true" if background else "false", **extra_env)
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "app.py"], cwd=QA_SYSTEM_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    result = {"background": background, "first_response_s": None, "ready_s": None,
+              "status": None, "warmup_chats": 0, "warmup_model_based": 0}
+    try:
+        # 最初のチャット応答 (サーバーが受け付けを開始するまで待つ)
+        while time.perf_counter() - start < timeout:
+            try:
+                chat = request_json(f"{base}/api/chat", {"message": "在庫はありますか？"})
+                result["first_response_s"] = round(time.perf_counter() - start, 3)
+                result["warmup_chats"] += 1
+                result["warmup_model_based"] += int(bool(chat.get("model_based")))
+                break
+            except (urllib.error.URLError, ConnectionError, OSError):
+                time.sleep(0.05)
+
+        # ロード完了まで、ウォームアップ中のチャットも送る
+        while time.perf_counter() - start < timeout:
+            health = request_json(f"{base}/api/health")
+            if health["status"] != "loading":
+                result["ready_s"] = round(time.perf_counter() - start, 3)
+                result["status"] = health["status"]
+                break
+            chat = request_json(f"{base}/api/chat", {"message": "いつ届きますか？"})
+            result["warmup_chats"] += 1
+            result["warmup_model_based"] += int(bool(chat.get("model_based")))
+            time.sleep(0.2)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="起動時間のベンチマーク")
+    parser.add_argument("--port", type=int, default=18080, help="計測用サーバーのポート")
+    parser.add_argument("--timeout", type=float, default=600.0, help="1 回の計測のタイムアウト (秒)")
+    args = parser.parse_args()
+
+    results = [measure(background, args.port, args.timeout, {}) for background in (False, True)]
+
+    print("=" * 72)
+    print(" Startup Benchmark (app.py)")
+    print("=" * 72)
+    print(f" {'loading':<12}{'first response s':>18}{'ready s':>10}{'status':>10}{'warm-up chats':>16}")
+    for r in results:
+        label = "background" if r["background"] else "blocking"
+        first = f"{r['first_response_s']:.2f}" if r["first_response_s"] is not None else "-"
+        ready = f"{r['ready_s']:.2f}" if r["ready_s"] is not None else "-"
+        warmup = f"{r['warmup_chats']} ({r['warmup_model_based']} model)"
+        print(f" {label:<12}{first:>18}{ready:>10}{str(r['status']):>10}{warmup:>16}")
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
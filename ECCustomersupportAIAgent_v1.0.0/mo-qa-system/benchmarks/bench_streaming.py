@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Streaming Chat Benchmark
+/api/chat (全段階の完了後に一括応答) と /api/chat/stream (SSE) で、
+回答が表示できるまでの時間を比較する。
+
+ストリームでは answer・satisfaction・insight・done の各イベントの到着時刻を記録する。
+Flask のテストクライアントで app.py をプロセス内で呼び出す (ネットワークは含まない)。
+
+使い方:
+    python benchmarks/bench_streaming.py --limit 200
+"""
+
+import argparse
+import os
+import time
+
+from bench_utils import percentile
+
+os.environ.setdefault("BACKGROUND_LOADING", "false")
+
+import app as app_module  # noqa: E402
+
+
+def summarize(samples):
+    if not samples:
+        return f"{'-':>8}{'-':>8}"
+    return f"{percentile(samples, 50):8.1f}{percentile(samples, 95):8.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSE ストリーミングのベンチマーク")
+    parser.add_argument("--limit", type=int, default=200, help="送信するメッセージ数")
+    args = parser.parse_args()
+
+    client = app_module.app.test_client()
+    client.post("/api/select_category", json={"category_id": 0})
+    products = client.get("/api/products/0").get_json()["products"]
+    if products:
+        client.post("/api/select_product", json={"product_name": products[0]})
+
+    # 推論結果キャッシュに当たらないよう、メッセージは毎回変える
+    base = ["在庫はありますか？", "いつ届きますか？", "サイズを教えてください", "返品できますか？",
+            "とても助かりました。ありがとうございます！", "商品が壊れていました。"]
+    messages = [f"{base[i % len(base)]} ({i})" for i in range(args.limit)]
+
+    blocking = []
+    for message in messages:
+        start = time.perf_counter()
+        client.post("/api/chat", json={"message": message})
+        blocking.append((time.perf_counter() - start) * 1000)
+
+    arrivals = {"answer": [], "satisfaction": [], "insight": [], "done": []}
+    for message in messages:
+        start = time.perf_counter()
+        res = client.post("/api/chat/stream", json={"message": message + " [stream]"}, buffered=False)
+        for chunk in res.response:
+            text = chunk.decode("utf-8") if isinstance(chunk, bytes) else chunk
+            elapsed = (time.perf_counter() - start) * 1000
+            for line in text.splitlines():
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                    if event in arrivals:
+                        arrivals[event].append(elapsed)
+        res.close()
+
+    print("=" * 60)
+    print(f" Streaming Chat Benchmark ({len(messages)} messages, ms)")
+    print("=" * 60)
+    print(f" {'':<28}{'p50':>8}{'p95':>8}")
+    print(f" {'/api/chat (response)':<28}{summarize(blocking)}")
+    for event, samples in arrivals.items():
+        label = f"/api/chat/stream {event}"
+        print(f" {label:<28}{summarize(samples)}   ({len(samples)} events)")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Tokenization Benchmark
+履歴ウィンドウを毎ターン再トークン化する方式と、セッションのトークンキャッシュを
+使う増分方式の比較
+
+使い方:
+    python benchmarks/bench_tokenization.py --limit 500
+"""
+
+import argparse
+import os
+import time
+
+os.environ.setdefault("BATCHING", "false")
+
+from bench_utils import load_dialogues, split_turns
+
+from inference import MonotaROInference, HISTORY_SEPARATOR, HISTORY_WINDOW, MAX_SEQ_LENGTH
+from session_store import DialogueSession
+
+
+def main():
+    parser = argparse.ArgumentParser(description="履歴トークン化のベンチマーク")
+    parser.add_argument("--limit", type=int, default=500, help="使用する対話数")
+    args = parser.parse_args()
+
+    rows = load_dialogues("valid", limit=args.limit)
+    if not rows:
+        print("!!! reproduce/data/valid に対話データがありません。gen_monotaro_mock_data.py を先に実行してください。")
+        return
+
+    engine = MonotaROInference()
+    if engine.tokenizer is None:
+        print("!!! トークナイザがロードできないためベンチマークを実行できません。")
+        return
+
+    full_time = 0.0
+    incremental_time = 0.0
+    turns_total = 0
+    exact = 0
+    length_diff = 0
+
+    for row in rows:
+        session = DialogueSession("bench")
+        for question, answer in split_turns(row["sent"]):
+            session.append_history(f"Q: {question}")
+
+            # 従来方式: 直近の履歴を連結して毎回トークン化
+            start = time.perf_counter()
+            full_text = HISTORY_SEPARATOR.join(session.dialogue_history[-HISTORY_WINDOW:] + [question])
+            full_ids = engine.tokenizer(full_text, max_length=MAX_SEQ_LENGTH, truncation=True)['input_ids']
+            full_time += time.perf_counter() - start
+
+            # 増分方式: キャッシュ済みのエントリは再トークン化しない
+            start = time.perf_counter()
+            incremental_ids = engine._encode_dialogue(question, session)
+            incremental_time += time.perf_counter() - start
+
+            turns_total += 1
+            exact += int(full_ids == incremental_ids)
+            length_diff += abs(len(full_ids) - len(incremental_ids))
+            session.append_history(f"A: {answer}")
+
+    print("=" * 60)
+    print(" Tokenization Benchmark (full re-tokenize vs incremental cache)")
+    print("=" * 60)
+    print(f" Dialogues: {len(rows)} | Turns: {turns_total}")
+    print(f" Full re-tokenize : {full_time * 1000:9.1f} ms ({full_time / turns_total * 1e6:7.1f} us/turn)")
+    print(f" Incremental cache: {incremental_time * 1000:9.1f} ms ({incremental_time / turns_total * 1e6:7.1f} us/turn)")
+    print(f" Speedup          : x{full_time / incremental_time:.2f}")
+    print(f" Identical inputs : {exact / turns_total * 100:.1f}% (mean length diff {length_diff / turns_total:.2f} tokens)")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Benchmark Utilities
+ベンチマークスクリプト共通のデータ読み込み・集計処理
+"""
+
+import csv
+import glob
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+QA_SYSTEM_DIR = os.path.dirname(BENCH_DIR)
+PROJECT_DIR = os.path.dirname(QA_SYSTEM_DIR)
+REPRODUCE_DIR = os.path.join(PROJECT_DIR, "reproduce")
+DATA_DIR = os.path.join(REPRODUCE_DIR, "data")
+
+for _path in (REPRODUCE_DIR, QA_SYSTEM_DIR):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+
+def load_dialogues(split="valid", limit=None):
+    """reproduce/data/<split>/data_turn の対話 CSV を読み込む"""
+    files = glob.glob(os.path.join(DATA_DIR, split, "data_turn", "dialogue_*.csv"))
+    # dialogue_1, dialogue_2, ... の順に並べる
+    files.sort(key=lambda p: int(os.path.basename(p)[len("dialogue_"):-len(".csv")]))
+
+    rows = []
+    for path in files:
+        with open(path, "r", encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                rows.append(row)
+                if limit is not None and len(rows) >= limit:
+                    return rows
+    return rows
+
+
+def split_turns(sent):
+    """'Q:xxx|||A:yyy|||...' を [(質問, 回答), ...] に分解"""
+    turns = []
+    question = None
+    for seg in sent.split("|||"):
+        seg = seg.strip()
+        if seg.startswith("Q:"):
+            if question is not None:
+                turns.append((question, ""))
+            question = seg[2:].strip()
+        elif seg.startswith("A:"):
+            if question is not None:
+                turns.append((question, seg[2:].strip()))
+                question = None
+        elif seg:
+            # Q:/A: が付かない導入・締めの発話はユーザー発話として扱う
+            if question is not None:
+                turns.append((question, ""))
+            question = seg
+    if question is not None:
+        turns.append((question, ""))
+    return turns
+
+
+def build_chat_inputs(rows, category_list, history_window=5):
+    """チャット時と同じ形式のモデル入力 (テキスト, トピックID) を作る"""
+    inputs = []
+    for row in rows:
+        category = row.get("first_category", "")
+        topic = category_list.index(category) if category in category_list else 0
+        history = []
+        for question, answer in split_turns(row.get("sent", "")):
+            history.append(f"Q: {question}")
+            inputs.append((" ||| ".join(history[-history_window:] + [question]), topic))
+            history.append(f"A: {answer}")
+    return inputs
+
+
+def percentile(values, p):
+    """p パーセンタイル (0-100)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def summarize_ms(latencies):
+    """秒単位のレイテンシ列をミリ秒の要約に変換"""
+    ms = [v * 1000.0 for v in latencies]
+    return {
+        "count": len(ms),
+        "mean_ms": round(sum(ms) / len(ms), 3) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+    }
+
+
+def sat_to_3class(sat):
+    """満足度 (1-5) を 3 クラス (0: 不満, 1: 普通, 2: 満足) に変換 (学習時と同じ)"""
+    if sat <= 2:
+        return 0
+    elif sat <= 4:
+        return 1
+    return 2
+
+
+def build_eval_samples(rows, tokenizer, max_length=256):
+    """学習時 (run_full_pipeline.py) と同じ形式の評価データ [(トークンID列, トピックID, ラベル)]
+
+    対話の全ターンを連結し、学習時のカテゴリ順でトピックIDを付ける。
+    """
+    from monotaro_categories import CATEGORY_LIST as TRAIN_CATEGORY_LIST
+
+    samples = []
+    for row in rows:
+        turns = [t.strip() for t in row.get("sent", "").split("|||") if t.strip()]
+        ids = tokenizer.encode(" ".join(turns), max_length=max_length, truncation=True)
+        category = row.get("first_category", "")
+        topic = TRAIN_CATEGORY_LIST.index(category) if category in TRAIN_CATEGORY_LIST else 0
+        samples.append((ids, topic, sat_to_3class(int(row.get("sat", 3)))))
+    return samples
+
+
+def classification_metrics(labels, preds, num_classes=3):
+    """正解率とマクロ F1"""
+    correct = sum(int(y == p) for y, p in zip(labels, preds))
+    f1_scores = []
+    for c in range(num_classes):
+        tp = sum(int(y == c and p == c) for y, p in zip(labels, preds))
+        fp = sum(int(y != c and p == c) for y, p in zip(labels, preds))
+        fn = sum(int(y == c and p != c) for y, p in zip(labels, preds))
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        f1_scores.append(2 * precision * recall / (precision + recall) if precision + recall else 0.0)
+    return {
+        "accuracy": round(correct / len(labels), 4) if labels else 0.0,
+        "macro_f1": round(sum(f1_scores) / num_classes, 4),
+    }
+
+
+def evaluate_engine(engine, samples, batch_size=32, latency_samples=200):
+    """推論エンジンの満足度モデルを評価データで評価する
+
+    精度はバッチ推論、レイテンシは 1 件ずつの推論 (チャット 1 ターン相当) で計測する。
+
+    Returns:
+        {"accuracy", "macro_f1", "latency": summarize_ms(...), "predictions": [...]}
+    """
+    import time
+
+    predictions = []
+    for i in range(0, len(samples), batch_size):
+        batch = samples[i:i + batch_size]
+        results = engine._forward_token_batch([ids for ids, _, _ in batch], [topic for _, topic, _ in batch])
+        predictions.extend(pred for pred, _ in results)
+
+    latencies = []
+    for ids, topic, _ in samples[:latency_samples]:
+        start = time.perf_counter()
+        engine._forward_token_batch([ids], [topic])
+        latencies.append(time.perf_counter() - start)
+
+    metrics = classification_metrics([label for _, _, label in samples], predictions)
+    return {**metrics, "latency": summarize_ms(latencies), "predictions": predictions}
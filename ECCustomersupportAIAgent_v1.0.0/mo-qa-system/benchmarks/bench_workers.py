@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Multi-worker Benchmark
+app.py を WORKERS=1, 2, 4, 8 で起動し、同時接続クライアントからのチャットのスループットと、
+マスター + ワーカー全体のメモリ (RSS の合計と PSS の合計) を計測する。
+
+RSS の合計は共有ページをワーカー数ぶん重複して数えるため、実際のメモリ使用量は
+PSS (共有ページをプロセス数で按分) の合計で比較する。
+
+使い方:
+    python benchmarks/bench_workers.py --workers 1 2 4 8 --clients 16 --duration 20
+"""
+
+import argparse
+import http.cookiejar
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from bench_utils import QA_SYSTEM_DIR, percentile
+
+MESSAGES = ["在庫はありますか？", "いつ届きますか？", "サイズを教えてください", "ありがとうございます"]
+
+
+def request_json(opener, url, payload=None, timeout=30.0):
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    with opener.open(req, timeout=timeout) as res:
+        return json.loads(res.read().decode("utf-8"))
+
+
+def memory_mb(pid: int) -> dict:
+    """プロセスとその子プロセスの RSS・PSS の合計 (MB)"""
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids += [int(p) for p in f.read().split()]
+    except OSError:
+        pass
+    totals = {"processes": len(pids), "rss_mb": 0.0, "pss_mb": 0.0}
+    for p in pids:
+        try:
+            with open(f"/proc/{p}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Rss:"):
+                        totals["rss_mb"] += int(line.split()[1]) / 1024
+                    elif line.startswith("Pss:"):
+                        totals["pss_mb"] += int(line.split()[1]) / 1024
+        except OSError:
+            pass
+    return {k: round(v, 1) if isinstance(v, float) else v for k, v in totals.items()}
+
+
+def client(base, category_id, deadline, latencies, errors, lock):
+    """1 クライアント: 商品を選択してからチャットを繰り返す"""
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    try:
+        request_json(opener, f"{base}/api/select_category", {"category_id": category_id})
+        products = request_json(opener, f"{base}/api/products/{category_id}")["products"]
+        if products:
+            request_json(opener, f"{base}/api/select_product", {"product_name": products[0]})
+    except (urllib.error.URLError, OSError, ValueError):
+        with lock:
+            errors[0] += 1
+        return
+    i = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            request_json(opener, f"{base}/api/chat", {"message": MESSAGES[i % len(MESSAGES)]})
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+        except (urllib.error.URLError, OSError, ValueError):
+            with lock:
+                errors[0] += 1
+        i += 1
+
+
+def measure(workers: int, args) -> dict:
+    env = dict(os.environ, PORT=str(args.port), DEBUG="false", WORKERS=str(workers))
+    base = f"http://127.0.0.1:{args.port}"
+    opener = urllib.request.build_opener()
+    proc = subprocess.Popen([sys.executable, "app.py"], cwd=QA_SYSTEM_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        start = time.perf_counter()
+        status = None
+        while time.perf_counter() - start < args.timeout:
+            try:
+                status = request_json(opener, f"{base}/api/health", timeout=5.0)["status"]
+                if status != "loading":
+                    break
+            except (urllib.error.URLError, OSError):
+                pass
+            time.sleep(0.2)
+        if status is None or status == "loading":
+            return {"workers": workers, "error": "server did not become ready"}
+        memory_idle = memory_mb(proc.pid)
+
+        latencies, errors, lock = [], [0], threading.Lock()
+        deadline = time.perf_counter() + args.duration
+        threads = [threading.Thread(target=client, args=(base, i % 24, deadline, latencies, errors, lock))
+                   for i in range(args.clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        memory_loaded = memory_mb(proc.pid)
+        return {
+            "workers": workers,
+            "status": status,
+            "chats": len(latencies),
+            "errors": errors[0],
+            "throughput": round(len(latencies) / args.duration, 1),
+            "p50_ms": round(percentile(latencies, 50), 1) if latencies else None,
+            "p99_ms": round(percentile(latencies, 99), 1) if latencies else None,
+            "idle": memory_idle,
+            "loaded": memory_loaded,
+        }
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="マルチワーカー起動のベンチマーク")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="計測するワーカー数")
+    parser.add_argument("--clients", type=int, default=16, help="同時接続クライアント数")
+    parser.add_argument("--duration", type=float, default=20.0, help="1 構成あたりの負荷時間 (秒)")
+    parser.add_argument("--port", type=int, default=18090, help="計測用サーバーのポート")
+    parser.add_argument("--timeout", type=float, default=600.0, help="起動待ちのタイムアウト (秒)")
+    args = parser.parse_args()
+
+    results = [measure(workers, args) for workers in args.workers]
+
+    print("=" * 88)
+    print(f" Multi-worker Benchmark ({args.clients} clients, {args.duration:.0f}s each, {os.cpu_count()} CPUs)")
+    print("=" * 88)
+    print(f" {'workers':>7}{'chats/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}"
+          f"{'procs':>7}{'RSS sum MB':>12}{'PSS sum MB':>12}{'PSS idle MB':>13}")
+    for r in results:
+        if "error" in r:
+            print(f" {r['workers']:>7}  {r['error']}")
+            continue
+        p50 = f"{r['p50_ms']:.1f}" if r["p50_ms"] is not None else "-"
+        p99 = f"{r['p99_ms']:.1f}" if r["p99_ms"] is not None else "-"
+        print(f" {r['workers']:>7}{r['throughput']:>10.1f}{p50:>9}{p99:>9}{r['errors']:>8}"
+              f"{r['loaded']['processes']:>7}{r['loaded']['rss_mb']:>12.1f}{r['loaded']['pss_mb']:>12.1f}"
+              f"{r['idle']['pss_mb']:>13.1f}")
+    print(" RSS sum: 共有ページを重複して数えた値 / PSS sum: 共有ページを按分した実使用量")
+    print("=" * 88)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Import Budget Check
+新しいプロセスで `import inference` の時間と RSS を計測し、予算内であること、
+torch / transformers が import されていないことを確認する。
+ルールのみのモード (rules_only=True) のエンジンで応答を生成した後も、
+torch / transformers が import されていないことを確認する。
+
+予算を超えた・重い依存が import された場合は終了コード 1 を返す。
+
+使い方:
+    python benchmarks/check_import_budget.py --max-seconds 1.5 --max-rss-mb 120
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+from bench_utils import QA_SYSTEM_DIR
+
+HEAVY_MODULES = ("torch", "transformers")
+
+# 子プロセスで実行するコード (インタプリタ起動後の import だけを計測する)
+PROBE = r"""
+import json, sys, time
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+rss_before = rss_mb()
+start = time.perf_counter()
+import inference
+import_s = time.perf_counter() - start
+result = {
+    "import_s": import_s,
+    "rss_mb": rss_mb(),
+    "rss_delta_mb": rss_mb() - rss_before,
+    "heavy_after_import": [m for m in %(heavy)r if m in sys.modules],
+}
+
+start = time.perf_counter()
+engine = inference.MonotaROInference(rules_only=True)
+engine.set_category(0)
+products = engine.get_products(0)
+if products:
+    engine.set_product(products[0])
+response = engine.generate_response("在庫はありますか？")
+result.update({
+    "rules_only_s": time.perf_counter() - start,
+    "rules_only_status": engine.status,
+    "rules_only_model_based": bool(response.get("model_based")),
+    "heavy_after_rules_only": [m for m in %(heavy)r if m in sys.modules],
+})
+print(json.dumps(result))
+"""
+
+
+def run_probe() -> dict:
+    out = subprocess.run([sys.executable, "-c", PROBE % {"heavy": HEAVY_MODULES}],
+                         cwd=QA_SYSTEM_DIR, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="import inference の時間・RSS の予算チェック")
+    parser.add_argument("--max-seconds", type=float, default=1.5, help="import inference の時間の上限 (秒)")
+    parser.add_argument("--max-rss-mb", type=float, default=120.0, help="import 後の RSS の上限 (MB)")
+    parser.add_argument("--runs", type=int, default=3, help="計測回数 (最小値で判定)")
+    args = parser.parse_args()
+
+    results = [run_probe() for _ in range(args.runs)]
+    import_s = min(r["import_s"] for r in results)
+    rss = min(r["rss_mb"] for r in results)
+    last = results[-1]
+
+    failures = []
+    if import_s > args.max_seconds:
+        failures.append(f"import time {import_s:.2f}s > {args.max_seconds:.2f}s")
+    if rss > args.max_rss_mb:
+        failures.append(f"RSS {rss:.1f} MB > {args.max_rss_mb:.1f} MB")
+    if last["heavy_after_import"]:
+        failures.append(f"imported by `import inference`: {', '.join(last['heavy_after_import'])}")
+    if last["heavy_after_rules_only"]:
+        failures.append(f"imported in rules-only mode: {', '.join(last['heavy_after_rules_only'])}")
+
+    print("=" * 64)
+    print(" Import Budget Check (import inference)")
+    print("=" * 64)
+    print(f" import time      : {import_s:.3f} s   (budget {args.max_seconds:.2f} s, best of {args.runs})")
+    print(f" RSS after import : {rss:.1f} MB (+{last['rss_delta_mb']:.1f} MB, budget {args.max_rss_mb:.0f} MB)")
+    print(f" heavy modules    : {last['heavy_after_import'] or 'none'}")
+    print(f" rules-only engine: {last['rules_only_s'] * 1000:.1f} ms to first response, "
+          f"status={last['rules_only_status']}, model_based={last['rules_only_model_based']}, "
+          f"heavy modules={last['heavy_after_rules_only'] or 'none'}")
+    print("=" * 64)
+    if failures:
+        for failure in failures:
+            print(f"!!! {failure}")
+        sys.exit(1)
+    print(" OK")
+
+
+if __name__ == "__main__":
+    main()
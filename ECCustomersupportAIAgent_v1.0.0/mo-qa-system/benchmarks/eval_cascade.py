@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Satisfaction Cascade Evaluation
+reproduce/data/valid の対話で、常にトランスフォーマー (HighAccuracyClassifierV2) を使う場合と、
+文字 n-gram の線形モデルを前段に置くカスケードを、信頼度の閾値ごとに比較する。
+
+正解率・マクロ F1・トランスフォーマーに回した割合 (escalation rate)・スループット (dialogues/s) を
+score_dialogues (/api/score_batch と同じ経路) で計測する。
+
+チャット (CASCADE_CHAT) では 1 段目の入力が直近の履歴だけになる (学習データにも同じ形式の入力を含む)。
+対話をターンごとに再生し、ルールで決まらないターンについて、1 段目で確定した予測が
+トランスフォーマーの予測と一致する割合 (agreement) も閾値ごとに表示する (ターン単位の正解ラベルはない)。
+
+使い方:
+    python train_ngram_classifier.py
+    python benchmarks/eval_cascade.py --thresholds 0.6 0.7 0.8 0.9 --batch-size 1
+"""
+
+import argparse
+import json
+import os
+import time
+
+from bench_utils import classification_metrics, load_dialogues, sat_to_3class
+
+import inference
+from session_store import DialogueSession
+
+
+def run(engine, items, batch_size, cascade, threshold=None):
+    """score_dialogues で全件を予測し、(予測, 経過秒)"""
+    engine.cascade = cascade
+    if threshold is not None:
+        engine.cascade_threshold = threshold
+    predictions = []
+    start = time.perf_counter()
+    for i in range(0, len(items), batch_size):
+        predictions.extend(r["satisfaction"] for r in engine.score_dialogues(items[i:i + batch_size]))
+    return predictions, time.perf_counter() - start
+
+
+def replay_chat_turns(engine, cascade, items):
+    """対話をチャットとして再生し、モデルを使うターンごとに (1 段目の予測, 信頼度, トランスフォーマーの予測)"""
+    engine.cascade_chat = False
+    turns = []
+    for dialogue, category in items:
+        session = DialogueSession("eval-cascade")
+        if category in inference.CATEGORY_LIST:
+            session.current_category = inference.CATEGORY_LIST.index(category)
+        for turn in dialogue.split("|||"):
+            turn = turn.strip()
+            if turn.startswith("A:"):
+                session.append_history(f"A: {turn[2:].strip()}")
+                continue
+            message = turn[2:].strip() if turn.startswith("Q:") else turn
+            if not message:
+                continue
+            session.append_history(f"Q: {message}")
+            matches = inference.RULE_MATCHER.match(message)
+            if engine._check_obvious_sentiment(message, matches) is not None:
+                continue  # ルールで確定するターンはカスケードを通らない
+            prediction, confidence = cascade.predict(
+                inference.chat_window_text(session.dialogue_history, message), category)
+            turns.append((engine._finalize_model_prediction(message, prediction, confidence, matches), confidence,
+                          engine.predict_satisfaction(message, session, matches)))
+    engine.cascade_chat = inference.CASCADE_CHAT
+    return turns
+
+
+def main():
+    parser = argparse.ArgumentParser(description="満足度カスケードの評価")
+    parser.add_argument("--limit", type=int, default=None, help="使用する対話数 (既定: 全件)")
+    parser.add_argument("--batch-size", type=int, default=1, help="score_dialogues に渡す件数 (1: チャット相当)")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.6, 0.7, 0.8, 0.9, 0.95],
+                        help="比較する信頼度の閾値")
+    parser.add_argument("--chat-dialogues", type=int, default=100,
+                        help="チャットとして再生する対話数 (0: チャットの評価をしない)")
+    parser.add_argument("--output", help="結果を JSON で保存するパス")
+    args = parser.parse_args()
+
+    rows = [row for row in load_dialogues("valid", limit=args.limit) if (row.get("sat") or "").strip().isdigit()]
+    if not rows:
+        print("!!! reproduce/data/valid に対話データがありません。gen_monotaro_mock_data.py を先に実行してください。")
+        return
+    items = [(row.get("sent", ""), row.get("first_category", "")) for row in rows]
+    labels = [sat_to_3class(int(row["sat"])) for row in rows]
+
+    engine = inference.MonotaROInference()
+    if engine.model is None:
+        print("!!! モデルがロードできないため評価を実行できません。")
+        return
+    cascade = engine.cascade
+    if cascade is None:
+        print(f"!!! {inference.CASCADE_MODEL_PATH} がありません。train_ngram_classifier.py を先に実行してください。")
+        return
+
+    # 1 段目の信頼度 (METRICS=false でも escalation rate を出せるよう、カウンターではなくここで数える)
+    confidences = [cascade.predict(inference.dialogue_text(dialogue), category)[1] for dialogue, category in items]
+
+    def entry(predictions, elapsed, escalation_rate):
+        return {**classification_metrics(labels, predictions), "escalation_rate": round(escalation_rate, 4),
+                "dialogues_per_s": round(len(items) / elapsed, 1)}
+
+    engine.score_dialogues(items[:8])  # ウォームアップ
+    results = {
+        "transformer_only": entry(*run(engine, items, args.batch_size, None), 1.0),
+        # 閾値 0: 全件を 1 段目で確定
+        "ngram_only": entry(*run(engine, items, args.batch_size, cascade, 0.0), 0.0),
+    }
+    for threshold in args.thresholds:
+        escalated = sum(conf < threshold for conf in confidences)
+        results[f"cascade@{threshold}"] = entry(*run(engine, items, args.batch_size, cascade, threshold),
+                                                escalated / len(items))
+    engine.cascade, engine.cascade_threshold = cascade, inference.CASCADE_THRESHOLD
+
+    base = results["transformer_only"]
+    print("=" * 78)
+    print(f" Satisfaction Cascade Evaluation ({len(items)} dialogues, batch size {args.batch_size})")
+    print("=" * 78)
+    print(f" {'mode':<22}{'accuracy':>10}{'macro F1':>10}{'escalated':>11}{'dialogues/s':>13}{'speedup':>10}")
+    for mode, r in results.items():
+        print(f" {mode:<22}{r['accuracy'] * 100:>9.2f}%{r['macro_f1'] * 100:>9.2f}%"
+              f"{r['escalation_rate'] * 100:>10.1f}%{r['dialogues_per_s']:>13.1f}"
+              f"{r['dialogues_per_s'] / base['dialogues_per_s']:>9.2f}x")
+    print(f" Configured threshold: CASCADE_THRESHOLD={inference.CASCADE_THRESHOLD}")
+    print("=" * 78)
+
+    chat = {}
+    turns = replay_chat_turns(engine, cascade, items[:args.chat_dialogues]) if args.chat_dialogues else []
+    if turns:
+        print(f" Chat turns ({min(args.chat_dialogues, len(items))} dialogues, {len(turns)} model turns): "
+              f"agreement with the transformer")
+        print(f" {'threshold':<22}{'accepted':>10}{'agree (acc.)':>14}{'agree (all)':>13}")
+        for threshold in args.thresholds:
+            accepted = [(first, final) for first, conf, final in turns if conf >= threshold]
+            agree = sum(int(first == final) for first, final in accepted)
+            chat[f"cascade@{threshold}"] = {
+                "accepted_rate": round(len(accepted) / len(turns), 4),
+                "agreement_accepted": round(agree / len(accepted), 4) if accepted else None,
+                # 閾値未満のターンはトランスフォーマーで推論するため一致する
+                "agreement_all": round((agree + len(turns) - len(accepted)) / len(turns), 4),
+            }
+            r = chat[f"cascade@{threshold}"]
+            agreement_accepted = f"{r['agreement_accepted'] * 100:.2f}%" if accepted else "-"
+            print(f" {'cascade@' + str(threshold):<22}{r['accepted_rate'] * 100:>9.1f}%{agreement_accepted:>14}"
+                  f"{r['agreement_all'] * 100:>12.2f}%")
+        print(f" Chat path enabled: CASCADE_CHAT={inference.CASCADE_CHAT}")
+        print("=" * 78)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"dialogues": len(items), "batch_size": args.batch_size, "results": results,
+                       "chat_turns": len(turns), "chat": chat}, f, ensure_ascii=False, indent=2)
+        print(f"Saved: {os.path.abspath(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Quantization Evaluation
+fp32 と動的 int8 量子化モデルの、reproduce/data/valid での正解率・マクロ F1 と
+1 件あたりのレイテンシ (p50/p99) を比較する。
+
+使い方:
+    python benchmarks/eval_quantization.py --latency-samples 200 --output quantization.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import time
+
+os.environ.setdefault("BATCHING", "false")
+os.environ.setdefault("PREDICTION_CACHE_SIZE", "0")
+
+from bench_utils import load_dialogues, build_eval_samples, evaluate_engine
+
+from inference import MonotaROInference
+
+
+def main():
+    parser = argparse.ArgumentParser(description="int8 量子化の評価")
+    parser.add_argument("--limit", type=int, default=None, help="使用する対話数 (既定: 全件)")
+    parser.add_argument("--batch-size", type=int, default=32, help="精度評価のバッチサイズ")
+    parser.add_argument("--latency-samples", type=int, default=200, help="レイテンシ計測の件数")
+    parser.add_argument("--output", help="結果を JSON で保存するパス")
+    args = parser.parse_args()
+
+    rows = load_dialogues("valid", limit=args.limit)
+    if not rows:
+        print("!!! reproduce/data/valid に対話データがありません。gen_monotaro_mock_data.py を先に実行してください。")
+        return
+
+    results = {}
+    predictions = {}
+    samples = None
+    for mode in ("none", "int8"):
+        start = time.time()
+        engine = MonotaROInference(quantization=mode)
+        load_time = time.time() - start
+        if engine.model is None:
+            print("!!! モデルがロードできないため評価を実行できません。")
+            return
+        if samples is None:
+            samples = build_eval_samples(rows, engine.tokenizer)
+
+        result = evaluate_engine(engine, samples, args.batch_size, args.latency_samples)
+        predictions[mode] = result.pop("predictions")
+        results[mode] = {
+            **result,
+            "load_time_s": round(load_time, 2),
+            "quantized_from_cache": engine.quantized_from_cache,
+        }
+        del engine
+        gc.collect()
+
+    agreement = sum(int(a == b) for a, b in zip(predictions["none"], predictions["int8"])) / len(samples)
+
+    print("=" * 72)
+    print(f" Quantization Evaluation (reproduce/data/valid, {len(samples)} dialogues)")
+    print("=" * 72)
+    print(f" {'mode':<8}{'accuracy':>10}{'macro F1':>10}{'p50 ms':>10}{'p99 ms':>10}{'load s':>10}")
+    for mode, label in (("none", "fp32"), ("int8", "int8")):
+        r = results[mode]
+        print(f" {label:<8}{r['accuracy']:>10.4f}{r['macro_f1']:>10.4f}{r['latency']['p50_ms']:>10.2f}"
+              f"{r['latency']['p99_ms']:>10.2f}{r['load_time_s']:>10.1f}")
+    print(f" Prediction agreement (int8 vs fp32): {agreement * 100:.1f}%")
+    print(f" p50 speedup: x{results['none']['latency']['p50_ms'] / max(results['int8']['latency']['p50_ms'], 1e-9):.2f}")
+    print("=" * 72)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"fp32": results["none"], "int8": results["int8"], "agreement": round(agreement, 4)},
+                      f, ensure_ascii=False, indent=2)
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Load Test
+reproduce/gen_monotaro_mock_data.py が生成した対話 (reproduce/data/<split>/data_turn) を
+シナリオとして再生し、同時接続の仮想ユーザーで Q&A API に負荷をかける。
+
+1 対話 = 1 セッション: /api/select_category → /api/select_product → ターンごとに /api/chat。
+仮想ユーザーはシナリオを順に取り出して実行し、エンドポイントごとのスループット・
+p50/p95/p99 レイテンシ・エラー率を表示して、結果を JSON に保存する (--baseline で前回の結果と比較)。
+
+--url を指定しない場合は app.py をローカルに起動し (--workers でプリフォーク)、終了時に停止する。
+
+使い方:
+    python benchmarks/load_test.py --users 16 --dialogues 200
+    python benchmarks/load_test.py --users 32 --duration 60 --workers 4 --output run2.json --baseline run1.json
+    python benchmarks/load_test.py --url http://127.0.0.1:8080 --users 8
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+from bench_utils import QA_SYSTEM_DIR, load_dialogues, percentile, split_turns
+
+import generate_data
+
+SESSION_HEADER = "X-Session-ID"
+ENDPOINTS = ("/api/select_category", "/api/select_product", "/api/chat")
+
+
+def call(base, path, payload=None, session_id=None, timeout=30.0):
+    """1 リクエスト: (HTTP ステータス, JSON, セッション ID)。通信エラーは例外"""
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    headers = {"Content-Type": "application/json"}
+    if session_id:
+        headers[SESSION_HEADER] = session_id
+    req = urllib.request.Request(base + path, data=data, headers=headers)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as res:
+            return res.status, json.loads(res.read().decode("utf-8")), res.headers.get(SESSION_HEADER)
+    except urllib.error.HTTPError as e:
+        return e.code, None, e.headers.get(SESSION_HEADER)
+
+
+def build_scenarios(base, split, limit):
+    """対話 CSV をシナリオ [(カテゴリ ID, 商品名, [質問, ...])] にする (サーバーにない商品の対話は除く)"""
+    _, categories, _ = call(base, "/api/categories")
+    category_ids = {c["name"]: c["id"] for c in categories["categories"]}
+    products = {}
+    scenarios = []
+    skipped = 0
+    for row in load_dialogues(split, limit=limit):
+        category_id = category_ids.get(row.get("first_category", ""))
+        product = generate_data.extract_product_name(row.get("keywords", ""))
+        questions = [q for q, _ in split_turns(row.get("sent", ""))]
+        if category_id is not None and category_id not in products:
+            products[category_id] = set(call(base, f"/api/products/{category_id}")[1]["products"])
+        if category_id is None or product not in products[category_id] or not questions:
+            skipped += 1
+            continue
+        scenarios.append((category_id, product, questions))
+    return scenarios, skipped
+
+
+class LoadStats:
+    """エンドポイントごとのレイテンシとエラー (スレッド間で共有)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {path: [] for path in ENDPOINTS}
+        self.errors = {path: {} for path in ENDPOINTS}
+        self.sessions = 0
+
+    def record(self, path, elapsed_ms, error=None):
+        with self.lock:
+            self.latencies[path].append(elapsed_ms)
+            if error is not None:
+                self.errors[path][error] = self.errors[path].get(error, 0) + 1
+
+    def summary(self, elapsed_s):
+        endpoints = {}
+        for path in ENDPOINTS:
+            samples = self.latencies[path]
+            errors = sum(self.errors[path].values())
+            endpoints[path] = {
+                "requests": len(samples),
+                "throughput_rps": round(len(samples) / elapsed_s, 2),
+                "errors": errors,
+                "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+                "error_reasons": self.errors[path],
+                "p50_ms": round(percentile(samples, 50), 2) if samples else None,
+                "p95_ms": round(percentile(samples, 95), 2) if samples else None,
+                "p99_ms": round(percentile(samples, 99), 2) if samples else None,
+                "mean_ms": round(sum(samples) / len(samples), 2) if samples else None,
+                "max_ms": round(max(samples), 2) if samples else None,
+            }
+        return endpoints
+
+
+def run_session(base, scenario, stats, think_time, timeout):
+    """1 セッション分のシナリオを実行"""
+    category_id, product, questions = scenario
+    session_id = None
+    steps = [("/api/select_category", {"category_id": category_id}),
+             ("/api/select_product", {"product_name": product})]
+    steps += [("/api/chat", {"message": question}) for question in questions]
+    for path, payload in steps:
+        start = time.perf_counter()
+        error = None
+        try:
+            status, body, returned_id = call(base, path, payload, session_id, timeout)
+            session_id = session_id or returned_id
+            if status >= 400:
+                error = f"http_{status}"
+            elif path != "/api/chat" and not (body or {}).get("success", False):
+                error = "rejected"
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            error = type(e).__name__
+        stats.record(path, (time.perf_counter() - start) * 1000, error)
+        if error is not None and path != "/api/chat":
+            # 選択に失敗したセッションは続けない
+            return
+        if think_time > 0:
+            time.sleep(think_time)
+    with stats.lock:
+        stats.sessions += 1
+
+
+def virtual_user(base, scenarios, cursor, stats, args, deadline):
+    """仮想ユーザー: 期限 (または全シナリオの実行) までシナリオを順に取り出して実行"""
+    while True:
+        with cursor["lock"]:
+            index = cursor["next"]
+            cursor["next"] += 1
+        if deadline is None and index >= len(scenarios):
+            return
+        if deadline is not None and time.perf_counter() >= deadline:
+            return
+        run_session(base, scenarios[index % len(scenarios)], stats, args.think_time_ms / 1000, args.request_timeout)
+
+
+def start_server(args):
+    """app.py をローカルに起動し、ロードが終わるまで待つ"""
+    env = dict(os.environ, PORT=str(args.port), DEBUG="false", WORKERS=str(args.workers))
+    base = f"http://127.0.0.1:{args.port}"
+    proc = subprocess.Popen([sys.executable, "app.py"], cwd=QA_SYSTEM_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    start = time.perf_counter()
+    while time.perf_counter() - start < args.startup_timeout:
+        if proc.poll() is not None:
+            break
+        try:
+            _, health, _ = call(base, "/api/health", timeout=5.0)
+            if health["status"] != "loading":
+                return proc, base
+        except (urllib.error.URLError, OSError, ValueError):
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    proc.wait(timeout=30)
+    print("!!! app.py の起動を確認できませんでした")
+    sys.exit(1)
+
+
+def print_comparison(result, baseline_path):
+    """前回の結果 (JSON) とのレイテンシ・スループットの比較"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f" vs {baseline_path} ({baseline.get('started_at')})")
+    print(f" {'endpoint':<22}{'rps':>18}{'p50 ms':>18}{'p95 ms':>18}{'p99 ms':>18}")
+    for path in ENDPOINTS:
+        now, before = result["endpoints"][path], baseline.get("endpoints", {}).get(path)
+        if not before:
+            continue
+        cells = []
+        for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            if now[key] is None or before[key] is None:
+                cells.append(f"{'-':>18}")
+            else:
+                cells.append(f"{before[key]:.1f} -> {now[key]:.1f}".rjust(18))
+        print(f" {path:<22}" + "".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成した対話を再生する Q&A API の負荷試験")
+    parser.add_argument("--url", default=None, help="対象サーバー (省略時は app.py をローカルに起動)")
+    parser.add_argument("--users", type=int, default=8, help="同時接続の仮想ユーザー数")
+    parser.add_argument("--dialogues", type=int, default=200, help="シナリオにする対話数")
+    parser.add_argument("--split", default="valid", help="対話を読み込む reproduce/data のスプリット")
+    parser.add_argument("--duration", type=float, default=None,
+                        help="負荷をかける時間 (秒、指定時はシナリオを繰り返す。省略時は各シナリオを 1 回)")
+    parser.add_argument("--think-time-ms", type=float, default=0.0, help="リクエスト間の待ち時間 (ms)")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="全仮想ユーザーが揃うまでの時間 (秒)")
+    parser.add_argument("--request-timeout", type=float, default=30.0, help="1 リクエストのタイムアウト (秒)")
+    parser.add_argument("--workers", type=int, default=1, help="ローカル起動時の WORKERS")
+    parser.add_argument("--port", type=int, default=18091, help="ローカル起動時のポート")
+    parser.add_argument("--startup-timeout", type=float, default=600.0, help="ローカル起動の待ち時間 (秒)")
+    parser.add_argument("--output", default=None, help="結果の JSON (既定: load_test_<日時>.json)")
+    parser.add_argument("--baseline", default=None, help="比較する前回の結果の JSON")
+    args = parser.parse_args()
+
+    proc = None
+    base = args.url.rstrip("/") if args.url else None
+    if base is None:
+        proc, base = start_server(args)
+    try:
+        scenarios, skipped = build_scenarios(base, args.split, args.dialogues)
+        if not scenarios:
+            print(f"!!! reproduce/data/{args.split} にサーバーの商品と一致する対話がありません。")
+            sys.exit(1)
+
+        stats = LoadStats()
+        cursor = {"lock": threading.Lock(), "next": 0}
+        started_at = datetime.now().isoformat(timespec="seconds")
+        start = time.perf_counter()
+        deadline = start + args.duration if args.duration else None
+        threads = []
+        for i in range(args.users):
+            if args.ramp_up > 0 and i > 0:
+                time.sleep(args.ramp_up / args.users)
+            thread = threading.Thread(target=virtual_user, args=(base, scenarios, cursor, stats, args, deadline),
+                                      daemon=True)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        try:
+            _, health, _ = call(base, "/api/health")
+        except (urllib.error.URLError, OSError, ValueError):
+            health = {}
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    endpoints = stats.summary(elapsed)
+    total_requests = sum(e["requests"] for e in endpoints.values())
+    total_errors = sum(e["errors"] for e in endpoints.values())
+    result = {
+        "started_at": started_at,
+        "config": {
+            "url": args.url or f"local app.py (WORKERS={args.workers})",
+            "users": args.users,
+            "split": args.split,
+            "scenarios": len(scenarios),
+            "skipped_dialogues": skipped,
+            "duration_s": args.duration,
+            "think_time_ms": args.think_time_ms,
+            "ramp_up_s": args.ramp_up,
+        },
+        "elapsed_s": round(elapsed, 2),
+        "sessions": stats.sessions,
+        "requests": total_requests,
+        "throughput_rps": round(total_requests / elapsed, 2),
+        "error_rate": round(total_errors / total_requests, 4) if total_requests else 0.0,
+        "endpoints": endpoints,
+        "server": {key: health.get(key) for key in ("status", "model_loaded", "process")},
+    }
+    output = args.output or f"load_test_{datetime.now():%Y%m%d_%H%M%S}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    print("=" * 92)
+    print(f" Load Test ({args.users} users, {stats.sessions} sessions, {elapsed:.1f}s, "
+          f"{len(scenarios)} scenarios, {skipped} dialogues skipped)")
+    print("=" * 92)
+    print(f" {'endpoint':<22}{'requests':>9}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'errors':>8}{'rate':>8}")
+    for path, e in endpoints.items():
+        cells = "".join(f"{e[key]:>9.1f}" if e[key] is not None else f"{'-':>9}"
+                        for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms"))
+        print(f" {path:<22}{e['requests']:>9}{e['throughput_rps']:>9.1f}{cells}{e['errors']:>8}"
+              f"{e['error_rate'] * 100:>7.2f}%")
+        if e["error_reasons"]:
+            print(f" {'':<22}{e['error_reasons']}")
+    print(f" Total: {total_requests} requests, {result['throughput_rps']:.1f} req/s, "
+          f"error rate {result['error_rate'] * 100:.2f}% | server: {result['server']['status']}")
+    if args.baseline:
+        print("-" * 92)
+        print_comparison(result, args.baseline)
+    print(f" Results: {output}")
+    print("=" * 92)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Keyword Rule Regression Check
+従来の「キーワードごとの部分文字列検索」によるルール判定と、Aho-Corasick
+オートマトンによる 1 回走査の判定が、全メッセージで同じ結果になることを確認する。
+
+対象: reproduce/data の train/valid 全ユーザー発話 + デモ用メッセージ
+判定: インテント / 明確な感情 (_check_obvious_sentiment) / ルールベース満足度 /
+      モデル判定の Safety Net に使うフラグ / パラメータ検索の種類
+
+使い方:
+    python benchmarks/verify_keyword_rules.py
+    (不一致が 1 件でもあれば終了コード 1)
+"""
+
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault("BATCHING", "false")
+
+from bench_utils import load_dialogues, split_turns
+
+from inference import (
+    MonotaROInference,
+    RULE_MATCHER,
+    NEGATIVE_KEYWORDS,
+    POSITIVE_KEYWORDS,
+    OBJECTIVE_KEYWORDS,
+    POLITE_IGNORE_KEYWORDS,
+)
+
+DEMO_MESSAGES = [
+    "こんにちは", "ありがとうございました！", "最悪です。二度と買いません",
+    "この商品の価格はいくらですか？", "重さはどれくらい？", "サイズを教えてください",
+    "在庫はありますか？", "いつ届きますか", "おすすめはどれ？", "返品したいです",
+    "すみません、耐久性はどうですか", "対応が悪い", "助かりました", "よろしくお願いします",
+    "", "?",
+]
+
+
+# ---- 従来の実装 (キーワードリストごとに部分文字列検索) ----
+
+def legacy_check_obvious_sentiment(text):
+    strong_negative = [
+        "最悪", "ひどい",
+        "クレーム", "怒", "腹立", "失望", "残念", "ふざけ", "二度と", "金返せ", "詐欺",
+        "対応が悪い", "態度が悪い"
+    ]
+    for keyword in strong_negative:
+        if keyword in text:
+            return 0
+    is_objective = any(k in text for k in OBJECTIVE_KEYWORDS)
+    is_polite = any(k in text for k in POLITE_IGNORE_KEYWORDS)
+    has_negative_context = any(k in text for k in NEGATIVE_KEYWORDS)
+    if (is_objective or is_polite) and not has_negative_context:
+        return 1
+    strong_positive = [
+        "ありがとう", "感謝", "助かり", "嬉しい", "満足", "最高",
+        "素晴らしい", "完璧", "おすすめ", "気に入", "良かった", "いい感じ"
+    ]
+    for keyword in strong_positive:
+        if keyword in text:
+            return 2
+    return None
+
+
+def legacy_rule_based(text):
+    for keyword in NEGATIVE_KEYWORDS:
+        if keyword in text:
+            return 0
+    for keyword in POSITIVE_KEYWORDS:
+        if keyword in text:
+            return 2
+    return 1
+
+
+def legacy_detect_intent(text):
+    if any(w in text for w in ["こんにちは", "おはよう", "こんばんは", "はじめまして", "よろしく"]):
+        return "greeting"
+    if any(w in text for w in ["ありがとう", "サンキュー", "感謝", "助かり"]):
+        return "thanks"
+    if any(w in text for w in NEGATIVE_KEYWORDS[:10]):
+        return "complaint"
+    if any(w in text for w in ["いくら", "値段", "価格", "円", "お金", "コスト", "なんぼ", "おいくら"]):
+        return "price"
+    if any(w in text for w in ["在庫", "ある", "ありますか", "入荷", "品切れ", "売り切れ", "ございますか"]):
+        return "stock"
+    if any(w in text for w in ["届く", "届き", "配送", "納期", "発送", "いつ届く", "配達", "何日"]):
+        return "delivery"
+    if any(w in text for w in ["サイズ", "寸法", "重さ", "重量", "スペック", "仕様", "大きさ"]):
+        return "spec"
+    if any(w in text for w in ["おすすめ", "オススメ", "選び方", "どれがいい", "比較", "人気"]):
+        return "recommend"
+    if any(w in text for w in ["返品", "交換", "キャンセル", "返金"]):
+        return "return"
+    if any(w in text for w in ["品質", "丈夫", "長持ち", "耐久", "保証"]):
+        return "quality"
+    return "fallback"
+
+
+def legacy_safety_flags(text):
+    return (
+        any(k in text for k in OBJECTIVE_KEYWORDS),
+        any(k in text for k in POLITE_IGNORE_KEYWORDS),
+        any(k in text for k in NEGATIVE_KEYWORDS),
+    )
+
+
+def legacy_param_query(text):
+    if "価格" in text or "いくら" in text:
+        return "price"
+    elif "重さ" in text or "重量" in text:
+        return "weight"
+    elif "サイズ" in text or "寸法" in text or "大きさ" in text:
+        return "size"
+    return None
+
+
+def legacy_rules(text):
+    return (
+        legacy_detect_intent(text),
+        legacy_check_obvious_sentiment(text),
+        legacy_rule_based(text),
+        legacy_safety_flags(text),
+        legacy_param_query(text),
+    )
+
+
+# ---- 新しい実装 (1 回の走査結果を全ルールで共有) ----
+
+def matcher_rules(engine, text):
+    matches = RULE_MATCHER.match(text)
+    param = next((g[len("param:"):] for g in ("param:price", "param:weight", "param:size") if g in matches), None)
+    return (
+        engine.detect_intent(text, matches),
+        engine._check_obvious_sentiment(text, matches),
+        engine._predict_satisfaction_rule_based(text, matches),
+        ("objective" in matches, "polite_ignore" in matches, "negative" in matches),
+        param,
+    )
+
+
+def collect_messages(limit):
+    messages = list(DEMO_MESSAGES)
+    for split in ("train", "valid"):
+        for row in load_dialogues(split, limit=limit):
+            messages.extend(q for q, _ in split_turns(row.get("sent", "")))
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="キーワードルールの回帰チェック")
+    parser.add_argument("--limit", type=int, default=None, help="split ごとに使用する対話数 (既定: 全件)")
+    args = parser.parse_args()
+
+    messages = collect_messages(args.limit)
+    # ルール判定だけを使うため、モデルはロードしない
+    engine = MonotaROInference.__new__(MonotaROInference)
+
+    start = time.perf_counter()
+    legacy = [legacy_rules(m) for m in messages]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    current = [matcher_rules(engine, m) for m in messages]
+    matcher_time = time.perf_counter() - start
+
+    mismatches = [(m, a, b) for m, a, b in zip(messages, legacy, current) if a != b]
+
+    n = len(messages)
+    print("=" * 60)
+    print(" Keyword Rule Regression (per-keyword scan vs Aho-Corasick)")
+    print("=" * 60)
+    print(f" Messages         : {n}")
+    print(f" Per-keyword scan : {legacy_time * 1000:9.1f} ms ({legacy_time / n * 1e6:7.1f} us/message)")
+    print(f" Single pass      : {matcher_time * 1000:9.1f} ms ({matcher_time / n * 1e6:7.1f} us/message)")
+    print(f" Speedup          : x{legacy_time / matcher_time:.2f}")
+    print(f" Mismatches       : {len(mismatches)}")
+    for message, old, new in mismatches[:10]:
+        print(f"   {message!r}\n     legacy={old}\n     new   ={new}")
+    print("=" * 60)
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - KG Insight Table Check
+知識グラフの事前計算表 (全カタログ商品 × インテントの関係の Top-k) が、表を使わない
+predict_kg_tail の 1 件ずつの推論と一致することを確認し、1 回あたりの時間を比較する。
+
+使い方:
+    python benchmarks/verify_kg_table.py
+    (一致しない組があると終了コード 1)
+"""
+
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault("BATCHING", "false")
+
+from bench_utils import percentile
+
+import inference
+
+
+def timed_calls(engine, keys):
+    """各組を predict_kg_tail で推論し、(結果, 1 回あたりの時間 μs のリスト)"""
+    results, latencies = {}, []
+    for key in keys:
+        start = time.perf_counter()
+        results[key] = engine.predict_kg_tail(*key)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    return results, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="知識グラフの事前計算表の確認")
+    parser.add_argument("--limit", type=int, default=None, help="確認する組の数 (既定: 全件)")
+    args = parser.parse_args()
+
+    engine = inference.MonotaROInference()
+    if not engine.kg_loaded:
+        print("!!! 知識グラフがロードできないため確認できません (reproduce/train_tucker_kg.py を先に実行してください)。")
+        sys.exit(1)
+    if not engine.kg_table:
+        print("!!! 事前計算表がありません (KG_PRECOMPUTE=true で起動してください)。")
+        sys.exit(1)
+
+    keys = sorted(engine.kg_table)[:args.limit]
+    table = engine.kg_table
+    table_results, table_latencies = timed_calls(engine, keys)
+    engine.kg_table = {}
+    try:
+        live_results, live_latencies = timed_calls(engine, keys)
+    finally:
+        engine.kg_table = table
+    mismatches = [key for key in keys if table_results[key] != live_results[key]]
+    resolved = sum(1 for key in keys if live_results[key])
+
+    print("=" * 64)
+    print(f" KG Insight Table ({len(keys)} pairs, {resolved} with tails, {engine.get_kg_table_stats()})")
+    print("=" * 64)
+    print(f" {'mode':<16}{'p50 us':>12}{'p99 us':>12}{'mean us':>12}")
+    for mode, latencies in (("table lookup", table_latencies), ("live forward", live_latencies)):
+        print(f" {mode:<16}{percentile(latencies, 50):>12.2f}{percentile(latencies, 99):>12.2f}"
+              f"{sum(latencies) / len(latencies):>12.2f}")
+    print(f" Mismatches: {len(mismatches)}")
+    for key in mismatches[:10]:
+        print(f"   {key}: table={table_results[key]} live={live_results[key]}")
+    print("=" * 64)
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
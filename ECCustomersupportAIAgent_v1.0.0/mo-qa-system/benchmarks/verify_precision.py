@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Precision Regression Check
+bf16 autocast の予測が fp32 の予測と一致することを reproduce/data/valid の対話で確認する。
+
+使い方:
+    python benchmarks/verify_precision.py --min-agreement 0.99
+    (一致率が閾値を下回ると終了コード 1)
+"""
+
+import argparse
+import os
+import sys
+
+os.environ.setdefault("BATCHING", "false")
+os.environ.setdefault("PREDICTION_CACHE_SIZE", "0")
+
+from bench_utils import load_dialogues, build_eval_samples, evaluate_engine
+
+from inference import MonotaROInference
+
+
+def main():
+    parser = argparse.ArgumentParser(description="bf16 推論の回帰チェック")
+    parser.add_argument("--limit", type=int, default=None, help="使用する対話数 (既定: 全件)")
+    parser.add_argument("--batch-size", type=int, default=32, help="評価のバッチサイズ")
+    parser.add_argument("--latency-samples", type=int, default=100, help="レイテンシ計測の件数")
+    parser.add_argument("--min-agreement", type=float, default=0.99, help="fp32 との最低一致率")
+    args = parser.parse_args()
+
+    rows = load_dialogues("valid", limit=args.limit)
+    if not rows:
+        print("!!! reproduce/data/valid に対話データがありません。gen_monotaro_mock_data.py を先に実行してください。")
+        sys.exit(1)
+
+    engine = MonotaROInference(precision="fp32")
+    if engine.model is None:
+        print("!!! モデルがロードできないため確認できません。")
+        sys.exit(1)
+    samples = build_eval_samples(rows, engine.tokenizer)
+
+    results = {}
+    for precision in ("fp32", "bf16"):
+        engine.precision = precision
+        results[precision] = evaluate_engine(engine, samples, args.batch_size, args.latency_samples)
+
+    agreement = sum(int(a == b) for a, b in zip(results["fp32"]["predictions"],
+                                                 results["bf16"]["predictions"])) / len(samples)
+
+    print("=" * 64)
+    print(f" Precision Regression (reproduce/data/valid, {len(samples)} dialogues)")
+    print("=" * 64)
+    print(f" {'precision':<10}{'accuracy':>10}{'macro F1':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for precision, r in results.items():
+        print(f" {precision:<10}{r['accuracy']:>10.4f}{r['macro_f1']:>10.4f}"
+              f"{r['latency']['p50_ms']:>10.2f}{r['latency']['p99_ms']:>10.2f}")
+    print(f" Agreement with fp32: {agreement * 100:.2f}% (required {args.min_agreement * 100:.2f}%)")
+    print("=" * 64)
+
+    sys.exit(0 if agreement >= args.min_agreement else 1)
+
+
+if __name__ == "__main__":
+    main()
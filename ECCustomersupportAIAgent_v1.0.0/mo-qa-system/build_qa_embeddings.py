@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Q&A Embedding Builder
+商品カタログの全質問を推論エンジンのバックボーンで埋め込み、
+密ベクトル検索用の float16 行列と ID テーブルを書き出す。
+
+出力:
+    qa_embeddings.npy       (行数 × hidden_size, float16)
+    qa_embeddings_ids.json  (埋め込みに使ったモデル名、商品ごとの行範囲、各行の QA 番号と質問文)
+
+行は (カテゴリ, 商品) の順に並べるため、推論時の商品・カテゴリでの絞り込みは
+行範囲のスライスになる。
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+from inference import MonotaROInference, CATALOG, DENSE_INDEX_PATH, DENSE_IDS_PATH
+
+
+def collect_questions(catalog):
+    """(カテゴリ, 商品) 順に重複を除いた質問を集める"""
+    products = []
+    questions = []
+    qa_index = []
+    for category, product, info in catalog.items():
+        start = len(questions)
+        seen = set()
+        for i, qa in enumerate(info.get("qa", [])):
+            if qa["q"] in seen:
+                continue
+            seen.add(qa["q"])
+            questions.append(qa["q"])
+            qa_index.append(i)
+        if len(questions) > start:
+            products.append([category, product, start, len(questions)])
+    return products, questions, qa_index
+
+
+def main():
+    if not len(CATALOG):
+        print("!!! product_data.json がありません。generate_data.py を先に実行してください。")
+        return
+
+    engine = MonotaROInference()
+    if engine.model is None:
+        print("!!! モデルがロードできないため埋め込みを作成できません。")
+        return
+
+    products, questions, qa_index = collect_questions(CATALOG)
+    print(f"Embedding {len(questions)} unique questions from {len(products)} products...")
+
+    start = time.time()
+    vectors = engine.embed_texts(questions, batch_size=64)
+    print(f"Embedded in {time.time() - start:.1f}s ({len(questions) / max(time.time() - start, 1e-9):.1f} q/s)")
+
+    matrix = vectors.astype(np.float16)
+    np.save(DENSE_INDEX_PATH, matrix)
+    with open(DENSE_IDS_PATH, 'w', encoding='utf-8') as f:
+        json.dump({
+            "model": engine.model.backbone.config.name_or_path,
+            "dim": int(matrix.shape[1]),
+            "products": products,
+            "qa_index": qa_index,
+            "questions": questions,
+        }, f, ensure_ascii=False)
+
+    size_mb = os.path.getsize(DENSE_INDEX_PATH) / 1024 / 1024
+    print(f"Saved {matrix.shape} float16 matrix to {DENSE_INDEX_PATH} ({size_mb:.1f} MB)")
+    print(f"Saved ID table to {DENSE_IDS_PATH}")
+    print("Done.")
+
+
+if __name__ == "__main__":
+    main()
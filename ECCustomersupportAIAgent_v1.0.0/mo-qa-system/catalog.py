@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Product Catalog
+商品カタログ (パラメータ・Q&A) へのアクセス
+
+product_data.json をプロセスごとに全件パースする代わりに、generate_data.py が
+書き出すバイナリカタログ (product_catalog.bin) をメモリマップし、商品が選択された
+ときにその商品のレコードだけをデコードする。
+
+バイナリ形式 (リトルエンディアン):
+    ヘッダ      : magic "MOCATLOG", version (u16), reserved (u16),
+                  カテゴリ数 (u32), 商品数 (u32)
+    カテゴリ表  : [名前 (u16 長 + UTF-8), 先頭商品番号 (u32), 商品数 (u32)] × カテゴリ数
+    商品表      : [名前 (u16 長 + UTF-8), レコード位置 (u64)] × 商品数
+    レコード    : [長さ (u32) + JSON (UTF-8)] × 商品数
+
+カテゴリ・商品は名前順に並ぶ。レコードの JSON は product_data.json の 1 商品分
+({"cnt", "params", "qa"}) と同じ構造。qa は重複を除いた [{"q", "a", "count"}]。
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+
+CATALOG_MAGIC = b"MOCATLOG"
+CATALOG_VERSION = 1
+
+_HEADER = struct.Struct("<8sHHII")
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+_CATEGORY_ENTRY = struct.Struct("<II")
+
+
+def _intern_answer(obj: dict) -> dict:
+    """Q&A の回答文字列を intern する (同じ回答を複数の商品・セッションで共有)"""
+    if "a" in obj and isinstance(obj["a"], str):
+        obj["a"] = sys.intern(obj["a"])
+    return obj
+
+
+def _pack_name(name: str) -> bytes:
+    data = name.encode("utf-8")
+    return _U16.pack(len(data)) + data
+
+
+def write_catalog(path: str, product_data: dict):
+    """{カテゴリ: {商品: 情報}} をバイナリカタログとして書き出す"""
+    categories = sorted(product_data)
+    products = [(c, p) for c in categories for p in sorted(product_data[c])]
+    records = [json.dumps(product_data[c][p], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+               for c, p in products]
+
+    header = _HEADER.pack(CATALOG_MAGIC, CATALOG_VERSION, 0, len(categories), len(products))
+    category_table = bytearray()
+    first = 0
+    for c in categories:
+        count = len(product_data[c])
+        category_table += _pack_name(c) + _CATEGORY_ENTRY.pack(first, count)
+        first += count
+
+    product_table_size = sum(len(_pack_name(p)) + _U64.size for _, p in products)
+    offset = len(header) + len(category_table) + product_table_size
+    product_table = bytearray()
+    for (_, p), record in zip(products, records):
+        product_table += _pack_name(p) + _U64.pack(offset)
+        offset += _U32.size + len(record)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(category_table)
+        f.write(product_table)
+        for record in records:
+            f.write(_U32.pack(len(record)))
+            f.write(record)
+    os.replace(tmp_path, path)
+
+
+class BinaryCatalog:
+    """メモリマップしたバイナリカタログ (レコードは要求時にデコード)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _, n_categories, n_products = _HEADER.unpack_from(self._mm, 0)
+        if magic != CATALOG_MAGIC:
+            raise ValueError(f"not a product catalog: {path}")
+        if version != CATALOG_VERSION:
+            raise ValueError(f"unsupported catalog version {version}: {path}")
+
+        pos = _HEADER.size
+        category_entries = []
+        for _ in range(n_categories):
+            name, pos = self._read_name(pos)
+            first, count = _CATEGORY_ENTRY.unpack_from(self._mm, pos)
+            pos += _CATEGORY_ENTRY.size
+            category_entries.append((name, first, count))
+
+        product_names = []
+        self._offsets = []
+        for _ in range(n_products):
+            name, pos = self._read_name(pos)
+            (record_offset,) = _U64.unpack_from(self._mm, pos)
+            pos += _U64.size
+            product_names.append(name)
+            self._offsets.append(record_offset)
+
+        self._categories = [name for name, _, _ in category_entries]
+        self._products = {}
+        self._product_ids = {}
+        for name, first, count in category_entries:
+            self._products[name] = product_names[first:first + count]
+            for i in range(first, first + count):
+                self._product_ids[(name, product_names[i])] = i
+
+    def _read_name(self, pos):
+        (length,) = _U16.unpack_from(self._mm, pos)
+        start = pos + _U16.size
+        return self._mm[start:start + length].decode("utf-8"), start + length
+
+    def categories(self) -> list:
+        return list(self._categories)
+
+    def products(self, category: str) -> list:
+        return list(self._products.get(category, []))
+
+    def __contains__(self, key):
+        return key in self._product_ids
+
+    def __len__(self):
+        return len(self._product_ids)
+
+    def get(self, category: str, product: str):
+        """1 商品分の情報 {"cnt", "params", "qa"} (存在しなければ None)"""
+        product_id = self._product_ids.get((category, product))
+        if product_id is None:
+            return None
+        offset = self._offsets[product_id]
+        (length,) = _U32.unpack_from(self._mm, offset)
+        start = offset + _U32.size
+        return json.loads(self._mm[start:start + length].decode("utf-8"), object_hook=_intern_answer)
+
+    def items(self):
+        """(カテゴリ, 商品, 情報) を順にデコードして返す"""
+        for category in self._categories:
+            for product in self._products[category]:
+                yield category, product, self.get(category, product)
+
+
+class JsonCatalog:
+    """product_data.json を丸ごと読み込むカタログ (バイナリカタログがない場合)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "r", encoding="utf-8") as f:
+            self._data = json.load(f, object_hook=_intern_answer)
+
+    def categories(self) -> list:
+        return sorted(self._data)
+
+    def products(self, category: str) -> list:
+        return sorted(self._data.get(category, {}))
+
+    def __contains__(self, key):
+        category, product = key
+        return product in self._data.get(category, {})
+
+    def __len__(self):
+        return sum(len(products) for products in self._data.values())
+
+    def get(self, category: str, product: str):
+        return self._data.get(category, {}).get(product)
+
+    def items(self):
+        for category in self.categories():
+            for product in self.products(category):
+                yield category, product, self._data[category][product]
+
+
+class EmptyCatalog(JsonCatalog):
+    """カタログファイルがない場合"""
+
+    def __init__(self):
+        self.path = None
+        self._data = {}
+
+
+def load_catalog(binary_path: str, json_path: str):
+    """バイナリカタログを優先し、なければ JSON を読み込む"""
+    if os.path.exists(binary_path):
+        return BinaryCatalog(binary_path)
+    if os.path.exists(json_path):
+        return JsonCatalog(json_path)
+    return EmptyCatalog()
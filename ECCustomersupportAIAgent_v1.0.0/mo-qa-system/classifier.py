@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Satisfaction Classifier
+XLM-RoBERTa ベースの満足度分類モデルの定義
+
+torch を import するため、inference.py からは最初のモデル使用時に遅延 import する。
+"""
+
+import torch
+import torch.nn as nn
+
+
+class HighAccuracyClassifierV2(nn.Module):
+    """XLM-RoBERTa ベースの満足度分類器"""
+
+    def __init__(self, backbone, hidden_size=768, topic_num=24, num_classes=3):
+        super().__init__()
+        self.backbone = backbone
+        self.hidden_size = hidden_size
+        self.topic_embed = nn.Embedding(topic_num, 128)
+
+        self.classifier = nn.Sequential(
+            nn.Linear(hidden_size + 128, 512),
+            nn.LayerNorm(512),
+            nn.GELU(),
+            nn.Dropout(0.3),
+            nn.Linear(512, 256),
+            nn.LayerNorm(256),
+            nn.GELU(),
+            nn.Dropout(0.2),
+            nn.Linear(256, num_classes)
+        )
+
+    def forward(self, input_ids, attention_mask, topics):
+        outputs = self.backbone(input_ids, attention_mask=attention_mask)
+
+        if hasattr(outputs, 'last_hidden_state'):
+            cls_output = outputs.last_hidden_state[:, 0, :]
+        else:
+            cls_output = outputs[0][:, 0, :]
+
+        topic_emb = self.topic_embed(topics)
+        combined = torch.cat([cls_output, topic_emb], dim=-1)
+
+        logits = self.classifier(combined)
+        return logits
@@ -3,12 +3,16 @@ import json
 import os
 import re
 import glob
+import sys
 from collections import defaultdict
 
+from catalog import write_catalog
+
 # Paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, "..", "reproduce", "data", "train", "data_turn")
 OUTPUT_FILE = os.path.join(BASE_DIR, "product_data.json")
+CATALOG_FILE = os.path.join(BASE_DIR, "product_catalog.bin")
 
 # Regex patterns for parameter extraction
 PARAM_PATTERNS = {
@@ -85,6 +89,16 @@ def extract_params(qa_list):
                     break
     return params
 
+def expand_qa(kb):
+    """Rebuild the legacy layout (one QA entry per occurrence) for size comparison."""
+    return {
+        cat: {
+            name: {**entry, "qa": [{"q": qa["q"], "a": qa["a"]} for qa in entry["qa"] for _ in range(qa["count"])]}
+            for name, entry in products.items()
+        }
+        for cat, products in kb.items()
+    }
+
 def main():
     print(f"Scanning CSVs in {DATA_DIR}...")
     csv_files = glob.glob(os.path.join(DATA_DIR, "dialogue_*.csv"))
@@ -92,8 +106,11 @@ def main():
     
     # Structure: { Category: { ProductName: { "cnt": X, "params": {}, "qa": [] } } }
     kb = defaultdict(lambda: defaultdict(lambda: {"cnt": 0, "params": {}, "qa": []}))
+    # (Category, ProductName) -> { (q, a): position in prod_entry["qa"] }
+    qa_positions = defaultdict(dict)
     
     count = 0
+    total_pairs = 0
     for file_path in csv_files:
         try:
             with open(file_path, 'r', encoding='utf-8-sig') as f:
@@ -112,8 +129,19 @@ def main():
                     prod_entry["cnt"] += 1
                     
                     # Merge QA
-                    # Avoid duplicates if possible? For now just append.
-                    prod_entry["qa"].extend(qa_pairs)
+                    # Keep one entry per unique (q, a) pair with its occurrence count
+                    # (first-seen order is preserved). Strings are interned so answers
+                    # repeated across products share a single object.
+                    positions = qa_positions[(category, product_name)]
+                    for qa in qa_pairs:
+                        key = (sys.intern(qa["q"]), sys.intern(qa["a"]))
+                        pos = positions.get(key)
+                        if pos is None:
+                            positions[key] = len(prod_entry["qa"])
+                            prod_entry["qa"].append({"q": key[0], "a": key[1], "count": 1})
+                        else:
+                            prod_entry["qa"][pos]["count"] += 1
+                    total_pairs += len(qa_pairs)
                     
                     # Extract params and merge
                     new_params = extract_params(qa_pairs)
@@ -130,6 +158,12 @@ def main():
 
     print(f"Processed {len(csv_files)} files, {count} dialogues.")
     
+    unique_pairs = sum(len(p) for p in qa_positions.values())
+    unique_answers = len({a for p in qa_positions.values() for _, a in p})
+    print(f"QA pairs: {total_pairs} -> {unique_pairs} unique "
+          f"({(1 - unique_pairs / max(total_pairs, 1)) * 100:.1f}% duplicates removed), "
+          f"{unique_answers} distinct answers")
+    
     # Final cleanup (optional) - verify structure
     final_output = {}
     for cat, products in kb.items():
@@ -139,6 +173,14 @@ def main():
     with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
         json.dump(final_output, f, indent=2, ensure_ascii=False)
     
+    before_size = len(json.dumps(expand_qa(final_output), indent=2, ensure_ascii=False).encode("utf-8"))
+    after_size = os.path.getsize(OUTPUT_FILE)
+    print(f"product_data.json: {before_size / 1024 / 1024:.1f} MB (with duplicates) -> {after_size / 1024 / 1024:.1f} MB")
+    
+    # Indexed binary catalog (memory-mapped by the inference engine, decoded per product)
+    print(f"Saving binary catalog to {CATALOG_FILE}...")
+    write_catalog(CATALOG_FILE, final_output)
+    
     print("Done.")
 
 if __name__ == "__main__":
@@ -4,10 +4,29 @@ MonotaRO Q&A System - Model-based Inference Module
 訓練データを使用した満足度予測
 """
 
+import importlib.util
 import os
 import sys
 import random
-import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from session_store import DialogueSession
+from batching import MicroBatcher, BatchQueueFull
+from retrieval import QAIndex, DenseQAIndex, NUMPY_AVAILABLE
+from catalog import load_catalog, EmptyCatalog
+from keyword_matcher import KeywordMatcher
+from prediction_cache import PredictionCache, prediction_key
+from metrics import REGISTRY as METRICS
+from precision import PRECISIONS, autocast_context, select_precision
+from quantization import (
+    quantize_dynamic_int8, quantized_skeleton, quantized_cache_path, save_quantized, load_quantized,
+    load_quantized_state,
+)
+from student import is_student, load_student
+from kg_table import build_kg_table, fingerprint, kg_table_path, load_kg_table, resolve_entity, save_kg_table
 
 # Add parent directory to path
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -19,52 +38,79 @@ if os.path.join(parent_dir, "reproduce") not in sys.path:
 if os.path.join(parent_dir, "KG_tail_prediction") not in sys.path:
     sys.path.insert(0, os.path.join(parent_dir, "KG_tail_prediction"))
 
+# 学習時 (run_full_pipeline.py) のカテゴリ順 (対話単位の一括予測でトピックIDに使う)
 try:
-    from TuckER_model import TuckER
-    KG_AVAILABLE = True
+    from monotaro_categories import CATEGORY_LIST as TRAIN_CATEGORY_LIST
 except ImportError:
-    KG_AVAILABLE = False
+    TRAIN_CATEGORY_LIST = None
+
+# torch / transformers (と TuckER) は import に数秒かかるため、ここでは有無だけを確認し、
+# 最初のモデル使用時に _import_model_libs() で import する
+KG_AVAILABLE = importlib.util.find_spec("TuckER_model") is not None
+if not KG_AVAILABLE:
     print("[Warning] TuckER model not available")
 
 
 # Load real product data from training
+# バイナリカタログ (generate_data.py が出力) があればメモリマップし、商品ごとに遅延デコードする
 PRODUCT_DATA_PATH = os.path.join(current_dir, "product_data.json")
-REAL_PRODUCT_DATA = {}
+PRODUCT_CATALOG_PATH = os.environ.get('PRODUCT_CATALOG_PATH', os.path.join(current_dir, "product_catalog.bin"))
 try:
-    with open(PRODUCT_DATA_PATH, 'r', encoding='utf-8') as f:
-        REAL_PRODUCT_DATA = json.load(f)
-    print(f"[Inference] Loaded real product data: {len(REAL_PRODUCT_DATA)} categories")
+    CATALOG = load_catalog(PRODUCT_CATALOG_PATH, PRODUCT_DATA_PATH)
+    print(f"[Inference] Loaded real product data: {len(CATALOG.categories())} categories, "
+          f"{len(CATALOG)} products ({CATALOG.path})")
 except Exception as e:
     print(f"[Inference] Could not load product data: {e}")
+    CATALOG = EmptyCatalog()
 
-# Optional imports
-try:
-    import torch
-    import torch.nn as nn
-    TORCH_AVAILABLE = True
-except ImportError:
-    TORCH_AVAILABLE = False
+# Optional imports (遅延 import、_import_model_libs() が設定する)
+TORCH_AVAILABLE = importlib.util.find_spec("torch") is not None
+if not TORCH_AVAILABLE:
     print("[Warning] PyTorch not available")
-
-try:
-    from transformers import AutoTokenizer, AutoModel
-    TRANSFORMERS_AVAILABLE = True
-except ImportError:
-    TRANSFORMERS_AVAILABLE = False
+TRANSFORMERS_AVAILABLE = importlib.util.find_spec("transformers") is not None
+if not TRANSFORMERS_AVAILABLE:
     print("[Warning] Transformers not available")
 
+torch = None
+AutoTokenizer = AutoModel = AutoConfig = None
+HighAccuracyClassifierV2 = None
+TuckER = None
+_model_libs_lock = threading.Lock()
+
+
+def _import_model_libs(kg=False):
+    """torch / transformers とモデル定義を import する (初回のみ、ルールのみのモードでは呼ばない)"""
+    global torch, AutoTokenizer, AutoModel, AutoConfig, HighAccuracyClassifierV2, TuckER
+    with _model_libs_lock:
+        if torch is None:
+            start = time.time()
+            import torch as _torch
+            from transformers import AutoTokenizer as _AutoTokenizer, AutoModel as _AutoModel, \
+                AutoConfig as _AutoConfig
+            from classifier import HighAccuracyClassifierV2 as _HighAccuracyClassifierV2
+            AutoTokenizer, AutoModel, AutoConfig = _AutoTokenizer, _AutoModel, _AutoConfig
+            HighAccuracyClassifierV2 = _HighAccuracyClassifierV2
+            torch = _torch
+            print(f"[Inference] Imported torch/transformers in {time.time() - start:.1f}s")
+        if kg and TuckER is None:
+            from TuckER_model import TuckER as _TuckER
+            TuckER = _TuckER
+
 # ==========================================
 # カテゴリ定義 (24カテゴリ)
 # ==========================================
 # ==========================================
 # カテゴリ定義 (JSONから動的ロード)
 # ==========================================
-CATEGORY_LIST = sorted(list(REAL_PRODUCT_DATA.keys()))
+CATEGORY_LIST = CATALOG.categories()
 
 # 各カテゴリの代表商品 (JSONから動的ロード)
 CATEGORY_PRODUCTS = {}
 for i, cat in enumerate(CATEGORY_LIST):
-    CATEGORY_PRODUCTS[i] = sorted(list(REAL_PRODUCT_DATA[cat].keys()))
+    CATEGORY_PRODUCTS[i] = CATALOG.products(cat)
+
+# 商品ごとの Q&A 検索インデックスは、商品が選択されたときに構築してキャッシュする
+QA_INDEX_CACHE_SIZE = int(os.environ.get('QA_INDEX_CACHE_SIZE', 256))
 
 
 
@@ -78,6 +124,101 @@ CATEGORY_PRICES = {
     20: (1480, 9800), 21: (298, 1980), 22: (498, 3980), 23: (498, 3980),
 }
 
+# ==========================================
+# マイクロバッチ設定 (環境変数で上書き可能)
+# ==========================================
+BATCHING_ENABLED = os.environ.get('BATCHING', 'true').lower() == 'true'
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 16))
+BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', 5))
+BATCH_MAX_QUEUE = int(os.environ.get('BATCH_MAX_QUEUE', 256))
+
+# 推論結果キャッシュ設定 (0 で無効)
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 4096))
+PREDICTION_CACHE_TTL = float(os.environ.get('PREDICTION_CACHE_TTL', 0))
+
+# 満足度予測と知識グラフ推論を並行実行するスレッドプールの大きさと、両段階の待ち時間の上限
+# (上限を過ぎた段階の結果は使わず、応答を partial として返す。実行中の段階がプールの大きさに
+# 達している場合は新しい段階を投入せず、その場でルールベース・推論省略とする)
+STAGE_POOL_SIZE = int(os.environ.get('STAGE_POOL_SIZE', 16))
+STAGE_TIMEOUT_MS = float(os.environ.get('STAGE_TIMEOUT_MS', 2000))
+
+# 満足度カスケード: 文字 n-gram の線形モデル (train_ngram_classifier.py で作成) の信頼度が閾値以上なら
+# その予測を使い、閾値未満の場合だけ HighAccuracyClassifierV2 で推論する (ファイルがなければ無効)
+CASCADE_ENABLED = os.environ.get('CASCADE', 'true').lower() == 'true'
+CASCADE_MODEL_PATH = os.environ.get('CASCADE_MODEL_PATH', os.path.join(current_dir, "satisfaction_ngram.npz"))
+CASCADE_THRESHOLD = float(os.environ.get('CASCADE_THRESHOLD', 0.8))
+# チャットのターンにもカスケードを使うか (1 段目は train_ngram_classifier.py がチャットの各ターンの入力
+# (chat_window_text) でも学習している。一致率は benchmarks/eval_cascade.py で確認できる)
+CASCADE_CHAT = os.environ.get('CASCADE_CHAT', 'true').lower() == 'true'
+
+# 知識グラフ推論: インテントから推論する関係と、返す Tail の数
+KG_RELATION_MAP = {
+    "price": "属性",  # "価格"関係がないので属性として推論
+    "spec": "属性",
+    "quality": "属性",
+    "recommend": "カテゴリ",
+}
+KG_DEFAULT_RELATION = "属性"
+KG_TOP_K = 3
+# KG モデルのロード時に全カタログ商品 × 上記の関係の Top-k を事前計算するか、
+# その表をモデルファイルの隣に保存して再利用するか
+KG_PRECOMPUTE = os.environ.get('KG_PRECOMPUTE', 'true').lower() == 'true'
+KG_PRECOMPUTE_PERSIST = os.environ.get('KG_PRECOMPUTE_PERSIST', 'true').lower() == 'true'
+
+# メトリクス (/api/metrics、false で記録しない)
+METRICS.enabled = os.environ.get('METRICS', 'true').lower() == 'true'
+STAGE_SECONDS = METRICS.histogram(
+    "monotaro_stage_duration_seconds", "Time spent in each inference stage.", label="stage",
+    label_values=("tokenization", "model_forward", "retrieval", "intent_detection", "knowledge_graph", "request"))
+RULE_OVERRIDES = METRICS.counter(
+    "monotaro_rule_overrides_total", "Model predictions overridden by the objective/polite safety net.")
+LOW_CONFIDENCE_FALLBACKS = METRICS.counter(
+    "monotaro_low_confidence_fallbacks_total", "Model predictions replaced by the rule-based fallback.")
+CACHE_LOOKUPS = METRICS.counter(
+    "monotaro_prediction_cache_lookups_total", "Prediction cache lookups.", label="result",
+    label_values=("hit", "miss"))
+ERRORS = METRICS.counter(
+    "monotaro_errors_total", "Errors by stage.", label="stage",
+    label_values=("satisfaction", "dense_retrieval", "knowledge_graph", "stage", "request"))
+CASCADE_DECISIONS = METRICS.counter(
+    "monotaro_cascade_decisions_total", "Satisfaction predictions by cascade tier (transformer = escalated).",
+    label="tier", label_values=("ngram", "transformer"))
+STAGE_TIMEOUTS = METRICS.counter(
+    "monotaro_stage_timeouts_total", "Stages that missed STAGE_TIMEOUT_MS.", label="stage",
+    label_values=("satisfaction", "knowledge_graph"))
+STAGE_SHED = METRICS.counter(
+    "monotaro_stage_shed_total", "Stages skipped because every stage pool slot was busy.", label="stage",
+    label_values=("satisfaction", "knowledge_graph"))
+
+# モデルのロードをバックグラウンドスレッドで行うか (get_inference_engine が使用)
+BACKGROUND_LOADING = os.environ.get('BACKGROUND_LOADING', 'true').lower() == 'true'
+
+# ルールのみで応答するモード (true の場合 torch / transformers を一切 import せず、モデルもロードしない)
+RULES_ONLY = os.environ.get('RULES_ONLY', 'false').lower() == 'true'
+
+# 満足度モデルの重みファイル (既定: best_model_v2.pt、run_distillation.py の student も指定できる)
+MODEL_PATH = os.environ.get('MODEL_PATH', os.path.join(parent_dir, "best_model_v2.pt"))
+
+# 量子化モード (none: fp32, int8: Linear 層の動的 int8 量子化、CPU のみ)
+QUANTIZATION = os.environ.get('QUANTIZATION', 'none').lower()
+# 推論精度 (fp32 / bf16 / auto: 起動時のマイクロベンチマークで速い方を選択)
+PRECISION = os.environ.get('PRECISION', 'fp32').lower()
+
+# 入力系列長 (学習時と同じ) と、バッチ内で系列をまとめる長さバケット
+MAX_SEQ_LENGTH = 256
+LENGTH_BUCKETS = (32, 64, 128, MAX_SEQ_LENGTH)
+# モデル入力に含める直近の履歴エントリ数と、その区切り文字
+HISTORY_WINDOW = 5
+HISTORY_SEPARATOR = " ||| "
+
+# Q&A 検索で回答を採用する類似度の閾値
+QA_MATCH_THRESHOLD = 0.6
+
+# 密ベクトル検索 (build_qa_embeddings.py で事前に作成した埋め込み行列)
+DENSE_INDEX_PATH = os.environ.get('DENSE_INDEX_PATH', os.path.join(current_dir, "qa_embeddings.npy"))
+DENSE_IDS_PATH = os.path.splitext(DENSE_INDEX_PATH)[0] + "_ids.json"
+DENSE_MATCH_THRESHOLD = float(os.environ.get('DENSE_MATCH_THRESHOLD', 0.9))
+
 # 満足度ラベル
 SATISFACTION_LABELS = {
     0: {"label": "不満", "emoji": "😞", "class": "negative"},
@@ -85,46 +226,6 @@ SATISFACTION_LABELS = {
     2: {"label": "満足", "emoji": "😊", "class": "positive"},
 }
 
-# ==========================================
-# XLM-RoBERTa モデル定義
-# ==========================================
-if TORCH_AVAILABLE:
-    class HighAccuracyClassifierV2(nn.Module):
-        """XLM-RoBERTa ベースの満足度分類器"""
-        
-        def __init__(self, backbone, hidden_size=768, topic_num=24, num_classes=3):
-            super().__init__()
-            self.backbone = backbone
-            self.hidden_size = hidden_size
-            self.topic_embed = nn.Embedding(topic_num, 128)
-            
-            self.classifier = nn.Sequential(
-                nn.Linear(hidden_size + 128, 512),
-                nn.LayerNorm(512),
-                nn.GELU(),
-                nn.Dropout(0.3),
-                nn.Linear(512, 256),
-                nn.LayerNorm(256),
-                nn.GELU(),
-                nn.Dropout(0.2),
-                nn.Linear(256, num_classes)
-            )
-        
-        def forward(self, input_ids, attention_mask, topics):
-            outputs = self.backbone(input_ids, attention_mask=attention_mask)
-            
-            if hasattr(outputs, 'last_hidden_state'):
-                cls_output = outputs.last_hidden_state[:, 0, :]
-            else:
-                cls_output = outputs[0][:, 0, :]
-            
-            topic_emb = self.topic_embed(topics)
-            combined = torch.cat([cls_output, topic_emb], dim=-1)
-            
-            logits = self.classifier(combined)
-            return logits
-
-
 # ==========================================
 # 応答テンプレート（尊敬語対応）
 # ==========================================
@@ -247,20 +348,118 @@ POSITIVE_KEYWORDS = [
     "助かりました", "ありがとうございました", "感謝申し上げ",
 ]
 
+# 強いネガティブ表現 (誤検知を防ぐため、明らかに感情的なものに限定)
+# 文脈依存の単語 ("返品"など) はリストから除外
+STRONG_NEGATIVE_KEYWORDS = [
+    "最悪", "ひどい", 
+    "クレーム", "怒", "腹立", "失望", "残念", "ふざけ", "二度と", "金返せ", "詐欺",
+    "対応が悪い", "態度が悪い"
+]
+
+# 強いポジティブ表現
+STRONG_POSITIVE_KEYWORDS = [
+    "ありがとう", "感謝", "助かり", "嬉しい", "満足", "最高",
+    "素晴らしい", "完璧", "おすすめ", "気に入", "良かった", "いい感じ"
+]
+
+# インテント検出キーワード (上から順に判定し、最初に一致したものを採用)
+INTENT_KEYWORDS = [
+    ("greeting", ["こんにちは", "おはよう", "こんばんは", "はじめまして", "よろしく"]),
+    ("thanks", ["ありがとう", "サンキュー", "感謝", "助かり"]),
+    ("complaint", NEGATIVE_KEYWORDS[:10]),
+    ("price", ["いくら", "値段", "価格", "円", "お金", "コスト", "なんぼ", "おいくら"]),
+    ("stock", ["在庫", "ある", "ありますか", "入荷", "品切れ", "売り切れ", "ございますか"]),
+    ("delivery", ["届く", "届き", "配送", "納期", "発送", "いつ届く", "配達", "何日"]),
+    ("spec", ["サイズ", "寸法", "重さ", "重量", "スペック", "仕様", "大きさ"]),
+    ("recommend", ["おすすめ", "オススメ", "選び方", "どれがいい", "比較", "人気"]),
+    ("return", ["返品", "交換", "キャンセル", "返金"]),
+    ("quality", ["品質", "丈夫", "長持ち", "耐久", "保証"]),
+]
+
+# パラメータ検索 (上から順に判定: パラメータ名, キーワード, 回答テンプレート)
+PARAM_QUERY_KEYWORDS = [
+    ("price", ["価格", "いくら"], "価格は{}です。"),
+    ("weight", ["重さ", "重量"], "重量は{}です。"),
+    ("size", ["サイズ", "寸法", "大きさ"], "サイズは{}です。"),
+]
+
+# 全キーワードリストを 1 つのオートマトンにまとめ、メッセージを 1 回の走査で照合する
+RULE_MATCHER = KeywordMatcher({
+    "negative": NEGATIVE_KEYWORDS,
+    "positive": POSITIVE_KEYWORDS,
+    "objective": OBJECTIVE_KEYWORDS,
+    "polite_ignore": POLITE_IGNORE_KEYWORDS,
+    "strong_negative": STRONG_NEGATIVE_KEYWORDS,
+    "strong_positive": STRONG_POSITIVE_KEYWORDS,
+    **{f"intent:{intent}": keywords for intent, keywords in INTENT_KEYWORDS},
+    **{f"param:{param}": keywords for param, keywords, _ in PARAM_QUERY_KEYWORDS},
+})
+
+
+def dialogue_text(dialogue) -> str:
+    """対話 ("Q:...|||A:..." またはターンのリスト) を学習時と同じく 1 つのテキストに連結"""
+    turns = dialogue.split("|||") if isinstance(dialogue, str) else dialogue
+    return " ".join(t.strip() for t in turns if t.strip())
+
+
+def chat_window_text(history, text: str) -> str:
+    """チャットの直近の履歴 (今回の発話を含む) を、学習データと同じ「Q:…」「A:…」の連結にする
+
+    履歴エントリは "Q: 発話" / "A: 応答" 形式のため、接頭辞の後の空白を除く。
+    今回の発話がまだ履歴にない場合 (predict_satisfaction の直接呼び出し) は末尾に加える。
+    """
+    entries = list(history[-HISTORY_WINDOW:])
+    if not entries or entries[-1] != f"Q: {text}":
+        entries = (entries + [f"Q: {text}"])[-HISTORY_WINDOW:]
+    return dialogue_text([entry[:2] + entry[3:] if entry[:3] in ("Q: ", "A: ") else entry
+                          for entry in entries])
+
 
 class MonotaROInference:
     """MonotaRO Q&A 推論エンジン（モデルベース）"""
     
-    def __init__(self, model_path=None):
-        """初期化"""
+    def __init__(self, model_path=None, quantization=None, precision=None, background=False, rules_only=None):
+        """初期化
+
+        background=True の場合、モデル (XLM-RoBERTa・TuckER) のロードをバックグラウンド
+        スレッドで行い、すぐに返る。ロード完了までの応答はルールベースで行う。
+        rules_only=True (既定は環境変数 RULES_ONLY) の場合はモデルをロードせず、
+        torch / transformers も import しない。
+        """
+        self.rules_only = RULES_ONLY if rules_only is None else rules_only
         self.device = 'cpu'
         self.model = None
         self.tokenizer = None
         self.model_loaded = False
-        self.current_category = None
-        self.current_product = None
-        self.current_price = None  # 訓練データからの実価格
-        self.dialogue_history = []
+        self.model_path = None
+        # 蒸留した student をロードした場合の学習情報 (教師・層数・隠れ次元など)
+        self.student_info = None
+        self.quantization = (quantization or QUANTIZATION).lower()
+        self.quantized_from_cache = False
+        self.precision = 'fp32'
+        self.precision_info = {"requested": (precision or PRECISION).lower(), "selected": 'fp32'}
+        self.batcher = None
+        self.dense_index = None
+        # 満足度カスケードの 1 段目 (HashedNgramClassifier) と、2 段目に回す信頼度の閾値
+        self.cascade = None
+        self.cascade_threshold = CASCADE_THRESHOLD
+        self.cascade_chat = CASCADE_CHAT
+        self.prediction_cache = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL)
+        # 満足度予測・知識グラフ推論用のスレッドプール (初回使用時に作成)
+        self._stage_pool = None
+        self._stage_pool_pid = None
+        self._stage_slots = None
+        self._stage_pool_lock = threading.Lock()
+        # 商品ごとの Q&A 検索インデックス ((カテゴリ, 商品) -> QAIndex、LRU)
+        self._qa_indexes = OrderedDict()
+        self._qa_indexes_lock = threading.Lock()
+        # 特殊トークン・区切り文字のトークンID (トークナイザのロード時に設定)
+        self._special_prefix_ids = []
+        self._special_suffix_ids = []
+        self._separator_ids = []
+        self._question_prefix_ids = []
+        # セッション未指定の呼び出し (デモ・スクリプト) 用のデフォルト対話状態
+        self.default_session = DialogueSession("default")
         
         # KG Model
         self.kg_model = None
@@ -268,20 +467,87 @@ class MonotaROInference:
         self.kg_r2id = {}
         self.kg_id2e = {}
         self.kg_loaded = False
+        # (商品名, 関係) -> Top-k Tail の事前計算表と、その作成情報
+        self.kg_table = {}
+        self.kg_table_info = None
+        
+        # ロード状態 (loading → ready / degraded)
+        self.status = "loading"
+        self.load_error = None
+        self.load_time = None
+        self._ready = threading.Event()
+        self._load_thread = None
         
         # デフォルトのモデルパス
-
         if model_path is None:
-            model_path = os.path.join(parent_dir, "best_model_v2.pt")
+            model_path = MODEL_PATH
+        self.model_path = model_path
         
         print(f"[Inference] Initializing...")
         
+        if background:
+            self._load_thread = threading.Thread(
+                target=self.load_models, args=(model_path,), name="model-loader", daemon=True)
+            self._load_thread.start()
+        else:
+            self.load_models(model_path)
+
+    @property
+    def is_ready(self) -> bool:
+        """モデルのロードが完了したか (失敗した場合も True、以降はルールベースで応答)"""
+        return self._ready.is_set()
+
+    def wait_until_ready(self, timeout=None) -> bool:
+        """モデルのロード完了を待つ"""
+        return self._ready.wait(timeout)
+
+    def after_fork(self, torch_threads=None):
+        """fork したワーカープロセスの初期化 (torch のスレッド数・乱数シード)
+
+        マイクロバッチのワーカースレッドは MicroBatcher が PID の変化を検知して起動し直す。
+        """
+        random.seed()
+        if torch is not None and torch_threads:
+            torch.set_num_threads(torch_threads)
+
+    def load_models(self, model_path):
+        """満足度モデル・密ベクトル検索・知識グラフをロードし、状態を ready / degraded にする"""
+        start = time.time()
+        try:
+            self._load_models(model_path)
+        except Exception as e:
+            print(f"[Inference] Model loading failed: {e}")
+            self.load_error = str(e)
+        self.load_time = time.time() - start
+        self.status = "ready" if self.model_loaded or self.rules_only else "degraded"
+        self._ready.set()
+        print(f"[Inference] Models {self.status} in {self.load_time:.1f}s")
+
+    def _load_models(self, model_path):
+        if self.rules_only:
+            print("[Inference] Rules-only mode: skipping model loading")
+            return
         if TORCH_AVAILABLE and TRANSFORMERS_AVAILABLE:
+            _import_model_libs()
             self._load_model(model_path)
+            if self.model is not None:
+                self._select_precision()
+            if BATCHING_ENABLED and self.model is not None:
+                self.batcher = MicroBatcher(
+                    self._predict_model_batch,
+                    max_batch_size=BATCH_MAX_SIZE,
+                    max_wait_ms=BATCH_MAX_WAIT_MS,
+                    max_queue=BATCH_MAX_QUEUE,
+                    name="satisfaction-batcher",
+                )
+            if self.model is not None:
+                self._load_dense_index()
+                self._load_cascade()
         else:
             print("[Inference] Using rule-based inference (PyTorch/Transformers not available)")
             
         if KG_AVAILABLE and TORCH_AVAILABLE:
+            _import_model_libs(kg=True)
             self._load_kg_model()
 
     
@@ -295,38 +561,57 @@ class MonotaROInference:
                 self.device = 'mps'
             print(f"[Inference] Using device: {self.device}")
             
+            if self.quantization == 'int8' and self.device != 'cpu':
+                print(f"[Inference] int8 quantization is CPU-only; running fp32 on {self.device}")
+                self.quantization = 'none'
+            if self.quantization == 'int8' and self._load_quantized(model_path):
+                return
+            
             backbone = None
             hidden_size = 768
+            student = load_student(model_path)
             
-            # 1. Try XLM-RoBERTa (Primary)
-            try:
-                print("[Inference] Trying to load XLM-RoBERTa...")
-                self.tokenizer = AutoTokenizer.from_pretrained("xlm-roberta-base")
-                backbone = AutoModel.from_pretrained("xlm-roberta-base")
-                hidden_size = backbone.config.hidden_size
-                print("[Inference] Loaded XLM-RoBERTa")
-            except Exception as e:
-                print(f"[Inference] XLM-RoBERTa failed: {e}")
-                
-                # 2. Try BERT Japanese (Secondary)
+            if student is not None:
+                # 蒸留した student: 保存された設定からバックボーンを作る (重みは load_weights でロード)
+                self.tokenizer = AutoTokenizer.from_pretrained(student["tokenizer"])
+                backbone_config = dict(student["backbone_config"])
+                config = AutoConfig.for_model(backbone_config.pop("model_type"), **backbone_config)
+                backbone = AutoModel.from_config(config)
+                hidden_size = config.hidden_size
+                self.student_info = dict(student["info"])
+                print(f"[Inference] Loaded distilled student backbone "
+                      f"({config.num_hidden_layers} layers, hidden {hidden_size})")
+            else:
+                # 1. Try XLM-RoBERTa (Primary)
                 try:
-                    print("[Inference] Trying to load cl-tohoku/bert-base-japanese-v2...")
-                    self.tokenizer = AutoTokenizer.from_pretrained("cl-tohoku/bert-base-japanese-v2")
-                    backbone = AutoModel.from_pretrained("cl-tohoku/bert-base-japanese-v2")
+                    print("[Inference] Trying to load XLM-RoBERTa...")
+                    self.tokenizer = AutoTokenizer.from_pretrained("xlm-roberta-base")
+                    backbone = AutoModel.from_pretrained("xlm-roberta-base")
                     hidden_size = backbone.config.hidden_size
-                    print("[Inference] Loaded cl-tohoku/bert-base-japanese-v2")
-                except Exception as e2:
-                    print(f"[Inference] BERT-Japanese failed: {e2}")
+                    print("[Inference] Loaded XLM-RoBERTa")
+                except Exception as e:
+                    print(f"[Inference] XLM-RoBERTa failed: {e}")
+                
+                    # 2. Try BERT Japanese (Secondary)
+                    try:
+                        print("[Inference] Trying to load cl-tohoku/bert-base-japanese-v2...")
+                        self.tokenizer = AutoTokenizer.from_pretrained("cl-tohoku/bert-base-japanese-v2")
+                        backbone = AutoModel.from_pretrained("cl-tohoku/bert-base-japanese-v2")
+                        hidden_size = backbone.config.hidden_size
+                        print("[Inference] Loaded cl-tohoku/bert-base-japanese-v2")
+                    except Exception as e2:
+                        print(f"[Inference] BERT-Japanese failed: {e2}")
                     
-                    # 3. Fallback to Multilingual BERT
-                    print("[Inference] Falling back to Multilingual BERT...")
-                    self.tokenizer = AutoTokenizer.from_pretrained("bert-base-multilingual-cased")
-                    backbone = AutoModel.from_pretrained("bert-base-multilingual-cased")
-                    hidden_size = 768
+                        # 3. Fallback to Multilingual BERT
+                        print("[Inference] Falling back to Multilingual BERT...")
+                        self.tokenizer = AutoTokenizer.from_pretrained("bert-base-multilingual-cased")
+                        backbone = AutoModel.from_pretrained("bert-base-multilingual-cased")
+                        hidden_size = 768
 
             # 学習時と同じ特殊トークン
             self.tokenizer.add_special_tokens({'additional_special_tokens': ['[NO_TOKEN]']})
             backbone.resize_token_embeddings(len(self.tokenizer))
+            self._prepare_token_segments()
             
             # モデルを構築
             self.model = HighAccuracyClassifierV2(
@@ -337,29 +622,199 @@ class MonotaROInference:
             ).to(self.device)
             
             # 学習済み重みをロード
-            if os.path.exists(model_path):
-                print(f"[Inference] Loading weights from {model_path}")
-                state_dict = torch.load(model_path, map_location=self.device, weights_only=True)
-                # strict=Falseで互換性のある重みのみロード
-                incompatible = self.model.load_state_dict(state_dict, strict=False)
-                if incompatible.missing_keys:
-                    print(f"[Inference] Missing keys: {len(incompatible.missing_keys)}")
-                if incompatible.unexpected_keys:
-                    print(f"[Inference] Unexpected keys: {len(incompatible.unexpected_keys)}")
-                self.model_loaded = True
-                print("[Inference] Model loaded successfully!")
-            else:
-                print(f"[Inference] Model file not found: {model_path}")
+            if not self.load_weights(model_path):
                 print("[Inference] Using randomly initialized weights")
             
             self.model.eval()
             
+            if self.quantization == 'int8':
+                self._quantize_model(model_path)
+            
         except Exception as e:
             print(f"[Inference] Error loading model: {e}")
             import traceback
             traceback.print_exc()
             self.model_loaded = False
+    
+    def _select_precision(self):
+        """推論精度を決定 (auto の場合は fp32 と bf16 autocast を計測して速い方)"""
+        requested = self.precision_info["requested"]
+        if requested not in PRECISIONS:
+            print(f"[Inference] Unknown precision '{requested}', using fp32")
+            requested = 'fp32'
+        if requested != 'fp32' and self.quantization == 'int8':
+            print("[Inference] int8 quantization runs in fp32 activations; ignoring precision setting")
+            requested = 'fp32'
+        
+        self.precision_info = select_precision(requested, self.model, self.device, len(self.tokenizer))
+        self.precision = self.precision_info["selected"]
+        if "speedup" in self.precision_info:
+            print(f"[Inference] Precision auto: fp32 {self.precision_info['fp32_ms']}ms, "
+                  f"bf16 {self.precision_info['bf16_ms']}ms (x{self.precision_info['speedup']}) -> {self.precision}")
+        else:
+            print(f"[Inference] Precision: {self.precision}")
+    
+    def _load_quantized(self, model_path) -> bool:
+        """変換済みの int8 モデルがあればロード (バックボーンの fp32 ロードと変換を省略)"""
+        cache_path = quantized_cache_path(model_path)
+        try:
+            cached = load_quantized(cache_path, model_path)
+            if cached is None:
+                return False
+            
+            tokenizer = AutoTokenizer.from_pretrained(cached["tokenizer"])
+            tokenizer.add_special_tokens({'additional_special_tokens': ['[NO_TOKEN]']})
+            
+            # 事前学習済み重みは読まず、設定からバックボーンの骨組みだけを作る
+            backbone_config = dict(cached["backbone_config"])
+            config = AutoConfig.for_model(backbone_config.pop("model_type"), **backbone_config)
+            backbone = AutoModel.from_config(config)
+            model = quantized_skeleton(HighAccuracyClassifierV2(
+                backbone=backbone,
+                hidden_size=config.hidden_size,
+                topic_num=24,
+                num_classes=3
+            ))
+            load_quantized_state(model, cached)
+        except Exception as e:
+            print(f"[Inference] Could not load quantized cache {cache_path}: {e}")
+            return False
+        
+        self.tokenizer = tokenizer
+        self._prepare_token_segments()
+        self.model = model.eval()
+        self.model_loaded = True
+        self.quantized_from_cache = True
+        student = load_student(model_path)
+        self.student_info = dict(student["info"]) if student is not None else None
+        self.prediction_cache.invalidate()
+        print(f"[Inference] Loaded int8 model from cache: {cache_path}")
+        return True
+    
+    def _quantize_model(self, model_path):
+        """Linear 層を動的 int8 量子化し、学習済み重みから変換した場合はディスクに保存"""
+        start = time.time()
+        self.model = quantize_dynamic_int8(self.model).eval()
+        self.prediction_cache.invalidate()
+        print(f"[Inference] Quantized model to int8 in {time.time() - start:.1f}s")
+        
+        if self.model_loaded:
+            cache_path = quantized_cache_path(model_path)
+            try:
+                save_quantized(self.model, cache_path, model_path, self.tokenizer.name_or_path,
+                               self.model.backbone.config.to_dict())
+                print(f"[Inference] Saved int8 model cache: {cache_path}")
+            except Exception as e:
+                print(f"[Inference] Could not save quantized cache {cache_path}: {e}")
+    
+    def load_weights(self, model_path) -> bool:
+        """学習済み重みを (再) ロードし、推論結果キャッシュを破棄する"""
+        if self.quantization == 'int8' and self.model_loaded:
+            # 量子化済みモジュールには fp32 の state_dict をロードできない
+            print("[Inference] Reloading weights is not supported in int8 mode; restart the server")
+            return False
+        if not os.path.exists(model_path):
+            print(f"[Inference] Model file not found: {model_path}")
+            return False
+        
+        print(f"[Inference] Loading weights from {model_path}")
+        state_dict = torch.load(model_path, map_location=self.device, weights_only=True)
+        if is_student(state_dict):
+            state_dict = state_dict["state_dict"]
+        # strict=Falseで互換性のある重みのみロード
+        incompatible = self.model.load_state_dict(state_dict, strict=False)
+        if incompatible.missing_keys:
+            print(f"[Inference] Missing keys: {len(incompatible.missing_keys)}")
+        if incompatible.unexpected_keys:
+            print(f"[Inference] Unexpected keys: {len(incompatible.unexpected_keys)}")
+        # 古い重みでの推論結果は使えない
+        self.prediction_cache.invalidate()
+        self.model_loaded = True
+        print("[Inference] Model loaded successfully!")
+        return True
             
+    def _load_dense_index(self):
+        """Q&A 埋め込み行列をメモリマップでロード (存在する場合のみ)"""
+        if not NUMPY_AVAILABLE or not os.path.exists(DENSE_INDEX_PATH) or not os.path.exists(DENSE_IDS_PATH):
+            return
+        try:
+            index = DenseQAIndex(DENSE_INDEX_PATH, DENSE_IDS_PATH)
+            if index.dim != self.model.hidden_size:
+                print(f"[Inference] Dense index dim {index.dim} != model hidden size {self.model.hidden_size}, skipped")
+                return
+            model_name = self.model.backbone.config.name_or_path
+            if index.model != model_name:
+                print(f"[Inference] Dense index built with {index.model!r}, not {model_name!r}, skipped")
+                return
+            self.dense_index = index
+            print(f"[Inference] Dense QA index mapped: {len(index)} questions from {DENSE_INDEX_PATH}")
+        except Exception as e:
+            print(f"[Inference] Could not load dense QA index: {e}")
+
+    def _load_cascade(self):
+        """満足度カスケードの 1 段目をロード (CASCADE が有効で、重みファイルがある場合のみ)"""
+        if not CASCADE_ENABLED or not NUMPY_AVAILABLE or not os.path.exists(CASCADE_MODEL_PATH):
+            return
+        try:
+            from ngram_classifier import HashedNgramClassifier
+            self.cascade = HashedNgramClassifier.load(CASCADE_MODEL_PATH)
+            print(f"[Inference] Cascade first tier loaded from {CASCADE_MODEL_PATH} "
+                  f"(threshold {self.cascade_threshold})")
+        except Exception as e:
+            print(f"[Inference] Could not load cascade model: {e}")
+
+    def embed_texts(self, texts: list, batch_size: int = 32):
+        """バックボーンの平均プーリング埋め込み (L2 正規化済み, float32 の numpy 配列)"""
+        import numpy as np
+        
+        backbone = self.model.backbone
+        vectors = []
+        for i in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(
+                texts[i:i + batch_size],
+                max_length=MAX_SEQ_LENGTH,
+                truncation=True,
+                padding='longest',
+                return_tensors='pt'
+            )
+            input_ids = encoded['input_ids'].to(self.device)
+            attention_mask = encoded['attention_mask'].to(self.device)
+            with torch.no_grad(), autocast_context(self.device, self.precision):
+                outputs = backbone(input_ids, attention_mask=attention_mask)
+                hidden = outputs.last_hidden_state if hasattr(outputs, 'last_hidden_state') else outputs[0]
+                mask = attention_mask.unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+                pooled = torch.nn.functional.normalize(pooled.float(), dim=-1)
+            vectors.append(pooled.float().cpu().numpy())
+        
+        if not vectors:
+            return np.zeros((0, self.model.hidden_size), dtype=np.float32)
+        return np.concatenate(vectors, axis=0)
+
+    def search_qa_dense(self, query: str, session=None, k: int = 5) -> list:
+        """密ベクトル検索で類似質問の上位 k 件を返す (選択中の商品・カテゴリで絞り込み)"""
+        session = session or self.default_session
+        if self.dense_index is None:
+            return []
+        
+        category = CATEGORY_LIST[session.current_category] if session.current_category is not None else None
+        product = session.current_product if category is not None else None
+        query_vec = self.embed_texts([query])[0]
+        
+        hits = self.dense_index.search(query_vec, k=k, category=category, product=product)
+        for hit in hits:
+            if (hit["category"], hit["product"]) == (category, product):
+                qa_list = session.current_qa_list
+            else:
+                qa_list = (CATALOG.get(hit["category"], hit["product"]) or {}).get("qa", [])
+            qa = qa_list[hit["qa_index"]] if hit["qa_index"] < len(qa_list) else {}
+            # カタログ更新後の古い行列では行番号が別の質問を指すため、埋め込んだ質問と一致する行だけを使う
+            if qa.get("q") != hit["question"]:
+                qa = {}
+            hit["q"] = qa.get("q")
+            hit["a"] = qa.get("a")
+        return [hit for hit in hits if hit["a"] is not None]
+
     def _load_kg_model(self):
         """知識グラフモデル (TuckER) をロード"""
         try:
@@ -389,6 +844,8 @@ class MonotaROInference:
                 self.kg_model.eval()
                 self.kg_loaded = True
                 print("[Inference] KG Model loaded successfully!")
+                if KG_PRECOMPUTE:
+                    self._load_kg_table(model_path, mapping_path)
             else:
                 print("[Inference] KG model/mapping not found. Run reproduce/train_tucker_kg.py first.")
         except Exception as e:
@@ -396,20 +853,47 @@ class MonotaROInference:
             import traceback
             traceback.print_exc()
 
+    def _load_kg_table(self, model_path, mapping_path):
+        """全カタログ商品 × インテントの関係の Top-k を事前計算 (保存済みで有効ならロード)"""
+        products = sorted({p for products in CATEGORY_PRODUCTS.values() for p in products})
+        relations = sorted(set(KG_RELATION_MAP.values()) | {KG_DEFAULT_RELATION})
+        table_path = kg_table_path(model_path)
+        start = time.time()
+        try:
+            table_fingerprint = fingerprint(model_path, mapping_path, products, relations, KG_TOP_K)
+            table = load_kg_table(table_path, table_fingerprint) if KG_PRECOMPUTE_PERSIST else None
+            source = "cache"
+            if table is None:
+                table = build_kg_table(self.kg_model, self.kg_e2id, self.kg_r2id, self.kg_id2e,
+                                       products, relations, KG_TOP_K)
+                source = "computed"
+                if KG_PRECOMPUTE_PERSIST:
+                    try:
+                        save_kg_table(table_path, table, table_fingerprint)
+                    except Exception as e:
+                        print(f"[Inference] Could not save KG table {table_path}: {e}")
+        except Exception as e:
+            print(f"[Inference] Could not precompute KG table: {e}")
+            return
+        self.kg_table = table
+        self.kg_table_info = {"entries": len(table), "source": source,
+                              "build_ms": round((time.time() - start) * 1000, 1)}
+        print(f"[Inference] KG table {source}: {len(products)} products x {len(relations)} relations "
+              f"in {self.kg_table_info['build_ms']}ms")
+
     def predict_kg_tail(self, head_entity: str, relation: str) -> list:
-        """知識グラフで推論 (Head, Relation, ?) -> Top 3 Tails"""
+        """知識グラフで推論 (Head, Relation, ?) -> Top 3 Tails (事前計算表にあれば参照のみ)"""
         if not self.kg_loaded:
             return []
+        
+        start = time.perf_counter()
+        tails = self.kg_table.get((head_entity, relation))
+        if tails is not None:
+            STAGE_SECONDS.observe("knowledge_graph", time.perf_counter() - start)
+            return list(tails)
             
         # 安全策: 部分一致でエンティティを探す
-        h_id = self.kg_e2id.get(head_entity)
-        if h_id is None:
-            # 簡易サーチ
-            for name, eid in self.kg_e2id.items():
-                if head_entity in name or name in head_entity:
-                    h_id = eid
-                    break
-        
+        h_id = resolve_entity(self.kg_e2id, head_entity)
         r_id = self.kg_r2id.get(relation)
         
         if h_id is not None and r_id is not None:
@@ -420,25 +904,28 @@ class MonotaROInference:
                     
                     pred = self.kg_model.forward(h_tensor, r_tensor)
                     # Get top 3
-                    scores, indices = torch.topk(pred, 3)
+                    scores, indices = torch.topk(pred, min(KG_TOP_K, pred.size(1)))
                     
                     results = []
                     for idx in indices[0]:
                         ent_name = self.kg_id2e.get(idx.item(), "Unknown")
                         results.append(ent_name)
+                    STAGE_SECONDS.observe("knowledge_graph", time.perf_counter() - start)
                     return results
             except Exception as e:
+                ERRORS.inc("knowledge_graph")
                 print(f"[Inference] KG Predict Error: {e}")
         
         return []
 
-    def set_category(self, category_idx: int) -> dict:
+    def set_category(self, category_idx: int, session=None) -> dict:
 
         """カテゴリを設定"""
+        session = session or self.default_session
         if 0 <= category_idx < len(CATEGORY_LIST):
-            self.current_category = category_idx
-            self.current_product = None
-            self.dialogue_history = []
+            session.current_category = category_idx
+            session.reset_product()
+            session.clear_history()
             
             products = CATEGORY_PRODUCTS.get(category_idx, [])
             return {
@@ -450,312 +937,665 @@ class MonotaROInference:
             }
         return {"success": False, "error": "無効なカテゴリです"}
     
-    def set_product(self, product_name: str) -> dict:
+    def set_product(self, product_name: str, session=None) -> dict:
         """商品を設定（訓練データの詳細情報を使用）"""
-        if self.current_category is None:
+        session = session or self.default_session
+        if session.current_category is None:
             return {"success": False, "error": "先にカテゴリを選択してください"}
         
-        category_name = CATEGORY_LIST[self.current_category]
-        products = CATEGORY_PRODUCTS.get(self.current_category, [])
-        
-        # 訓練データにある商品も含める
-        real_products = list(REAL_PRODUCT_DATA.get(category_name, {}).keys())
-        all_products = list(set(products + real_products))
+        category_name = CATEGORY_LIST[session.current_category]
         
-        if product_name in all_products:
-            self.current_product = product_name
-            self.dialogue_history = []
+        if (category_name, product_name) in CATALOG:
+            session.current_product = product_name
+            session.clear_history()
             
-            # 訓練データから情報を取得
-            product_info = REAL_PRODUCT_DATA.get(category_name, {}).get(product_name, {})
-            self.current_params = product_info.get("params", {})
-            self.current_qa_list = product_info.get("qa", [])
+            # 訓練データから情報を取得 (この商品のレコードだけをデコード)
+            product_info = CATALOG.get(category_name, product_name) or {}
+            session.current_params = product_info.get("params", {})
+            session.current_qa_list = product_info.get("qa", [])
+            session.current_qa_index = self._get_qa_index(category_name, product_name, session.current_qa_list)
             
             # 価格設定
-            price_str = self.current_params.get("price", "9,800円")
+            price_str = session.current_params.get("price", "9,800円")
             # "9,800円" -> 9800
             try:
-                self.current_price = int(price_str.replace(",", "").replace("円", ""))
+                session.current_price = int(price_str.replace(",", "").replace("円", ""))
             except:
-                self.current_price = 9800
+                session.current_price = 9800
             
             return {
                 "success": True,
                 "product": product_name,
-                "price": self.current_price,
+                "price": session.current_price,
                 "category": category_name,
                 "message": f"「{product_name}」が選択されました。ご質問をどうぞ。"
             }
         return {"success": False, "error": f"「{product_name}」は選択できません"}
 
-    def _find_best_match_qa(self, query: str) -> str:
-        """訓練データから最も類似した質問への回答を検索"""
-        if not self.current_qa_list:
+    def _get_qa_index(self, category: str, product: str, qa_list: list):
+        """商品の Q&A 検索インデックスを取得 (未構築なら構築して LRU に保持)"""
+        if not qa_list:
             return None
-            
-        best_ratio = 0.0
-        best_answer = None
-        
-        from difflib import SequenceMatcher
-        
-        for qa in self.current_qa_list:
-            q_text = qa["q"]
-            # 単純な類似度計算
-            ratio = SequenceMatcher(None, query, q_text).ratio()
-            if ratio > best_ratio:
-                best_ratio = ratio
-                best_answer = qa["a"]
+        key = (category, product)
+        with self._qa_indexes_lock:
+            index = self._qa_indexes.get(key)
+            if index is not None:
+                self._qa_indexes.move_to_end(key)
+                return index
         
+        index = QAIndex(qa_list)
+        with self._qa_indexes_lock:
+            self._qa_indexes[key] = index
+            while len(self._qa_indexes) > QA_INDEX_CACHE_SIZE:
+                self._qa_indexes.popitem(last=False)
+        return index
+
+    def _find_best_match_qa(self, query: str, session=None) -> str:
+        """訓練データから最も類似した質問への回答を検索"""
+        hits = self.search_qa(query, session, k=1)
         # 閾値を設定（あまりに低い場合はマッチしないとする）
-        if best_ratio > 0.6:
-            return best_answer
+        if hits and hits[0]["score"] > QA_MATCH_THRESHOLD:
+            return hits[0]["a"]
         return None
 
-    def predict_satisfaction(self, text: str) -> int:
+    def search_qa(self, query: str, session=None, k: int = 5) -> list:
+        """現在の商品の Q&A から類似質問の上位 k 件をスコア付きで返す"""
+        session = session or self.default_session
+        if session.current_qa_index is None:
+            return []
+        return session.current_qa_index.search(query, k=k)
+
+    def predict_satisfaction(self, text: str, session=None, matches=None) -> int:
         """ルール + モデルを使用して満足度を予測"""
+        session = session or self.default_session
+        if matches is None:
+            matches = RULE_MATCHER.match(text)
         
+        result, item = self._prepare_satisfaction(text, session, matches)
+        if result is not None:
+            return result
+        return self._predict_satisfaction_model(text, item, matches)
+
+    def _prepare_satisfaction(self, text: str, session, matches):
+        """満足度予測のうち、ルールとモデル入力の作成まで (セッションを参照するのはここまで)
+
+        Returns:
+            ルール (またはカスケードの 1 段目) で決まった場合は (満足度, None)、
+            トランスフォーマーでの推論が必要な場合は (None, モデル入力)
+        """
         # まず、明確なキーワードをルールベースでチェック（最優先）
-        rule_result = self._check_obvious_sentiment(text)
+        rule_result = self._check_obvious_sentiment(text, matches)
         if rule_result is not None:
-            return rule_result
+            return rule_result, None
         
-        # モデルが利用可能な場合は、モデルで予測
-        if self.model is not None and self.tokenizer is not None:
+        # モデルが利用可能な場合は、モデルで予測 (ロード中はルールベース)
+        if self.is_ready and self.model is not None and self.tokenizer is not None:
+            # カスケードの 1 段目で十分な信頼度があれば、トランスフォーマーを使わない
+            if self.cascade is not None and self.cascade_chat:
+                category = CATEGORY_LIST[session.current_category] if session.current_category is not None else None
+                prediction, confidence = self.cascade.predict(
+                    chat_window_text(session.dialogue_history, text), category)
+                if confidence >= self.cascade_threshold:
+                    CASCADE_DECISIONS.inc("ngram")
+                    return self._finalize_model_prediction(text, prediction, confidence, matches), None
+                CASCADE_DECISIONS.inc("transformer")
             try:
-                full_text = " ||| ".join(self.dialogue_history[-5:] + [text])
-                
-                encoded = self.tokenizer(
-                    full_text,
-                    max_length=256,
-                    truncation=True,
-                    padding='max_length',
-                    return_tensors='pt'
-                )
-                
-                input_ids = encoded['input_ids'].to(self.device)
-                attention_mask = encoded['attention_mask'].to(self.device)
-                topic = torch.tensor([self.current_category or 0]).to(self.device)
-                
-                with torch.no_grad():
-                    logits = self.model(input_ids, attention_mask, topic)
-                    probs = torch.softmax(logits, dim=1)
-                    prediction = torch.argmax(logits, dim=1).item()
-                    confidence = probs[0, prediction].item()
-                
-                # --- Safety Net for Model Prediction ---
-                # モデルが「不満(0)」と予測しても、客観的な質問キーワードやクッション言葉が含まれ、かつ強いネガティブ語がない場合は「普通(1)」に補正
-                if prediction == 0:
-                    is_objective = any(k in text for k in OBJECTIVE_KEYWORDS)
-                    is_polite = any(k in text for k in POLITE_IGNORE_KEYWORDS)
-                    has_strong_negative = any(k in text for k in NEGATIVE_KEYWORDS)
-                    
-                    if (is_objective or is_polite) and not has_strong_negative:
-                        print(f"[Inference] Override model prediction 0 -> 1 (Objective/Polite: {text})")
-                        return 1
-
-                # 信頼度が低い場合はルールベースにフォールバック
-                if confidence < 0.5:
-                    return self._predict_satisfaction_rule_based(text)
-                
-                return prediction
-                
+                start = time.perf_counter()
+                input_ids = self._encode_dialogue(text, session)
+                STAGE_SECONDS.observe("tokenization", time.perf_counter() - start)
+                return None, (input_ids, session.current_category or 0)
             except Exception as e:
+                ERRORS.inc("satisfaction")
                 print(f"[Inference] Model prediction error: {e}")
         
         # フォールバック: ルールベース
-        return self._predict_satisfaction_rule_based(text)
+        return self._predict_satisfaction_rule_based(text, matches), None
+
+    def _predict_satisfaction_model(self, text: str, item, matches) -> int:
+        """モデル入力から満足度を予測 (セッションに触れないため、別スレッドで実行できる)"""
+        try:
+            prediction, confidence = self._predict_model(item)
+            return self._finalize_model_prediction(text, prediction, confidence, matches)
+        except Exception as e:
+            ERRORS.inc("satisfaction")
+            print(f"[Inference] Model prediction error: {e}")
+        
+        # フォールバック: ルールベース
+        return self._predict_satisfaction_rule_based(text, matches)
     
-    def _check_obvious_sentiment(self, text: str) -> int:
-        """明確な感情表現をチェック（最優先）"""
+    def _finalize_model_prediction(self, text: str, prediction: int, confidence: float, matches) -> int:
+        """モデル (カスケードの各段) の予測に安全策と低信頼度のフォールバックを適用"""
+        # --- Safety Net for Model Prediction ---
+        # モデルが「不満(0)」と予測しても、客観的な質問キーワードやクッション言葉が含まれ、かつ強いネガティブ語がない場合は「普通(1)」に補正
+        if prediction == 0:
+            is_objective = "objective" in matches
+            is_polite = "polite_ignore" in matches
+            has_strong_negative = "negative" in matches
+            
+            if (is_objective or is_polite) and not has_strong_negative:
+                print(f"[Inference] Override model prediction 0 -> 1 (Objective/Polite: {text})")
+                RULE_OVERRIDES.inc()
+                return 1
+
+        # 信頼度が低い場合はルールベースにフォールバック
+        if confidence < 0.5:
+            LOW_CONFIDENCE_FALLBACKS.inc()
+            return self._predict_satisfaction_rule_based(text, matches)
+        
+        return prediction
+
+    def score_dialogues(self, items: list) -> list:
+        """対話全体の満足度をまとめて予測 (セッションを使わない、/api/score_batch・score_dialogues.py 用)
+
+        学習時と同じく全ターンを連結してトークン化し、学習時のカテゴリ順でトピックIDを付け、
+        長さバケットごとにパディングした 1 バッチで推論する。モデルがない場合はルールベース。
+        カスケードが有効な場合は、1 段目の信頼度が閾値未満の対話だけをトランスフォーマーで推論する。
+
+        Args:
+            items: [(対話, カテゴリ名)]。対話は "Q:...|||A:..." 形式の文字列、またはターンのリスト
+        Returns:
+            [{"satisfaction", "satisfaction_label", "satisfaction_class", "confidence", "model_based"}]
+        """
+        texts = [dialogue_text(dialogue) for dialogue, _ in items]
+        category_list = TRAIN_CATEGORY_LIST or CATEGORY_LIST
+        model_based = self.is_ready and self.model_loaded
+        if model_based:
+            predictions = [None] * len(items)
+            escalated = list(range(len(items)))
+            if self.cascade is not None:
+                escalated = []
+                for i, (text, (_, category)) in enumerate(zip(texts, items)):
+                    prediction, confidence = self.cascade.predict(text, category)
+                    if confidence >= self.cascade_threshold:
+                        predictions[i] = (prediction, confidence)
+                    else:
+                        escalated.append(i)
+                CASCADE_DECISIONS.inc("ngram", len(items) - len(escalated))
+                CASCADE_DECISIONS.inc("transformer", len(escalated))
+            if escalated:
+                id_lists = self.tokenizer([texts[i] for i in escalated], max_length=MAX_SEQ_LENGTH,
+                                          truncation=True)['input_ids']
+                topics = [category_list.index(items[i][1]) if items[i][1] in category_list else 0 for i in escalated]
+                for i, result in zip(escalated, self._forward_token_batch(id_lists, topics)):
+                    predictions[i] = result
+        else:
+            predictions = [(self._predict_satisfaction_rule_based(text), None) for text in texts]
+
+        results = []
+        for satisfaction, confidence in predictions:
+            sat_info = SATISFACTION_LABELS[satisfaction]
+            results.append({
+                "satisfaction": satisfaction,
+                "satisfaction_label": f"{sat_info['label']} {sat_info['emoji']}",
+                "satisfaction_class": sat_info['class'],
+                "confidence": round(confidence, 4) if confidence is not None else None,
+                "model_based": model_based,
+            })
+        return results
+
+    def _predict_model(self, item):
+        """1 件のモデル推論 (キャッシュ → バッチャー経由、キューが満杯なら直接実行)"""
+        cache = self.prediction_cache
+        if cache.enabled:
+            key = prediction_key(*item)
+            cached = cache.get(key)
+            if cached is not None:
+                CACHE_LOOKUPS.inc("hit")
+                return cached
+            CACHE_LOOKUPS.inc("miss")
+            generation = cache.generation
+        
+        result = None
+        if self.batcher is not None:
+            try:
+                result = self.batcher.predict(item)
+            except BatchQueueFull:
+                pass
+        if result is None:
+            result = self._predict_model_batch([item])[0]
+        
+        if cache.enabled:
+            cache.put(key, result, generation)
+        return result
+
+    def _prepare_token_segments(self):
+        """特殊トークンと履歴区切りのトークンIDを一度だけ求める"""
+        special_ids = self.tokenizer("")['input_ids']
+        self._special_prefix_ids = special_ids[:1]
+        self._special_suffix_ids = special_ids[1:]
+        # 前後の空白は各セグメント側のトークン化で付くため、区切りは記号のみをトークン化する
+        self._separator_ids = self._encode_segment(HISTORY_SEPARATOR.strip())
+        self._question_prefix_ids = self._encode_segment("Q:")
+
+    def _encode_segment(self, text: str) -> list:
+        """1 発話分をトークン化 (特殊トークンなし)"""
+        if getattr(self.tokenizer, 'is_fast', False):
+            # BatchEncoding を作らずに Rust 実装を直接呼ぶ (短い文字列では数倍速い)
+            return self.tokenizer.backend_tokenizer.encode(text, add_special_tokens=False).ids
+        return self.tokenizer(text, add_special_tokens=False)['input_ids']
+
+    def _encode_dialogue(self, text: str, session=None) -> list:
+        """直近の履歴 + 発話をモデル入力のトークンID列に変換
+
+        履歴エントリのトークンIDはセッションにキャッシュし、毎ターン新しい発話だけを
+        トークン化する。連結後は学習時と同様に右側を切り詰める。
+        """
+        session = session or self.default_session
+        cache = session.cached_token_ids(self.tokenizer)
+        start = max(0, len(session.dialogue_history) - HISTORY_WINDOW)
+        
+        text_ids = self._encode_segment(text)
+        segments = []
+        for idx in range(start, len(session.dialogue_history)):
+            if cache[idx] is None:
+                entry = session.dialogue_history[idx]
+                if entry == f"Q: {text}":
+                    # 今回の発話を記録した Q エントリは、発話のトークンを再利用する
+                    cache[idx] = self._question_prefix_ids + text_ids
+                else:
+                    cache[idx] = self._encode_segment(entry)
+            segments.append(cache[idx])
+        segments.append(text_ids)
+        
+        budget = MAX_SEQ_LENGTH - len(self._special_prefix_ids) - len(self._special_suffix_ids)
+        ids = []
+        for i, segment in enumerate(segments):
+            if i > 0:
+                ids.extend(self._separator_ids)
+            ids.extend(segment)
+            if len(ids) >= budget:
+                break
+        return self._special_prefix_ids + ids[:budget] + self._special_suffix_ids
+
+    def _predict_model_batch(self, items):
+        """(トークンID列, トピックID) のリストを 1 バッチで推論し、(予測, 信頼度) のリストを返す"""
+        return self._forward_token_batch([ids for ids, _ in items], [topic for _, topic in items])
+
+    def _forward_token_batch(self, id_lists, topics):
+        """トークンID列を長さバケットごとに動的パディングして推論"""
+        buckets = {}
+        for i, ids in enumerate(id_lists):
+            bucket = next((b for b in LENGTH_BUCKETS if len(ids) <= b), LENGTH_BUCKETS[-1])
+            buckets.setdefault(bucket, []).append(i)
         
-        # 強いネガティブ表現 (誤検知を防ぐため、明らかに感情的なものに限定)
-        strong_negative = [
-            "最悪", "ひどい", 
-            "クレーム", "怒", "腹立", "失望", "残念", "ふざけ", "二度と", "金返せ", "詐欺",
-            "対応が悪い", "態度が悪い"
-        ]
-        # 文脈依存の単語 ("返品"など) はリストから除外
+        pad_id = self.tokenizer.pad_token_id or 0
+        results = [None] * len(id_lists)
+        start = time.perf_counter()
+        for indices in buckets.values():
+            # 固定長ではなく、バケット内の最長系列までパディング
+            max_len = max(len(id_lists[i]) for i in indices)
+            input_ids = torch.full((len(indices), max_len), pad_id, dtype=torch.long)
+            attention_mask = torch.zeros((len(indices), max_len), dtype=torch.long)
+            for row, i in enumerate(indices):
+                ids = id_lists[i]
+                input_ids[row, :len(ids)] = torch.tensor(ids, dtype=torch.long)
+                attention_mask[row, :len(ids)] = 1
+            topic_tensor = torch.tensor([topics[i] for i in indices])
+            
+            with torch.no_grad(), autocast_context(self.device, self.precision):
+                logits = self.model(input_ids.to(self.device), attention_mask.to(self.device),
+                                    topic_tensor.to(self.device))
+                probs = torch.softmax(logits.float(), dim=1)
+                confidences, predictions = probs.max(dim=1)
+            
+            for i, pred, conf in zip(indices, predictions.tolist(), confidences.tolist()):
+                results[i] = (pred, conf)
+        
+        STAGE_SECONDS.observe("model_forward", time.perf_counter() - start)
+        return results
+
+    def get_batching_stats(self) -> dict:
+        """マイクロバッチの統計を取得"""
+        if self.batcher is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.batcher.stats()}
+
+    def get_readiness(self) -> dict:
+        """ロード状態と各コンポーネントの可否"""
+        return {
+            "status": self.status,
+            "mode": "rules_only" if self.rules_only else "model",
+            "components": {
+                "satisfaction_model": self.is_ready and self.model_loaded,
+                "dense_index": self.is_ready and self.dense_index is not None,
+                "knowledge_graph": self.is_ready and self.kg_loaded,
+            },
+            "load_time_s": round(self.load_time, 2) if self.load_time is not None else None,
+            "error": self.load_error,
+        }
+
+    def get_model_info(self) -> dict:
+        """モデルの実行設定 (デバイス・量子化・精度・重みファイル)"""
+        return {
+            "device": self.device,
+            "quantization": self.quantization,
+            "quantized_from_cache": self.quantized_from_cache,
+            "precision": self.precision_info,
+            "weights": os.path.basename(self.model_path) if self.model_path else None,
+            "student": self.student_info,
+        }
+
+    def get_kg_table_stats(self) -> dict:
+        """知識グラフの事前計算表 (件数・作成元・作成時間)"""
+        if not self.kg_table_info:
+            return {"enabled": False}
+        return {"enabled": True, **self.kg_table_info}
+
+    def get_cascade_stats(self) -> dict:
+        """満足度カスケードの設定と、トランスフォーマーに回した割合 (プリフォーク時は全ワーカーの合計)"""
+        accepted = CASCADE_DECISIONS.value("ngram")
+        escalated = CASCADE_DECISIONS.value("transformer")
+        total = accepted + escalated
+        return {
+            "enabled": self.cascade is not None,
+            "chat": self.cascade is not None and self.cascade_chat,
+            "threshold": self.cascade_threshold,
+            "first_tier": int(accepted),
+            "escalated": int(escalated),
+            "escalation_rate": round(escalated / total, 4) if total else None,
+        }
+
+    def get_cache_stats(self) -> dict:
+        """推論結果キャッシュの統計を取得"""
+        return self.prediction_cache.stats()
+
+    def _check_obvious_sentiment(self, text: str, matches=None) -> int:
+        """明確な感情表現をチェック（最優先）"""
+        if matches is None:
+            matches = RULE_MATCHER.match(text)
         
-        for keyword in strong_negative:
-            if keyword in text:
-                return 0  # 不満
+        # 強いネガティブ表現
+        if "strong_negative" in matches:
+            return 0  # 不満
         
         # 客観的な質問の場合、ここで「普通」と確定させる (Safety Net 1)
         # これにより、モデルや他のルールが誤って不満と判定するのを防ぐ
-        is_objective = any(k in text for k in OBJECTIVE_KEYWORDS)
-        is_polite = any(k in text for k in POLITE_IGNORE_KEYWORDS)
-        has_negative_context = any(k in text for k in NEGATIVE_KEYWORDS)
+        is_objective = "objective" in matches
+        is_polite = "polite_ignore" in matches
+        has_negative_context = "negative" in matches
         
         if (is_objective or is_polite) and not has_negative_context:
              return 1 # 普通
         
         # 強いポジティブ表現
-        strong_positive = [
-            "ありがとう", "感謝", "助かり", "嬉しい", "満足", "最高",
-            "素晴らしい", "完璧", "おすすめ", "気に入", "良かった", "いい感じ"
-        ]
-        for keyword in strong_positive:
-            if keyword in text:
-                return 2  # 満足
+        if "strong_positive" in matches:
+            return 2  # 満足
         
         return None  # 明確な判断ができない場合
     
-    def _predict_satisfaction_rule_based(self, text: str) -> int:
+    def _predict_satisfaction_rule_based(self, text: str, matches=None) -> int:
         """ルールベースの満足度予測（フォールバック）"""
+        if matches is None:
+            matches = RULE_MATCHER.match(text)
         # ネガティブチェック
-        for keyword in NEGATIVE_KEYWORDS:
-            if keyword in text:
-                return 0
+        if "negative" in matches:
+            return 0
         
         # ポジティブチェック
-        for keyword in POSITIVE_KEYWORDS:
-            if keyword in text:
-                return 2
+        if "positive" in matches:
+            return 2
         
         # デフォルトは普通
         return 1
     
-    def detect_intent(self, text: str) -> str:
+    def detect_intent(self, text: str, matches=None) -> str:
         """インテントを検出"""
-        text_lower = text.lower()
-        
-        # 挨拶
-        if any(w in text for w in ["こんにちは", "おはよう", "こんばんは", "はじめまして", "よろしく"]):
-            return "greeting"
-        
-        # 感謝
-        if any(w in text for w in ["ありがとう", "サンキュー", "感謝", "助かり"]):
-            return "thanks"
-        
-        # クレーム
-        if any(w in text for w in NEGATIVE_KEYWORDS[:10]):
-            return "complaint"
-        
-        # 価格
-        if any(w in text for w in ["いくら", "値段", "価格", "円", "お金", "コスト", "なんぼ", "おいくら"]):
-            return "price"
-        
-        # 在庫
-        if any(w in text for w in ["在庫", "ある", "ありますか", "入荷", "品切れ", "売り切れ", "ございますか"]):
-            return "stock"
+        if matches is None:
+            matches = RULE_MATCHER.match(text)
         
-        # 配送
-        if any(w in text for w in ["届く", "届き", "配送", "納期", "発送", "いつ届く", "配達", "何日"]):
-            return "delivery"
-        
-        # スペック
-        if any(w in text for w in ["サイズ", "寸法", "重さ", "重量", "スペック", "仕様", "大きさ"]):
-            return "spec"
-        
-        # おすすめ
-        if any(w in text for w in ["おすすめ", "オススメ", "選び方", "どれがいい", "比較", "人気"]):
-            return "recommend"
-        
-        # 返品
-        if any(w in text for w in ["返品", "交換", "キャンセル", "返金"]):
-            return "return"
-        
-        # 品質
-        if any(w in text for w in ["品質", "丈夫", "長持ち", "耐久", "保証"]):
-            return "quality"
+        # 挨拶 → 感謝 → クレーム → 価格 → 在庫 → 配送 → スペック → おすすめ → 返品 → 品質 の順
+        for intent, _ in INTENT_KEYWORDS:
+            if f"intent:{intent}" in matches:
+                return intent
         
         return "fallback"
 
-    def generate_response(self, message: str) -> dict:
+    def _get_stage_pool(self):
+        """段階実行用のスレッドプールと空きスロットのセマフォ (fork 後の子プロセスでは作り直す)"""
+        pid = os.getpid()
+        if self._stage_pool is None or self._stage_pool_pid != pid:
+            with self._stage_pool_lock:
+                if self._stage_pool is None or self._stage_pool_pid != pid:
+                    self._stage_slots = threading.BoundedSemaphore(STAGE_POOL_SIZE)
+                    self._stage_pool = ThreadPoolExecutor(max_workers=STAGE_POOL_SIZE, thread_name_prefix="stage")
+                    self._stage_pool_pid = pid
+        return self._stage_pool, self._stage_slots
+
+    def _submit_stage(self, fn, *args):
+        """段階をスレッドプールに投入する (空きスロットがない場合は投入せず None)
+
+        実行中・待機中の段階をプールの大きさまでに抑え、期限に間に合わない処理がキューに溜まらないようにする。
+        スロットは段階の終了 (キャンセルを含む) 時に返す。
+        """
+        pool, slots = self._get_stage_pool()
+        if not slots.acquire(blocking=False):
+            return None
+        try:
+            future = pool.submit(fn, *args)
+        except Exception:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+    @staticmethod
+    def _timed(fn, *args):
+        """fn を実行し、(結果, 実行時間 ms) を返す"""
+        start = time.perf_counter()
+        result = fn(*args)
+        return result, (time.perf_counter() - start) * 1000
+
+    @staticmethod
+    def _join_stage(future, deadline):
+        """段階の結果を期限まで待つ (期限切れ・失敗の場合は None、期限切れの段階はキャンセルする)"""
+        try:
+            return future.result(timeout=max(0.0, deadline - time.perf_counter()))
+        except FutureTimeoutError:
+            future.cancel()
+            return None
+        except Exception as e:
+            ERRORS.inc("stage")
+            print(f"[Inference] Stage error: {e}")
+            return None
+
+    def generate_response(self, message: str, session=None) -> dict:
         """応答を生成（RAG + ルール + モデル）"""
+        result = None
+        for event, data in self.generate_response_stages(message, session):
+            if event == "done":
+                result = data
+        return result
+
+    def generate_response_stages(self, message: str, session=None):
+        """応答を段階ごとに生成するジェネレータ (/api/chat/stream 用)
+
+        回答 (検索・テンプレート) → 満足度 → 知識グラフ推論の順に、各段階が終わった時点で返す。
+        満足度のモデル推論と知識グラフ推論は互いに独立しているため、スレッドプールで並行に実行し、
+        STAGE_TIMEOUT_MS までに終わらなかった段階の結果は使わない (満足度はルールベースで代替、
+        知識グラフ推論は省略) で partial として返す。スレッドプールに空きがない場合は段階を投入せず、
+        同じく代替・省略する。各段階の時間は done の debug に含める。
+
+        Yields:
+            (event, data)。event は "answer" / "satisfaction" / "insight" (推論結果がある場合のみ) /
+            "done" (data は generate_response() の戻り値と同じ)
+        """
+        session = session or self.default_session
         # 対話履歴に追加
-        self.dialogue_history.append(f"Q: {message}")
-        
-        # 意図検出 (共通で使用)
-        detected_intent = self.detect_intent(message)
-        
-        # 1. 訓練データからの検索 (Retrieval)
-        retrieved_answer = self._find_best_match_qa(message)
-        
-        # 2. パラメータ検索 (Spec retrieval)
-        extracted_param_ans = None
-        if not retrieved_answer:
-            # 簡易的なパラメータ抽出
-            if "価格" in message or "いくら" in message:
-                if "price" in self.current_params:
-                    extracted_param_ans = f"価格は{self.current_params['price']}です。"
-            elif "重さ" in message or "重量" in message:
-                 if "weight" in self.current_params:
-                    extracted_param_ans = f"重量は{self.current_params['weight']}です。"
-            elif "サイズ" in message or "寸法" in message or "大きさ" in message:
-                 if "size" in self.current_params:
-                    extracted_param_ans = f"サイズは{self.current_params['size']}です。"
-            
-            if extracted_param_ans:
-                retrieved_answer = extracted_param_ans
+        session.append_history(f"Q: {message}")
+        response = None
+        start = time.perf_counter()
+        timings = {}
+        timed_out = []
+        shed = []
+        satisfaction_future = None
+        kg_future = None
+        try:
+            # キーワード照合 (メッセージを 1 回だけ走査し、各ルールで共有)
+            matches = RULE_MATCHER.match(message)
 
-        # 満足度予測 (共通処理)
-        if self.model_loaded:
-            satisfaction = self.predict_satisfaction(message)
-        else:
-            satisfaction = self._predict_satisfaction_rule_based(message)
-
-        # 3. 知識グラフ推論 (Reasoning)
-        kg_insight = None
-        if self.kg_loaded and self.current_product:
-            # インテントから関係性をマッピング
-            rel_map = {
-                "price": "属性", # "価格"関係がないので属性として推論
-                "spec": "属性",
-                "quality": "属性",
-                "recommend": "カテゴリ"
+            # 意図検出 (共通で使用)
+            detected_intent = self.detect_intent(message, matches)
+            retrieval_start = time.perf_counter()
+            STAGE_SECONDS.observe("intent_detection", retrieval_start - start)
+
+            # 1. 訓練データからの検索 (Retrieval)
+            retrieved_answer = self._find_best_match_qa(message, session)
+
+            # 2. パラメータ検索 (Spec retrieval)
+            extracted_param_ans = None
+            if not retrieved_answer:
+                # 簡易的なパラメータ抽出
+                for param, _, template in PARAM_QUERY_KEYWORDS:
+                    if f"param:{param}" in matches:
+                        if param in session.current_params:
+                            extracted_param_ans = template.format(session.current_params[param])
+                        break
+
+                if extracted_param_ans:
+                    retrieved_answer = extracted_param_ans
+
+            # 3. 密ベクトル検索 (表記が異なる類似質問)
+            if not retrieved_answer and self.is_ready and self.dense_index is not None:
+                try:
+                    hits = self.search_qa_dense(message, session, k=1)
+                    if hits and hits[0]["score"] >= DENSE_MATCH_THRESHOLD:
+                        retrieved_answer = hits[0]["a"]
+                except Exception as e:
+                    ERRORS.inc("dense_retrieval")
+                    print(f"[Inference] Dense retrieval error: {e}")
+            STAGE_SECONDS.observe("retrieval", time.perf_counter() - retrieval_start)
+
+            # 応答の決定
+            if retrieved_answer:
+                response = retrieved_answer
+                intent = "retrieval"
+            else:
+                # フォールバック: 既存のロジック
+                intent = detected_intent
+
+                # 応答テンプレートを選択
+                templates = RESPONSE_TEMPLATES.get(intent, RESPONSE_TEMPLATES["fallback"])
+                response_template = random.choice(templates)
+
+                # テンプレート変数を置換
+                product = session.current_product or "商品"
+                category = CATEGORY_LIST[session.current_category] if session.current_category is not None else "商品"
+                price = session.current_price or 9802
+
+                response = response_template.format(
+                    product=product,
+                    category=category,
+                    price=f"{price:,}"
+                )
+
+            category_name = CATEGORY_LIST[session.current_category] if session.current_category is not None else "Unknown"
+            product_name = session.current_product or "Unknown"
+            timings["answer"] = (time.perf_counter() - start) * 1000
+
+            # 満足度のモデル推論と知識グラフ推論をスレッドプールで並行に開始する
+            # (セッションの参照はこのスレッドで済ませ、各段階にはその結果だけを渡す)
+            stage_start = time.perf_counter()
+            deadline = stage_start + STAGE_TIMEOUT_MS / 1000
+            model_based = self.is_ready and self.model_loaded
+            if model_based:
+                satisfaction, model_input = self._prepare_satisfaction(message, session, matches)
+            else:
+                satisfaction, model_input = self._predict_satisfaction_rule_based(message, matches), None
+            # ルール・モデル入力の作成にかかった時間 (モデル推論の時間は後で加算)
+            timings["satisfaction"] = (time.perf_counter() - stage_start) * 1000
+            if model_input is not None:
+                satisfaction_future = self._submit_stage(
+                    self._timed, self._predict_satisfaction_model, message, model_input, matches)
+                if satisfaction_future is None:
+                    shed.append("satisfaction")
+                    STAGE_SHED.inc("satisfaction")
+                    satisfaction = self._predict_satisfaction_rule_based(message, matches)
+                    model_based = False
+
+            kg_preds = None
+            if self.is_ready and self.kg_loaded and session.current_product:
+                # インテントから関係性をマッピング
+                target_rel = KG_RELATION_MAP.get(detected_intent, KG_DEFAULT_RELATION)
+                if (session.current_product, target_rel) in self.kg_table:
+                    # 事前計算表にある組は参照だけなのでスレッドプールを使わない
+                    kg_preds, timings["knowledge_graph"] = self._timed(
+                        self.predict_kg_tail, session.current_product, target_rel)
+                else:
+                    kg_future = self._submit_stage(
+                        self._timed, self.predict_kg_tail, session.current_product, target_rel)
+                    if kg_future is None:
+                        shed.append("knowledge_graph")
+                        STAGE_SHED.inc("knowledge_graph")
+
+            yield "answer", {
+                "response": response,
+                "category": category_name,
+                "product": product_name,
+                "intent": intent,
             }
-            target_rel = rel_map.get(detected_intent, "属性")
-            
-            kg_preds = self.predict_kg_tail(self.current_product, target_rel)
-            if kg_preds:
-                kg_insight = f"【AI推論】知識グラフによると、{self.current_product}は「{', '.join(kg_preds)}」と関連があります。"
 
-        # 応答の決定
-        if retrieved_answer:
-            response = retrieved_answer
-            intent = "retrieval"
-        else:
-            # フォールバック: 既存のロジック
-            intent = detected_intent
-            
-            # 応答テンプレートを選択
-            templates = RESPONSE_TEMPLATES.get(intent, RESPONSE_TEMPLATES["fallback"])
-            response_template = random.choice(templates)
-            
-            # テンプレート変数を置換
-            product = self.current_product or "商品"
-            category = CATEGORY_LIST[self.current_category] if self.current_category is not None else "商品"
-            price = self.current_price or 9802
+            # 満足度予測 (共通処理、モデルのロード中・期限切れの場合はルールベース)
+            if satisfaction_future is not None:
+                outcome = self._join_stage(satisfaction_future, deadline)
+                if outcome is None:
+                    timed_out.append("satisfaction")
+                    STAGE_TIMEOUTS.inc("satisfaction")
+                    timings.pop("satisfaction", None)
+                    satisfaction = self._predict_satisfaction_rule_based(message, matches)
+                    model_based = False
+                else:
+                    satisfaction, model_ms = outcome
+                    timings["satisfaction"] += model_ms
+            sat_info = SATISFACTION_LABELS[satisfaction]
+            satisfaction_result = {
+                "satisfaction": satisfaction,
+                "satisfaction_label": f"{sat_info['label']} {sat_info['emoji']}",
+                "satisfaction_class": sat_info['class'],
+                "model_based": model_based,
+            }
+            yield "satisfaction", satisfaction_result
 
-            
-            response = response_template.format(
-                product=product,
-                category=category,
-                price=f"{price:,}"
-            )
+            # 4. 知識グラフ推論 (Reasoning)
+            kg_insight = None
+            if kg_future is not None:
+                outcome = self._join_stage(kg_future, deadline)
+                if outcome is None:
+                    timed_out.append("knowledge_graph")
+                    STAGE_TIMEOUTS.inc("knowledge_graph")
+                else:
+                    kg_preds, timings["knowledge_graph"] = outcome
+            if kg_preds:
+                kg_insight = f"【AI推論】知識グラフによると、{session.current_product}は「{', '.join(kg_preds)}」と関連があります。"
 
-        
-        # KG推論結果を付与
-        if kg_insight:
-            response += f"\n\n{kg_insight}"
-        
-        sat_info = SATISFACTION_LABELS[satisfaction]
+            # KG推論結果を付与
+            if kg_insight:
+                response += f"\n\n{kg_insight}"
+                yield "insight", {"insight": kg_insight}
 
-        
-        # 対話履歴に追加
-        self.dialogue_history.append(f"A: {response}")
-        
-        return {
-            "response": response,
-            "satisfaction": satisfaction,
-            "satisfaction_label": f"{sat_info['label']} {sat_info['emoji']}",
-            "satisfaction_class": sat_info['class'],
-            "category": CATEGORY_LIST[self.current_category] if self.current_category is not None else "Unknown",
-            "product": self.current_product or "Unknown",
-            "intent": intent,
-            "model_based": self.model_loaded,
-        }
+            total = time.perf_counter() - start
+            STAGE_SECONDS.observe("request", total)
+            yield "done", {
+                "response": response,
+                **satisfaction_result,
+                "category": category_name,
+                "product": product_name,
+                "intent": intent,
+                "partial": bool(timed_out or shed),
+                "debug": {
+                    "timings_ms": {**{k: round(v, 2) for k, v in timings.items()},
+                                   "total": round(total * 1000, 2)},
+                    "timed_out": timed_out,
+                    "shed": shed,
+                },
+            }
+        finally:
+            # ストリームが途中で閉じられた場合などに、まだ始まっていない段階を残さない
+            for future in (satisfaction_future, kg_future):
+                if future is not None:
+                    future.cancel()
+            # 対話履歴に追加 (ストリームが途中で閉じられた場合は、それまでの応答)
+            if response is not None:
+                session.append_history(f"A: {response}")
     
     def get_categories(self) -> list:
         """カテゴリ一覧を取得"""
@@ -765,30 +1605,34 @@ class MonotaROInference:
         """指定カテゴリの商品一覧を取得"""
         return CATEGORY_PRODUCTS.get(category_id, [])
     
-    def reset_dialogue(self):
+    def reset_dialogue(self, session=None):
         """対話をリセット"""
-        self.dialogue_history = []
+        session = session or self.default_session
+        session.clear_history()
         return {"success": True, "message": "対話履歴がリセットされました"}
 
 
 # グローバルインスタンス
 _inference_engine = None
+_inference_engine_lock = threading.Lock()
 
 
 def get_inference_engine():
-    """シングルトンパターンでインスタンスを取得"""
+    """シングルトンパターンでインスタンスを取得 (モデルは BACKGROUND_LOADING ならバックグラウンドでロード)"""
     global _inference_engine
     if _inference_engine is None:
-        _inference_engine = MonotaROInference()
+        with _inference_engine_lock:
+            if _inference_engine is None:
+                _inference_engine = MonotaROInference(background=BACKGROUND_LOADING)
     return _inference_engine
 
 
 
 
-def generate_response(message: str) -> dict:
+def generate_response(message: str, session=None) -> dict:
     """便利関数"""
     engine = get_inference_engine()
-    return engine.generate_response(message)
+    return engine.generate_response(message, session)
 
 
 # テスト
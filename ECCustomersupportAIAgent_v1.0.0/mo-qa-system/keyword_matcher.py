@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Keyword Matcher
+Aho-Corasick オートマトンによる複数キーワードリストの一括照合
+
+起動時にすべてのキーワードリストから 1 つのオートマトンを構築し、
+メッセージを 1 回走査するだけで、一致したキーワードとその所属リストを得る。
+重なり合うキーワード (例: "助かり" と "助かりました") もすべて検出する。
+"""
+
+from collections import deque
+
+
+class KeywordMatches:
+    """1 メッセージ分の照合結果"""
+
+    __slots__ = ("groups", "keywords")
+
+    def __init__(self, groups, keywords):
+        self.groups = groups
+        self.keywords = keywords
+
+    def __contains__(self, group):
+        return group in self.groups
+
+    def has(self, group) -> bool:
+        """指定リストのキーワードが 1 つ以上含まれるか"""
+        return group in self.groups
+
+    def __repr__(self):
+        return f"KeywordMatches(groups={sorted(self.groups)}, keywords={sorted(self.keywords)})"
+
+
+class KeywordMatcher:
+    """名前付きキーワードリストの Aho-Corasick 照合器
+
+    Args:
+        groups: {リスト名: [キーワード, ...]}
+    """
+
+    def __init__(self, groups: dict):
+        self.group_names = list(groups)
+        # ノードごとの遷移・失敗リンク・出力 (リスト名 / キーワード)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out_groups = [frozenset()]
+        self._out_keywords = [()]
+
+        pending = {}
+        for name, keywords in groups.items():
+            for keyword in keywords:
+                if keyword:
+                    pending.setdefault(keyword, set()).add(name)
+
+        for keyword, names in pending.items():
+            node = self._insert(keyword)
+            self._out_groups[node] = self._out_groups[node] | frozenset(names)
+            self._out_keywords[node] = self._out_keywords[node] + (keyword,)
+
+        self._build_failure_links()
+
+    def _insert(self, keyword: str) -> int:
+        node = 0
+        for ch in keyword:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out_groups.append(frozenset())
+                self._out_keywords.append(())
+                self._goto[node][ch] = nxt
+            node = nxt
+        return node
+
+    def _build_failure_links(self):
+        """幅優先で失敗リンクを張り、失敗先の出力をマージする"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                self._out_groups[child] = self._out_groups[child] | self._out_groups[self._fail[child]]
+                self._out_keywords[child] = self._out_keywords[child] + self._out_keywords[self._fail[child]]
+                queue.append(child)
+
+    def match(self, text: str) -> KeywordMatches:
+        """テキストを 1 回走査し、一致したリスト名とキーワードを返す"""
+        goto = self._goto
+        fail = self._fail
+        out_groups = self._out_groups
+        hit_nodes = set()
+
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out_groups[node]:
+                hit_nodes.add(node)
+
+        groups = set()
+        keywords = set()
+        for node in hit_nodes:
+            groups.update(out_groups[node])
+            keywords.update(self._out_keywords[node])
+        return KeywordMatches(groups, keywords)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Precomputed KG Insight Table
+全カタログ商品 × インテントの関係について、TuckER の Top-k 推論結果を事前計算した表
+
+チャットのたびに predict_kg_tail で全エンティティのスコアを計算する代わりに、KG モデルのロード時に
+(商品名, 関係) -> [Tail, ...] の dict をバッチ推論でまとめて作る。エンティティが見つからない商品・
+存在しない関係は空リストとして登録し、すべての組をチャット時の dict 参照で済ませる。
+
+表はモデルファイルの隣 (例: TuckER_model_trained.topk.pkl) に保存し、モデル・マッピングファイル・
+商品一覧・関係・k が同じ間は次回起動時に再利用する (どれかが変われば作り直す)。
+"""
+
+import hashlib
+import os
+import pickle
+
+TABLE_BATCH_SIZE = 256
+
+
+def kg_table_path(model_path: str) -> str:
+    """事前計算表のパス (KG モデルファイルの隣)"""
+    return os.path.splitext(model_path)[0] + ".topk.pkl"
+
+
+def resolve_entity(e2id: dict, name: str):
+    """エンティティ ID (完全一致がなければ部分一致、見つからなければ None)"""
+    entity_id = e2id.get(name)
+    if entity_id is None:
+        for entity, eid in e2id.items():
+            if name in entity or entity in name:
+                return eid
+    return entity_id
+
+
+def fingerprint(model_path: str, mapping_path: str, products, relations, top_k: int) -> dict:
+    """表の有効性を判定する情報 (モデル・マッピングファイル、商品一覧、関係、k)"""
+    files = {}
+    for key, path in (("model", model_path), ("mappings", mapping_path)):
+        stat = os.stat(path)
+        files[key] = [stat.st_size, stat.st_mtime_ns]
+    products_hash = hashlib.sha1("\n".join(sorted(products)).encode("utf-8")).hexdigest()
+    return {"files": files, "products": products_hash, "relations": sorted(relations), "top_k": top_k}
+
+
+def build_kg_table(model, e2id: dict, r2id: dict, id2e: dict, products, relations, top_k: int,
+                   batch_size=TABLE_BATCH_SIZE) -> dict:
+    """(商品名, 関係) -> Top-k Tail のリスト (異なる (Head, 関係) の組だけをバッチでスコア計算)"""
+    import torch
+
+    table = {}
+    pairs = {}
+    for product in products:
+        h_id = resolve_entity(e2id, product)
+        for relation in relations:
+            r_id = r2id.get(relation)
+            if h_id is None or r_id is None:
+                table[(product, relation)] = []
+            else:
+                pairs.setdefault((h_id, r_id), []).append((product, relation))
+
+    id_pairs = list(pairs)
+    k = min(top_k, len(e2id))
+    with torch.no_grad():
+        for start in range(0, len(id_pairs), batch_size):
+            batch = id_pairs[start:start + batch_size]
+            heads = torch.tensor([h for h, _ in batch])
+            rels = torch.tensor([r for _, r in batch])
+            _, indices = torch.topk(model.forward(heads, rels), k, dim=1)
+            for pair, row in zip(batch, indices.tolist()):
+                tails = [id2e.get(idx, "Unknown") for idx in row]
+                for key in pairs[pair]:
+                    table[key] = tails
+    return table
+
+
+def save_kg_table(path: str, table: dict, table_fingerprint: dict):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump({"fingerprint": table_fingerprint, "table": table}, f)
+    os.replace(tmp_path, path)
+
+
+def load_kg_table(path: str, table_fingerprint: dict):
+    """保存済みの表 (ファイルがない・古い場合は None)"""
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        payload = pickle.load(f)
+    if payload.get("fingerprint") != table_fingerprint:
+        return None
+    return payload["table"]
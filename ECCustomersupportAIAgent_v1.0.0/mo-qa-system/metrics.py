@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Metrics
+段階ごとのレイテンシのヒストグラムとカウンタ (Prometheus テキスト形式で出力)
+
+常時有効にできるよう、記録は固定のバケット境界への bisect と数個の加算だけにしている。
+値はプロセス間で共有する匿名メモリマップに置き、プロセス (スロット) ごとに書き込む領域を分ける。
+プリフォーク起動ではワーカーごとに set_slot() でスロットを切り替え、出力時に全スロットを合計する
+(どのワーカーが /api/metrics に応答しても、全ワーカーの合計が返る)。
+
+ラベルの値はメトリクスの定義時に列挙しておく (記録時に領域を確保しないため)。
+"""
+
+import bisect
+import mmap
+import os
+import threading
+
+# 既定のレイテンシのバケット境界 (秒)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# スロット数 (マスター / 単一プロセス + ワーカー数 WORKERS) と、スロットあたりの値の数
+DEFAULT_SLOTS = max(1, int(os.environ.get('WORKERS', 1))) + 1
+DEFAULT_CAPACITY = 2048
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+def _format_labels(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class MetricsRegistry:
+    """メトリクスの登録と、共有メモリ上の値の管理"""
+
+    def __init__(self, slots=DEFAULT_SLOTS, capacity=DEFAULT_CAPACITY):
+        self.slots = slots
+        self.capacity = capacity
+        self.enabled = True
+        self._buffer = mmap.mmap(-1, slots * capacity * 8)
+        self._values = memoryview(self._buffer).cast("d")
+        self._used = 0
+        self._slot = 0
+        self._lock = threading.Lock()
+        self._metrics = []
+
+    def _allocate(self, size: int) -> int:
+        if self._used + size > self.capacity:
+            raise ValueError(f"metrics capacity exceeded ({self.capacity} values per slot)")
+        offset = self._used
+        self._used += size
+        return offset
+
+    def set_slot(self, slot: int):
+        """このプロセスが書き込むスロット (プリフォークのワーカーは 1 以上)"""
+        if not 0 <= slot < self.slots:
+            raise ValueError(f"metrics slot {slot} out of range (0-{self.slots - 1})")
+        self._slot = slot
+
+    def _add(self, offset: int, amount: float):
+        index = self._slot * self.capacity + offset
+        with self._lock:
+            self._values[index] += amount
+
+    def _total(self, offset: int) -> float:
+        return sum(self._values[slot * self.capacity + offset] for slot in range(self.slots))
+
+    def counter(self, name, help_text, label=None, label_values=()):
+        metric = Counter(self, name, help_text, label, label_values)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, label=None, label_values=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(self, name, help_text, label, label_values, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus テキスト形式 (全スロットの合計)"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class Counter:
+    """単調増加のカウンタ (ラベルは 1 つまで)"""
+
+    def __init__(self, registry, name, help_text, label=None, label_values=()):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.label = label
+        values = tuple(label_values) if label else (None,)
+        self._offsets = {value: registry._allocate(1) for value in values}
+
+    def inc(self, label_value=None, amount=1.0):
+        if self.registry.enabled:
+            self.registry._add(self._offsets[label_value], amount)
+
+    def value(self, label_value=None) -> float:
+        return self.registry._total(self._offsets[label_value])
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_value, offset in self._offsets.items():
+            labels = _format_labels([(self.label, label_value)] if self.label else [])
+            lines.append(f"{self.name}{labels} {_format_value(self.registry._total(offset))}")
+        return lines
+
+
+class Histogram:
+    """固定バケットのヒストグラム (ラベルは 1 つまで)
+
+    1 系列あたり [各バケットの件数 (+Inf を含む), 合計, 件数] を連続した領域に置く。
+    """
+
+    def __init__(self, registry, name, help_text, label=None, label_values=(), buckets=DEFAULT_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.buckets = tuple(sorted(buckets))
+        values = tuple(label_values) if label else (None,)
+        self._width = len(self.buckets) + 3
+        self._offsets = {value: registry._allocate(self._width) for value in values}
+
+    def observe(self, label_value, seconds: float):
+        registry = self.registry
+        if not registry.enabled:
+            return
+        base = registry._slot * registry.capacity + self._offsets[label_value]
+        bucket = bisect.bisect_left(self.buckets, seconds)
+        values = registry._values
+        with registry._lock:
+            values[base + bucket] += 1
+            values[base + self._width - 2] += seconds
+            values[base + self._width - 1] += 1
+
+    def snapshot(self, label_value=None) -> dict:
+        """{"buckets": [バケットごとの件数 (累積ではない)], "sum", "count"} (全スロットの合計)"""
+        offset = self._offsets[label_value]
+        totals = [self.registry._total(offset + i) for i in range(self._width)]
+        return {"buckets": totals[:-2], "sum": totals[-2], "count": totals[-1]}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_value in self._offsets:
+            base_labels = [(self.label, label_value)] if self.label else []
+            snap = self.snapshot(label_value)
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), snap["buckets"]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(base_labels + [('le', le)])} "
+                             f"{_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(base_labels)} {_format_value(snap['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(base_labels)} {_format_value(snap['count'])}")
+        return lines
+
+
+# アプリケーション全体のレジストリ
+REGISTRY = MetricsRegistry()
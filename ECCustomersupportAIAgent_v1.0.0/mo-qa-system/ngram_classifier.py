@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Hashed Char N-gram Classifier
+満足度カスケードの 1 段目: 文字 n-gram のハッシュ特徴量 + 線形モデル (NumPy のみ)
+
+- 特徴量は文字 1〜3-gram の出現回数を zlib.crc32 で NUM_FEATURES 次元にハッシュし、
+  log(1 + 回数) を L2 正規化したもの (カテゴリ名も 1 特徴量として加える)
+- モデルは 3 クラスの多クラスロジスティック回帰 (train() は NumPy のミニバッチ SGD)
+- 重みは .npz (W: (特徴量数, クラス数) float32, b, 設定) で保存する
+
+信頼度 (最大クラス確率) が閾値未満の入力だけを HighAccuracyClassifierV2 に回す
+(閾値とカスケードの組み込みは inference.py の CASCADE_* を参照)。
+"""
+
+import zlib
+
+import numpy as np
+
+NUM_FEATURES = 2 ** 18
+NGRAM_SIZES = (1, 2, 3)
+NUM_CLASSES = 3
+
+
+class HashedNgramClassifier:
+    """文字 n-gram のハッシュ特徴量による線形分類器"""
+
+    def __init__(self, weights=None, bias=None, num_features=NUM_FEATURES, ngram_sizes=NGRAM_SIZES,
+                 num_classes=NUM_CLASSES):
+        self.num_features = num_features
+        self.ngram_sizes = tuple(ngram_sizes)
+        self.num_classes = num_classes
+        self.weights = weights if weights is not None else np.zeros((num_features, num_classes), dtype=np.float32)
+        self.bias = bias if bias is not None else np.zeros(num_classes, dtype=np.float32)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(weights=data["weights"], bias=data["bias"], num_features=int(data["num_features"]),
+                       ngram_sizes=tuple(int(n) for n in data["ngram_sizes"]),
+                       num_classes=int(data["weights"].shape[1]))
+
+    def save(self, path):
+        np.savez(path, weights=self.weights.astype(np.float32), bias=self.bias.astype(np.float32),
+                 num_features=np.int64(self.num_features), ngram_sizes=np.array(self.ngram_sizes, dtype=np.int64))
+
+    def features(self, text: str, category=None):
+        """(特徴量インデックス, 値) の配列 (インデックスは重複なし)"""
+        hashes = []
+        for n in self.ngram_sizes:
+            for i in range(len(text) - n + 1):
+                hashes.append(zlib.crc32(text[i:i + n].encode("utf-8")))
+        if category:
+            hashes.append(zlib.crc32(f"\x00category:{category}".encode("utf-8")))
+        if not hashes:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        indices, counts = np.unique(np.array(hashes, dtype=np.int64) % self.num_features, return_counts=True)
+        values = np.log1p(counts).astype(np.float32)
+        values /= np.sqrt(np.dot(values, values))
+        return indices, values
+
+    def predict_proba(self, text: str, category=None):
+        indices, values = self.features(text, category)
+        logits = values @ self.weights[indices] + self.bias
+        logits = np.exp(logits - logits.max())
+        return logits / logits.sum()
+
+    def predict(self, text: str, category=None):
+        """(予測クラス, 信頼度)"""
+        probs = self.predict_proba(text, category)
+        pred = int(probs.argmax())
+        return pred, float(probs[pred])
+
+    def train(self, texts, categories, labels, epochs=20, batch_size=64, lr=2.0, class_weights=None, seed=0,
+              log=None):
+        """ミニバッチ SGD で学習 (重み付きクロスエントロピー)
+
+        Args:
+            class_weights: クラスごとの損失の重み (None の場合は出現頻度の逆数、学習時の Focal Loss の alpha と同じ)
+            log: エポックごとに (エポック, 平均損失) を受け取る関数
+        """
+        rng = np.random.default_rng(seed)
+        labels = np.asarray(labels, dtype=np.int64)
+        if class_weights is None:
+            counts = np.bincount(labels, minlength=self.num_classes).astype(np.float32)
+            class_weights = counts.sum() / (self.num_classes * np.maximum(counts, 1))
+        class_weights = np.asarray(class_weights, dtype=np.float32)
+
+        # CSR 形式の特徴量行列
+        rows = [self.features(text, category) for text, category in zip(texts, categories)]
+        lengths = np.array([len(indices) for indices, _ in rows], dtype=np.int64)
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+        all_indices = np.concatenate([indices for indices, _ in rows])
+        all_values = np.concatenate([values for _, values in rows])
+
+        for epoch in range(epochs):
+            step_lr = lr / (1 + epoch)
+            order = rng.permutation(len(labels))
+            total_loss = 0.0
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                batch = batch[lengths[batch] > 0]
+                if len(batch) == 0:
+                    continue
+                idx = np.concatenate([all_indices[indptr[i]:indptr[i + 1]] for i in batch])
+                val = np.concatenate([all_values[indptr[i]:indptr[i + 1]] for i in batch])
+                offsets = np.concatenate([[0], np.cumsum(lengths[batch])[:-1]])
+
+                logits = np.add.reduceat(self.weights[idx] * val[:, None], offsets, axis=0) + self.bias
+                logits -= logits.max(axis=1, keepdims=True)
+                probs = np.exp(logits)
+                probs /= probs.sum(axis=1, keepdims=True)
+                y = labels[batch]
+                w = class_weights[y]
+                total_loss += float(-(w * np.log(probs[np.arange(len(y)), y] + 1e-12)).sum())
+
+                grad = probs
+                grad[np.arange(len(y)), y] -= 1.0
+                grad *= (w / len(y))[:, None]
+                row_grad = np.repeat(grad, lengths[batch], axis=0) * val[:, None]
+                np.add.at(self.weights, idx, -step_lr * row_grad)
+                self.bias -= step_lr * grad.sum(axis=0)
+            if log is not None:
+                log(epoch + 1, total_loss / len(labels))
+        return self
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Inference Precision
+満足度モデルの推論精度 (fp32 / bf16 autocast) の選択
+
+auto の場合は起動時に短いマイクロベンチマークで fp32 と bf16 autocast の
+フォワード時間を比較し、速い方を採用する。bf16 の採用には BF16_MIN_SPEEDUP 以上の
+高速化を要求する (誤差の範囲の差で精度を落とさないため)。
+"""
+
+import contextlib
+import time
+
+PRECISIONS = ("fp32", "bf16", "auto")
+BF16_MIN_SPEEDUP = 1.1
+
+# bf16 演算をハードウェアで持つ CPU フラグ (/proc/cpuinfo)
+_BF16_CPU_FLAGS = ("avx512_bf16", "amx_bf16")
+
+
+def cpu_bf16_flags() -> list:
+    """CPU が持つ bf16 関連の命令セットフラグ (Linux 以外・取得できない場合は空)"""
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    flags = set(line.split(":", 1)[1].split())
+                    return [flag for flag in _BF16_CPU_FLAGS if flag in flags]
+    except OSError:
+        pass
+    return []
+
+
+def autocast_context(device: str, precision: str):
+    """推論時の autocast コンテキスト (fp32 なら何もしない)"""
+    if precision != "bf16":
+        return contextlib.nullcontext()
+    import torch
+
+    device_type = "cuda" if device == "cuda" else "cpu"
+    return torch.autocast(device_type=device_type, dtype=torch.bfloat16)
+
+
+def benchmark_precisions(model, device: str, vocab_size: int, batch_size=8, seq_len=64, iterations=5) -> dict:
+    """fp32 と bf16 autocast のフォワード時間 (ms/バッチ、中央値) を計測"""
+    import torch
+
+    generator = torch.Generator().manual_seed(0)
+    input_ids = torch.randint(5, max(vocab_size, 6), (batch_size, seq_len), generator=generator).to(device)
+    attention_mask = torch.ones_like(input_ids)
+    topics = torch.zeros(batch_size, dtype=torch.long, device=device)
+
+    timings = {}
+    for precision in ("fp32", "bf16"):
+        samples = []
+        with torch.no_grad(), autocast_context(device, precision):
+            model(input_ids, attention_mask, topics)  # ウォームアップ
+            for _ in range(iterations):
+                start = time.perf_counter()
+                model(input_ids, attention_mask, topics)
+                samples.append((time.perf_counter() - start) * 1000)
+        timings[precision] = sorted(samples)[len(samples) // 2]
+    return timings
+
+
+def select_precision(requested: str, model, device: str, vocab_size: int) -> dict:
+    """要求された精度から実際に使う精度を決める
+
+    Returns:
+        {"requested", "selected", "cpu_bf16_flags", "fp32_ms", "bf16_ms", "speedup"}
+        (計測値は auto の場合のみ)
+    """
+    info = {
+        "requested": requested,
+        "selected": "fp32" if requested == "auto" else requested,
+        "cpu_bf16_flags": cpu_bf16_flags() if device == "cpu" else [],
+    }
+    if requested != "auto":
+        return info
+
+    try:
+        timings = benchmark_precisions(model, device, vocab_size)
+    except Exception as e:
+        # bf16 autocast が使えない環境では fp32 のまま
+        info["error"] = str(e)
+        return info
+
+    speedup = timings["fp32"] / timings["bf16"] if timings["bf16"] > 0 else 0.0
+    info.update({
+        "fp32_ms": round(timings["fp32"], 2),
+        "bf16_ms": round(timings["bf16"], 2),
+        "speedup": round(speedup, 2),
+        "selected": "bf16" if speedup >= BF16_MIN_SPEEDUP else "fp32",
+    })
+    return info
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Prediction Cache
+満足度モデルの推論結果をキャッシュする LRU (+ 任意の TTL)
+
+キーは「最終的なトークンID列 + トピックID」のハッシュ。同じ商品・同じ短い質問・
+空の履歴のように、モデル入力が完全に一致するターンではフォワードを省略できる。
+重みを再ロードしたときは invalidate() で全エントリを破棄する。
+"""
+
+import hashlib
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+
+# デフォルト設定
+DEFAULT_MAX_ENTRIES = 4096        # 保持するエントリ数の上限 (LRU で追い出し)
+DEFAULT_TTL_SECONDS = 0           # 0 以下なら有効期限なし
+
+
+def prediction_key(token_ids, topic) -> bytes:
+    """トークンID列とトピックIDからキャッシュキーを作る"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(array('I', token_ids).tobytes())
+    digest.update(int(topic).to_bytes(4, 'little', signed=True))
+    return digest.digest()
+
+
+class PredictionCache:
+    """スレッドセーフな推論結果の LRU キャッシュ"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl_seconds = float(ttl_seconds)
+
+        self._entries = OrderedDict()   # key -> (value, stored_at)
+        self._lock = threading.Lock()
+        # 重みの世代 (invalidate のたびに増え、古い世代の put は無視する)
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.expired = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key):
+        """キャッシュされた値 (なければ None)"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, stored_at = entry
+            if self.ttl_seconds > 0 and time.time() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, generation=None):
+        """値を保存 (generation が現在の世代と異なる場合は保存しない)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+
+    def invalidate(self):
+        """全エントリを破棄 (モデルの重みが変わったとき)"""
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+            self.invalidations += 1
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evicted": self.evicted,
+                "expired": self.expired,
+                "invalidations": self.invalidations,
+                "generation": self.generation,
+            }
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Pre-fork Server
+エンジン (モデル・トークナイザ・カタログ・検索インデックス) をマスタープロセスで 1 回だけ
+ロードし、N 個のワーカープロセスを fork するマルチプロセス起動モード
+
+- fork 前に gc.freeze() でロード済みのオブジェクトを GC の対象外にし、ワーカーの GC が
+  参照カウント以外の理由で共有ページに書き込む (コピーオンライトが発生する) のを防ぐ
+- ワーカーごとに torch のスレッド数を (CPU コア数 / ワーカー数) に制限し、
+  コアの取り合いを防ぐ
+- セッション状態は各ワーカーのメモリにあるため、マスターが接続を受け付けて
+  リクエストヘッダーのセッション ID (X-Session-ID / Cookie) から担当ワーカーを決め、
+  接続のファイルディスクリプタを UNIX ソケットで渡す。ワーカーが発行するセッション ID は
+  自分に振り分けられるものに限る (SessionStore.shard)
+- ヘッダーの到着待ちはセレクタによるノンブロッキング処理で、遅いクライアントが他の接続の
+  受け付けを止めることはない。ヘッダーが揃った接続だけを振り分け、期限 (HEADER_TIMEOUT) までに
+  揃わない接続は 408、大きすぎるヘッダーは 431、待機中の接続が上限を超えた場合は 503 で閉じる
+- ワーカーが異常終了した場合は、マスターが同じ番号のワーカーを fork し直す
+
+POSIX (fork と SCM_RIGHTS) 専用。
+"""
+
+import gc
+import itertools
+import os
+import selectors
+import signal
+import socket
+import sys
+import time
+import traceback
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from session_store import is_valid_session_id, session_shard
+
+# セッション ID を探すリクエストヘッダーの最大長、ヘッダーを待つ時間と同時に待つ接続数の上限
+PEEK_MAX_BYTES = 8192
+HEADER_TIMEOUT = float(os.environ.get('HEADER_TIMEOUT', 10))
+MAX_PENDING_CONNECTIONS = int(os.environ.get('MAX_PENDING_CONNECTIONS', 1024))
+# ヘッダーが途中まで届いた接続を覗き直す間隔 (秒)
+PEEK_RETRY_INTERVAL = 0.005
+
+_ERROR_RESPONSES = {
+    408: b"HTTP/1.0 408 Request Timeout\r\nContent-Length: 0\r\nConnection: close\r\n\r\n",
+    431: b"HTTP/1.0 431 Request Header Fields Too Large\r\nContent-Length: 0\r\nConnection: close\r\n\r\n",
+    503: b"HTTP/1.0 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n",
+}
+
+
+class _CloseRequestHandler(WSGIRequestHandler):
+    """1 接続 1 リクエスト (keep-alive の接続上で別セッションのリクエストが届かないようにする)"""
+    protocol_version = "HTTP/1.0"
+
+
+def _session_id_from_headers(data: bytes, header_name: str, cookie_name: str):
+    """リクエストヘッダーのバイト列からセッション ID を返す (なければ None)
+
+    app.get_session と同じく、形式が正しいヘッダーの値を優先し、なければ Cookie の値を使う。
+    """
+    header_prefix = header_name.lower().encode("latin-1") + b":"
+    cookie_prefix = cookie_name.encode("latin-1") + b"="
+    header_value = None
+    cookie_value = None
+    for line in data.split(b"\r\n\r\n", 1)[0].split(b"\r\n")[1:]:
+        lower = line.lower()
+        if lower.startswith(header_prefix):
+            if header_value is None:
+                header_value = line[len(header_prefix):].strip().decode("latin-1")
+        elif lower.startswith(b"cookie:"):
+            for part in line[len(b"cookie:"):].split(b";"):
+                part = part.strip()
+                if cookie_value is None and part.startswith(cookie_prefix):
+                    cookie_value = part[len(cookie_prefix):].decode("latin-1")
+    for value in (header_value, cookie_value):
+        if is_valid_session_id(value):
+            return value
+    return None
+
+
+def _worker_main(app, listener, channel, index, on_worker_start):
+    """ワーカープロセス: マスターから渡された接続を処理する"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    gc.enable()
+    if on_worker_start is not None:
+        on_worker_start(index)
+
+    host, port = listener.getsockname()[:2]
+    server = make_server(host, port, app, threaded=True, request_handler=_CloseRequestHandler,
+                         fd=listener.fileno())
+    # 受け付けはマスターが行うため、待ち受けソケットは閉じる
+    server.socket.close()
+    listener.close()
+
+    while True:
+        try:
+            _, fds, _, _ = socket.recv_fds(channel, 1, 1)
+        except (ConnectionError, OSError):
+            break
+        if not fds:
+            break  # マスターが終了した
+        conn = socket.socket(fileno=fds[0])
+        try:
+            address = conn.getpeername()
+        except OSError:
+            conn.close()
+            continue
+        server.process_request(conn, address)
+
+
+class PreforkServer:
+    """マスタープロセス: 接続の受け付け、ワーカーへの振り分けと監視"""
+
+    def __init__(self, app, host, port, workers, session_header, session_cookie, on_worker_start=None):
+        self.app = app
+        self.workers = workers
+        self.session_header = session_header
+        self.session_cookie = session_cookie
+        self.on_worker_start = on_worker_start
+
+        self.listener = socket.create_server((host, port), backlog=1024)
+        self.channels = [None] * workers
+        self.pids = [None] * workers
+        self.respawned = 0
+        self._round_robin = itertools.cycle(range(workers))
+        # ヘッダー待ちの接続 (接続 -> 期限) と、そのうちヘッダーが途中まで届いている接続
+        self.selector = selectors.DefaultSelector()
+        self._pending = {}
+        self._partial = set()
+        self._stopping = False
+
+    def spawn(self, index):
+        """index 番のワーカーを fork する"""
+        parent_end, child_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        pid = os.fork()
+        if pid == 0:
+            parent_end.close()
+            for channel in self.channels:
+                if channel is not None:
+                    channel.close()
+            # ヘッダー待ちの接続をワーカーが持ち続けると、マスターが閉じても切断されない
+            for conn in self._pending:
+                conn.close()
+            self.selector.close()
+            code = 1
+            try:
+                _worker_main(self.app, self.listener, child_end, index, self.on_worker_start)
+                code = 0
+            except Exception:
+                traceback.print_exc()
+            finally:
+                os._exit(code)
+        child_end.close()
+        if self.channels[index] is not None:
+            self.channels[index].close()
+        self.channels[index] = parent_end
+        self.pids[index] = pid
+
+    def reap(self):
+        """終了したワーカーを回収し、停止中でなければ fork し直す"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self.pids:
+                index = self.pids.index(pid)
+                self.pids[index] = None
+                if not self._stopping:
+                    print(f"[Prefork] Worker {index} (pid {pid}) exited with status {status}; respawning")
+                    self.respawned += 1
+                    self.spawn(index)
+
+    def dispatch(self, conn, headers: bytes):
+        """セッション ID のシャード (なければラウンドロビン) のワーカーに接続を渡す"""
+        session_id = _session_id_from_headers(headers, self.session_header, self.session_cookie)
+        index = session_shard(session_id, self.workers) if session_id else next(self._round_robin)
+        conn.setblocking(True)
+        try:
+            socket.send_fds(self.channels[index], [b"c"], [conn.fileno()])
+        except OSError:
+            # ワーカーが終了直後: 回収して fork し直したワーカーに渡す
+            self.reap()
+            socket.send_fds(self.channels[index], [b"c"], [conn.fileno()])
+
+    def _accept(self):
+        """受け付け可能な接続をすべて受け付け、ヘッダー待ちに加える"""
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            if len(self._pending) >= MAX_PENDING_CONNECTIONS:
+                self._reject(conn, 503)
+                continue
+            conn.setblocking(False)
+            self._pending[conn] = time.monotonic() + HEADER_TIMEOUT
+            self.selector.register(conn, selectors.EVENT_READ)
+            self._check(conn)
+
+    def _check(self, conn):
+        """ヘッダーを読み捨てずに覗き、揃っていれば振り分ける (途中なら再確認の対象にする)"""
+        try:
+            data = conn.recv(PEEK_MAX_BYTES, socket.MSG_PEEK)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        if b"\r\n\r\n" in data:
+            self._forget(conn)
+            try:
+                self.dispatch(conn, data)
+            except OSError as e:
+                print(f"[Prefork] Could not dispatch connection: {e}")
+            finally:
+                conn.close()
+        elif not data:
+            # ヘッダーを送らずに切断された
+            self._forget(conn)
+            conn.close()
+        elif len(data) >= PEEK_MAX_BYTES:
+            self._forget(conn)
+            self._reject(conn, 431)
+        elif conn not in self._partial:
+            # 覗いたデータは読み捨てないため、読み込み可能のままになる: セレクタから外して間隔をあけて覗き直す
+            self.selector.unregister(conn)
+            self._partial.add(conn)
+
+    def _forget(self, conn):
+        self._pending.pop(conn, None)
+        if conn in self._partial:
+            self._partial.discard(conn)
+        else:
+            self.selector.unregister(conn)
+
+    def _reject(self, conn, status):
+        """エラー応答を送って接続を閉じる (ワーカーには渡さない)"""
+        try:
+            conn.send(_ERROR_RESPONSES[status])
+        except OSError:
+            pass
+        conn.close()
+
+    def _expire(self):
+        """期限までにヘッダーが揃わなかった接続を 408 で閉じる"""
+        now = time.monotonic()
+        for conn, deadline in list(self._pending.items()):
+            if deadline <= now:
+                self._forget(conn)
+                self._reject(conn, 408)
+
+    def stop(self, *_):
+        self._stopping = True
+        raise KeyboardInterrupt
+
+    def serve_forever(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        # ロード済みのオブジェクトを GC の対象外にしてから fork する (コピーオンライトの抑制)
+        gc.collect()
+        gc.freeze()
+        for index in range(self.workers):
+            self.spawn(index)
+        print(f"[Prefork] Master pid {os.getpid()} serving on {self.listener.getsockname()[:2]} "
+              f"with {self.workers} workers: {self.pids}")
+
+        self.listener.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        try:
+            while True:
+                self.reap()
+                for key, _ in self.selector.select(PEEK_RETRY_INTERVAL if self._partial else 1.0):
+                    if key.fileobj is self.listener:
+                        self._accept()
+                    else:
+                        self._check(key.fileobj)
+                for conn in list(self._partial):
+                    self._check(conn)
+                self._expire()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._stopping = True
+            self.shutdown()
+
+    def shutdown(self):
+        """ワーカーを停止して回収する"""
+        for conn in list(self._pending):
+            conn.close()
+        self._pending.clear()
+        self._partial.clear()
+        self.selector.close()
+        self.listener.close()
+        for channel in self.channels:
+            if channel is not None:
+                channel.close()
+        for pid in self.pids:
+            if pid is not None:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+        for pid in self.pids:
+            if pid is not None:
+                try:
+                    os.waitpid(pid, 0)
+                except ChildProcessError:
+                    pass
+
+
+def default_torch_threads(workers: int) -> int:
+    """ワーカーあたりの torch スレッド数 (CPU コア数をワーカー数で分ける)"""
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def serve(app, host, port, workers, session_header, session_cookie, on_worker_start=None):
+    """プリフォーク方式でアプリケーションを起動する"""
+    if not hasattr(os, "fork") or not hasattr(socket, "send_fds"):
+        sys.exit("[Prefork] WORKERS > 1 requires a POSIX platform (fork / SCM_RIGHTS)")
+    server = PreforkServer(app, host, port, workers, session_header, session_cookie, on_worker_start)
+    server.serve_forever()
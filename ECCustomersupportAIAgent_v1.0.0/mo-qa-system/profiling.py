@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - On-demand Request Profiling
+リクエスト単位のプロファイル (cProfile / torch.profiler) を取得し、件数上限付きのリングバッファに保存する
+
+- リクエストヘッダー (X-Profile: cprofile / torch) で指定したリクエスト、または管理 API で設定した
+  サンプリング率で選ばれたリクエストの generate_response (ストリーミングでは generate_response_stages の全段階) をプロファイルする
+- 同時に取得するプロファイルは 1 件まで (取得中に来たリクエストはプロファイルせずに処理する)
+- プロファイルはディレクトリ上のリングバッファ (古いものから削除) に保存するため、
+  プリフォーク起動でもどのワーカーが取得したプロファイルでもダウンロードできる。
+  サンプリングの設定も fork 前に作る共有メモリに置き、全ワーカーに反映される
+- 保存先を指定しない場合は、最初のプロファイルの取得時に一時ディレクトリを作り (パスは共有メモリで
+  全ワーカーに共有)、RequestProfiler を作ったプロセスの終了時に削除する
+
+cProfile は呼び出したスレッドの Python 関数のみを記録する (マイクロバッチや段階実行のスレッドで動く
+モデル推論は、待ち時間として現れる)。torch.profiler は全スレッドの torch 演算を記録する
+(torch が未ロードの場合は cProfile で代替)。
+"""
+
+import atexit
+import cProfile
+import io
+import json
+import multiprocessing
+import os
+import pstats
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+PROFILE_KINDS = ("cprofile", "torch")
+# ダウンロード時のファイル拡張子と Content-Type
+TRACE_FORMATS = {
+    "cprofile": (".prof", "application/octet-stream"),
+    "torch": (".json", "application/json"),
+}
+SUMMARY_ROWS = 40
+
+
+class RequestProfiler:
+    """リクエストのプロファイルとリングバッファ"""
+
+    def __init__(self, directory=None, capacity=50, sample_rate=0.0, kind="cprofile", header_enabled=True):
+        # 保存先 (None の場合は最初の取得時に一時ディレクトリを作り、_auto_directory にパスを置く)
+        self._directory = directory
+        self._auto_directory = multiprocessing.Array('c', 4096)
+        self._owner_pid = os.getpid()
+        if directory is None:
+            atexit.register(self._remove_auto_directory)
+        self.capacity = capacity
+        # 共有メモリ (fork 後のワーカー間で共有)
+        self._sample_rate = multiprocessing.Value('d', sample_rate, lock=False)
+        self._kind = multiprocessing.Value('i', PROFILE_KINDS.index(kind), lock=False)
+        self._header_enabled = multiprocessing.Value('b', header_enabled, lock=False)
+        self._busy = threading.Lock()
+        self._seq = 0
+
+    # ---- 設定 ----
+
+    @property
+    def directory(self):
+        """保存先 (一時ディレクトリをまだ作っていない場合は None)"""
+        return self._directory or self._auto_directory.value.decode() or None
+
+    @property
+    def sample_rate(self) -> float:
+        return self._sample_rate.value
+
+    @property
+    def kind(self) -> str:
+        return PROFILE_KINDS[self._kind.value]
+
+    @property
+    def header_enabled(self) -> bool:
+        return bool(self._header_enabled.value)
+
+    def configure(self, sample_rate=None, kind=None, header_enabled=None):
+        """サンプリング率 (0-1)・既定の種類・ヘッダー指定の可否を変更する"""
+        if sample_rate is not None:
+            sample_rate = float(sample_rate)
+            if not 0.0 <= sample_rate <= 1.0:
+                raise ValueError("sample_rate は 0 から 1 の範囲で指定してください")
+        if kind is not None and kind not in PROFILE_KINDS:
+            raise ValueError(f"kind は {', '.join(PROFILE_KINDS)} のいずれかです")
+        if sample_rate is not None:
+            self._sample_rate.value = sample_rate
+        if kind is not None:
+            self._kind.value = PROFILE_KINDS.index(kind)
+        if header_enabled is not None:
+            self._header_enabled.value = bool(header_enabled)
+
+    def settings(self) -> dict:
+        return {
+            "sample_rate": self.sample_rate,
+            "kind": self.kind,
+            "header_enabled": self.header_enabled,
+            "capacity": self.capacity,
+            "directory": self.directory,
+        }
+
+    def select(self, header_value=None):
+        """このリクエストをプロファイルする場合はその種類、しない場合は None"""
+        if header_value and self.header_enabled:
+            header_value = header_value.strip().lower()
+            return header_value if header_value in PROFILE_KINDS else self.kind
+        rate = self._sample_rate.value
+        if rate > 0.0 and random.random() < rate:
+            return self.kind
+        return None
+
+    # ---- 取得 ----
+
+    def run(self, kind, fn, *args, meta=None):
+        """fn(*args) をプロファイルしながら実行し、(結果, プロファイル ID または None) を返す"""
+        if not self._busy.acquire(blocking=False):
+            return fn(*args), None
+        try:
+            torch = _loaded_torch() if kind == "torch" else None
+            if kind == "torch" and torch is None:
+                kind = "cprofile"
+            self._ensure_directory()
+            start = time.perf_counter()
+            if kind == "torch":
+                with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU],
+                                            record_shapes=True) as prof:
+                    result = fn(*args)
+                duration = time.perf_counter() - start
+                profile_id = self._next_id()
+                prof.export_chrome_trace(self._trace_path(profile_id, kind))
+                summary = prof.key_averages().table(sort_by="cpu_time_total", row_limit=SUMMARY_ROWS)
+            else:
+                profiler = cProfile.Profile()
+                result = profiler.runcall(fn, *args)
+                duration = time.perf_counter() - start
+                profile_id = self._next_id()
+                profiler.dump_stats(self._trace_path(profile_id, kind))
+                text = io.StringIO()
+                pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(SUMMARY_ROWS)
+                summary = text.getvalue()
+            self._save_meta(profile_id, {
+                "id": profile_id,
+                "kind": kind,
+                "created_at": time.time(),
+                "duration_ms": round(duration * 1000, 2),
+                "pid": os.getpid(),
+                **(meta or {}),
+            }, summary)
+            self._trim()
+            return result, profile_id
+        finally:
+            self._busy.release()
+
+    # ---- リングバッファ ----
+
+    def _ensure_directory(self):
+        """保存先を作成する (一時ディレクトリは全ワーカーで 1 つだけ作る)"""
+        if self._directory:
+            os.makedirs(self._directory, exist_ok=True)
+            return
+        with self._auto_directory.get_lock():
+            if not self._auto_directory.value:
+                self._auto_directory.value = tempfile.mkdtemp(prefix="mo-qa-profiles-").encode()
+
+    def _remove_auto_directory(self):
+        """終了時に一時ディレクトリを削除する (fork したワーカーの終了時は削除しない)"""
+        if os.getpid() == self._owner_pid and self._auto_directory.value:
+            shutil.rmtree(self._auto_directory.value.decode(), ignore_errors=True)
+
+    def _next_id(self) -> str:
+        self._seq += 1
+        return f"{time.time_ns()}-{os.getpid()}-{self._seq}"
+
+    def _trace_path(self, profile_id: str, kind: str) -> str:
+        return os.path.join(self.directory, profile_id + TRACE_FORMATS[kind][0])
+
+    def _meta_path(self, profile_id: str) -> str:
+        return os.path.join(self.directory, profile_id + ".meta.json")
+
+    def _save_meta(self, profile_id: str, meta: dict, summary: str):
+        # メタデータは最後に書く (一覧にはトレースが書き終わったものだけが現れる)
+        tmp_path = self._meta_path(profile_id) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({**meta, "summary": summary}, f, ensure_ascii=False)
+        os.replace(tmp_path, self._meta_path(profile_id))
+
+    def _ids(self) -> list:
+        """保存済みのプロファイル ID (古い順)"""
+        if self.directory is None:
+            return []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        ids = [name[:-len(".meta.json")] for name in names if name.endswith(".meta.json")]
+        ids.sort(key=lambda profile_id: int(profile_id.split("-")[0]))
+        return ids
+
+    def _trim(self):
+        """件数上限を超えた古いプロファイルを削除 (他のワーカーと同時に削除しても問題ない)"""
+        ids = self._ids()
+        for profile_id in ids[:max(0, len(ids) - self.capacity)]:
+            _remove(self._meta_path(profile_id))
+            for kind in PROFILE_KINDS:
+                _remove(self._trace_path(profile_id, kind))
+
+    def entries(self) -> list:
+        """保存済みプロファイルのメタデータ (新しい順、要約は含めない)"""
+        entries = []
+        for profile_id in reversed(self._ids()):
+            meta = self.get(profile_id)
+            if meta is not None:
+                meta.pop("summary", None)
+                entries.append(meta)
+        return entries
+
+    def get(self, profile_id: str):
+        """メタデータと要約 (見つからない場合は None)"""
+        if not _valid_id(profile_id) or self.directory is None:
+            return None
+        try:
+            with open(self._meta_path(profile_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def trace(self, profile_id: str):
+        """(ファイルパス, Content-Type, ダウンロード時のファイル名)、見つからない場合は None"""
+        meta = self.get(profile_id)
+        if meta is None:
+            return None
+        path = self._trace_path(profile_id, meta["kind"])
+        if not os.path.exists(path):
+            return None
+        extension, content_type = TRACE_FORMATS[meta["kind"]]
+        return path, content_type, f"profile-{profile_id}{extension}"
+
+
+def _valid_id(profile_id: str) -> bool:
+    parts = profile_id.split("-")
+    return len(parts) == 3 and all(part.isdigit() for part in parts)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _loaded_torch():
+    """ロード済みの torch (未ロードなら None、プロファイルのために import はしない)"""
+    return sys.modules.get("torch")
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Int8 Quantization
+満足度モデルの動的 int8 量子化 (CPU 推論用) と、その変換結果のディスクキャッシュ
+
+バックボーンと分類ヘッドの nn.Linear を torch.ao.quantization.quantize_dynamic で
+int8 に変換する。変換済みの state_dict とバックボーンの設定を元の重みファイルの隣
+(例: best_model_v2.int8.pt) に保存し、元の重み・torch・transformers のバージョンが
+同じ間は次回起動時に再利用する。再利用時は、事前学習済みバックボーンと fp32 の
+学習済み重みを読まずに、空の量子化 Linear を持つ骨組みへ state_dict を直接ロードする。
+"""
+
+import os
+
+
+def quantized_cache_path(model_path: str) -> str:
+    """量子化キャッシュのパス (元の重みファイルの隣)"""
+    return os.path.splitext(model_path)[0] + ".int8.pt"
+
+
+def _fingerprint(model_path: str) -> dict:
+    """キャッシュの有効性を判定する情報 (元の重み・ライブラリのバージョン)"""
+    import torch
+    import transformers
+
+    stat = os.stat(model_path)
+    return {
+        "source_size": stat.st_size,
+        "source_mtime_ns": stat.st_mtime_ns,
+        "torch": str(torch.__version__),
+        "transformers": str(transformers.__version__),
+    }
+
+
+def quantize_dynamic_int8(model):
+    """nn.Linear を動的 int8 量子化したモデルを返す (CPU 専用)"""
+    import torch
+    import torch.nn as nn
+
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def quantized_skeleton(model):
+    """nn.Linear を空の動的量子化 Linear に置き換える (state_dict ロード用、重みの量子化は行わない)"""
+    import torch
+    import torch.nn as nn
+    from torch.ao.nn.quantized import dynamic as nnqd
+
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if type(child) is nn.Linear:
+                setattr(parent, name, nnqd.Linear(child.in_features, child.out_features,
+                                                  bias_=child.bias is not None, dtype=torch.qint8))
+    return model
+
+
+def _dynamic_linears(model):
+    """量子化済み Linear の (モジュール名, モジュール) 一覧"""
+    from torch.ao.nn.quantized import dynamic as nnqd
+
+    return [(name, module) for name, module in model.named_modules() if isinstance(module, nnqd.Linear)]
+
+
+def _pack_qweight(qweight) -> dict:
+    """量子化テンソルを通常のテンソルとスカラーに分解 (weights_only で安全に保存・ロードできる形式)"""
+    import torch
+
+    if qweight.qscheme() in (torch.per_channel_affine, torch.per_channel_symmetric):
+        return {
+            "int_repr": qweight.int_repr(),
+            "scales": qweight.q_per_channel_scales(),
+            "zero_points": qweight.q_per_channel_zero_points(),
+            "axis": qweight.q_per_channel_axis(),
+        }
+    return {"int_repr": qweight.int_repr(), "scale": qweight.q_scale(), "zero_point": qweight.q_zero_point()}
+
+
+def _unpack_qweight(packed: dict):
+    import torch
+
+    if "scales" in packed:
+        return torch._make_per_channel_quantized_tensor(
+            packed["int_repr"], packed["scales"], packed["zero_points"], packed["axis"])
+    return torch._make_per_tensor_quantized_tensor(packed["int_repr"], packed["scale"], packed["zero_point"])
+
+
+def save_quantized(model, cache_path: str, model_path: str, tokenizer_name: str, backbone_config: dict):
+    """量子化済みモデルを保存 (量子化 Linear は int8 値とスケールに分解して保存)"""
+    import torch
+
+    linears = {}
+    for name, module in _dynamic_linears(model):
+        weight, bias = module._weight_bias()
+        linears[name] = {**_pack_qweight(weight), "bias": bias}
+    state_dict = {k: v for k, v in model.state_dict().items()
+                  if not any(k.startswith(name + ".") for name in linears)}
+
+    tmp_path = cache_path + ".tmp"
+    torch.save({
+        "fingerprint": _fingerprint(model_path),
+        "tokenizer": tokenizer_name,
+        "backbone_config": backbone_config,
+        "state_dict": state_dict,
+        "linears": linears,
+    }, tmp_path)
+    os.replace(tmp_path, cache_path)
+
+
+def load_quantized(cache_path: str, model_path: str):
+    """量子化キャッシュをロード
+
+    Returns:
+        {"tokenizer", "backbone_config", "state_dict", "linears"}。キャッシュがない・古い場合は None
+    """
+    import torch
+
+    if not os.path.exists(cache_path) or not os.path.exists(model_path):
+        return None
+    payload = torch.load(cache_path, map_location="cpu", weights_only=True)
+    if payload.get("fingerprint") != _fingerprint(model_path):
+        return None
+    return payload
+
+
+def load_quantized_state(skeleton, payload: dict):
+    """quantized_skeleton() で作った骨組みにキャッシュの重みをロード"""
+    import torch
+
+    linears = payload["linears"]
+    modules = dict(_dynamic_linears(skeleton))
+    # 量子化 Linear 以外 (埋め込み・LayerNorm など) はパラメータ・バッファへ直接コピー
+    tensors = dict(skeleton.named_parameters())
+    tensors.update(skeleton.named_buffers())
+    state_dict = payload["state_dict"]
+    if set(modules) != set(linears) or not set(state_dict) <= set(tensors) \
+            or not set(dict(skeleton.named_parameters())) <= set(state_dict):
+        raise ValueError("quantized cache does not match the model structure")
+    with torch.no_grad():
+        for key, value in state_dict.items():
+            tensors[key].copy_(value)
+    for name, packed in linears.items():
+        modules[name].set_weight_bias(_unpack_qweight(packed), packed["bias"])
+    return skeleton
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - QA Retrieval Index
+商品ごとの Q&A ペアに対する文字 n-gram TF-IDF 転置インデックス
+
+検索は 2 段階で行う:
+  1. 転置インデックスで TF-IDF コサイン類似度の上位候補を絞り込む
+  2. 候補だけを difflib.SequenceMatcher で再スコアリングする
+これにより、従来の「類似度 0.6 超でマッチ」という閾値の意味を保ったまま、
+全 QA ペアとの総当たり比較を避ける (候補が 0 件のとき、またはクエリが n-gram より短いときは全件を比較する)。
+"""
+
+import bisect
+import heapq
+import json
+import math
+from collections import Counter
+from difflib import SequenceMatcher
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+NGRAM_SIZES = (2, 3)
+DEFAULT_CANDIDATES = 20
+DEFAULT_THRESHOLD = 0.6
+# 密ベクトル検索で一度に float32 に変換する行数
+DENSE_CHUNK_ROWS = 8192
+
+
+def char_ngrams(text: str, sizes=NGRAM_SIZES) -> Counter:
+    """文字 n-gram の出現回数 (短すぎる文字列は 1-gram で代替)"""
+    grams = Counter()
+    for n in sizes:
+        for i in range(len(text) - n + 1):
+            grams[text[i:i + n]] += 1
+    if not grams and text:
+        grams.update(text)
+    return grams
+
+
+class QAIndex:
+    """1 商品分の Q&A 検索インデックス"""
+
+    def __init__(self, qa_list, ngram_sizes=NGRAM_SIZES):
+        self.ngram_sizes = ngram_sizes
+        self.questions = []
+        self.answers = []
+        # 質問の出現回数 (generate_data.py が記録した count の合計、検索の事前分布に利用可能)
+        self.counts = []
+
+        # 同一の質問文は 1 文書にまとめる (従来通り、最初に現れた回答を採用)
+        seen = {}
+        for qa in qa_list:
+            q_text = qa["q"]
+            if q_text in seen:
+                self.counts[seen[q_text]] += qa.get("count", 1)
+                continue
+            seen[q_text] = len(self.questions)
+            self.questions.append(q_text)
+            self.answers.append(qa["a"])
+            self.counts.append(qa.get("count", 1))
+
+        doc_grams = [char_ngrams(q, ngram_sizes) for q in self.questions]
+        df = Counter()
+        for grams in doc_grams:
+            df.update(grams.keys())
+
+        n_docs = len(self.questions)
+        self.idf = {g: math.log((1 + n_docs) / (1 + d)) + 1.0 for g, d in df.items()}
+
+        # 転置インデックス: n-gram -> [(文書ID, 正規化済み重み), ...]
+        self.postings = {}
+        for doc_id, grams in enumerate(doc_grams):
+            weights = {g: tf * self.idf[g] for g, tf in grams.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for g, w in weights.items():
+                self.postings.setdefault(g, []).append((doc_id, w / norm))
+
+    def __len__(self):
+        return len(self.questions)
+
+    def _candidates(self, query: str, n_candidates: int):
+        """TF-IDF コサイン類似度の上位候補 (文書ID) を返す"""
+        grams = char_ngrams(query, self.ngram_sizes)
+        weights = {g: tf * self.idf[g] for g, tf in grams.items() if g in self.idf}
+        if not weights:
+            return []
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+
+        scores = {}
+        for g, w in weights.items():
+            qw = w / norm
+            for doc_id, dw in self.postings[g]:
+                scores[doc_id] = scores.get(doc_id, 0.0) + qw * dw
+        return heapq.nlargest(n_candidates, scores, key=scores.get)
+
+    def search(self, query: str, k: int = 5, n_candidates: int = DEFAULT_CANDIDATES):
+        """上位 k 件を [{"q", "a", "score", "count"}, ...] (score 降順) で返す"""
+        candidates = self._candidates(query, max(k, n_candidates))
+        if not candidates or len(query) < max(self.ngram_sizes):
+            # n-gram を共有しない・短すぎるクエリでも difflib では類似しうる (例: "AB" と "AxB" は 0.8) ため、
+            # 候補で絞り込まずに全質問を再スコアリングする
+            candidates = range(len(self.questions))
+        scored = []
+        for doc_id in candidates:
+            ratio = SequenceMatcher(None, query, self.questions[doc_id]).ratio()
+            scored.append((ratio, -doc_id))
+        # 同点の場合は元の並びで先に現れたものを優先
+        top = heapq.nlargest(k, scored)
+        return [
+            {"q": self.questions[-neg_id], "a": self.answers[-neg_id], "score": ratio,
+             "count": self.counts[-neg_id]}
+            for ratio, neg_id in top
+        ]
+
+    def best_answer(self, query: str, threshold: float = DEFAULT_THRESHOLD):
+        """最も類似した質問の回答 (類似度が閾値以下なら None)"""
+        hits = self.search(query, k=1)
+        if hits and hits[0]["score"] > threshold:
+            return hits[0]["a"]
+        return None
+
+
+class DenseQAIndex:
+    """埋め込み行列 (float16, メモリマップ) による Q&A の密ベクトル検索
+
+    行列の行は (カテゴリ, 商品) の順に並んでいるため、商品・カテゴリでの絞り込みは
+    連続した行範囲のスライスになる。行列は mmap で開くので、複数のワーカープロセスが
+    ページキャッシュ上の 1 つのコピーを共有する。
+    """
+
+    def __init__(self, matrix_path: str, ids_path: str):
+        if not NUMPY_AVAILABLE:
+            raise ImportError("numpy is required for dense retrieval")
+        self.matrix = np.load(matrix_path, mmap_mode='r')
+        with open(ids_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+
+        self.dim = meta["dim"]
+        self.model = meta.get("model")
+        self.qa_index = meta["qa_index"]
+        if self.matrix.shape != (len(self.qa_index), self.dim):
+            raise ValueError(f"embedding matrix shape {self.matrix.shape} does not match ID table")
+        # 各行の質問文 (カタログ更新後に行番号が別の質問を指していないかの確認用)
+        self.questions = meta.get("questions")
+        if self.questions is None or len(self.questions) != len(self.qa_index):
+            raise ValueError("ID table has no per-row questions; rebuild with build_qa_embeddings.py")
+
+        # 商品・カテゴリごとの行範囲 [start, end)
+        self.product_ranges = {}
+        self.category_ranges = {}
+        owners = []
+        for category, product, start, end in meta["products"]:
+            self.product_ranges[(category, product)] = (start, end)
+            c_start, c_end = self.category_ranges.get(category, (start, end))
+            self.category_ranges[category] = (min(c_start, start), max(c_end, end))
+            owners.append((start, category, product))
+        owners.sort()
+        self._owner_starts = [start for start, _, _ in owners]
+        self._owners = [(category, product) for _, category, product in owners]
+
+    def __len__(self):
+        return len(self.qa_index)
+
+    def _owner(self, row: int):
+        """行番号から (カテゴリ, 商品) を求める"""
+        return self._owners[bisect.bisect_right(self._owner_starts, row) - 1]
+
+    def _scores(self, start: int, end: int, query_vec):
+        """行範囲 [start, end) とクエリの内積 (チャンクごとに float32 で計算)"""
+        if end - start <= DENSE_CHUNK_ROWS:
+            return np.asarray(self.matrix[start:end], dtype=np.float32) @ query_vec
+        return np.concatenate([
+            np.asarray(self.matrix[i:min(i + DENSE_CHUNK_ROWS, end)], dtype=np.float32) @ query_vec
+            for i in range(start, end, DENSE_CHUNK_ROWS)
+        ])
+
+    def search(self, query_vec, k: int = 5, category=None, product=None):
+        """内積 (正規化済みならコサイン類似度) の上位 k 件
+
+        Returns:
+            [{"category", "product", "qa_index", "question", "score"}, ...] (score 降順)
+        """
+        if category is not None and product is not None:
+            start, end = self.product_ranges.get((category, product), (0, 0))
+        elif category is not None:
+            start, end = self.category_ranges.get(category, (0, 0))
+        else:
+            start, end = 0, len(self.qa_index)
+        if end <= start:
+            return []
+
+        query_vec = np.asarray(query_vec, dtype=np.float32).reshape(-1)
+        scores = self._scores(start, end, query_vec)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for i in top:
+            row = start + int(i)
+            owner_category, owner_product = self._owner(row)
+            results.append({
+                "category": owner_category,
+                "product": owner_product,
+                "qa_index": self.qa_index[row],
+                "question": self.questions[row],
+                "score": float(scores[i]),
+            })
+        return results
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Offline Dialogue Scoring
+reproduce/data/*/data_turn 形式の対話 CSV を読み込み、対話ごとの満足度を
+HighAccuracyClassifierV2 で一括予測する。
+
+- CSV の読み込みと対話テキストの連結はリーダープロセス (multiprocessing) で行い、
+  メインプロセスはトークン化と推論に専念する
+- --batch-size 件ずつ、長さバケットごとにパディングした大きなバッチで推論する
+- 予測はバッチごとに出力ファイル (.jsonl / .csv) へ追記し、途中経過と
+  スループット (dialogues/s) を表示する
+
+使い方:
+    python score_dialogues.py --output predictions.jsonl --batch-size 256 --readers 4
+    python score_dialogues.py ../reproduce/data/valid/data_turn --output valid.csv
+"""
+
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INPUTS = [os.path.join(os.path.dirname(current_dir), "reproduce", "data", "*", "data_turn")]
+OUTPUT_FIELDS = ["source", "row", "category", "satisfaction", "satisfaction_class", "confidence", "model_based", "label"]
+
+
+def sat_to_3class(sat: int) -> int:
+    """満足度 (1-5) を 3 クラスに変換 (学習時と同じ)"""
+    if sat <= 2:
+        return 0
+    elif sat <= 4:
+        return 1
+    return 2
+
+
+def find_csv_files(inputs: list) -> list:
+    """ディレクトリ・glob・ファイルから dialogue_*.csv を集める (dialogue_1, 2, ... の順)"""
+    files = []
+    for pattern in inputs:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            if os.path.isdir(path):
+                found = glob.glob(os.path.join(path, "dialogue_*.csv"))
+                found.sort(key=lambda p: (len(os.path.basename(p)), os.path.basename(p)))
+                files.extend(found)
+            elif os.path.isfile(path):
+                files.append(path)
+    return files
+
+
+def read_dialogues(path: str) -> list:
+    """リーダープロセス: 1 ファイル分の対話を (ファイル, 行番号, 対話, カテゴリ, 正解ラベル) にする"""
+    records = []
+    with open(path, "r", encoding="utf-8-sig") as f:
+        for i, row in enumerate(csv.DictReader(f)):
+            sat = row.get("sat")
+            label = sat_to_3class(int(sat)) if sat and sat.strip().isdigit() else None
+            records.append((path, i, row.get("sent", ""), row.get("first_category", ""), label))
+    return records
+
+
+class PredictionWriter:
+    """予測をバッチごとに追記する (.csv なら CSV、それ以外は JSON Lines)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.is_csv = path.lower().endswith(".csv")
+        self._file = open(path, "w", encoding="utf-8", newline="")
+        if self.is_csv:
+            self._writer = csv.DictWriter(self._file, fieldnames=OUTPUT_FIELDS)
+            self._writer.writeheader()
+
+    def write(self, rows: list):
+        for row in rows:
+            if self.is_csv:
+                self._writer.writerow(row)
+            else:
+                self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="対話 CSV の満足度を一括予測する")
+    parser.add_argument("inputs", nargs="*", default=DEFAULT_INPUTS,
+                        help="data_turn ディレクトリ・CSV ファイル・glob (既定: reproduce/data/*/data_turn)")
+    parser.add_argument("--output", default="predictions.jsonl", help="出力ファイル (.jsonl / .csv)")
+    parser.add_argument("--batch-size", type=int, default=256, help="1 回の推論にまとめる対話数")
+    parser.add_argument("--readers", type=int, default=max(1, min(4, (os.cpu_count() or 1) - 1)),
+                        help="CSV を読み込むリーダープロセス数")
+    parser.add_argument("--limit", type=int, default=None, help="予測する対話数の上限")
+    parser.add_argument("--progress-every", type=int, default=10, help="途中経過を表示するバッチ間隔")
+    args = parser.parse_args()
+
+    files = find_csv_files(args.inputs)
+    if not files:
+        print(f"!!! 対話 CSV が見つかりません: {args.inputs}")
+        sys.exit(1)
+
+    # リーダープロセスはエンジン (モデル) のロード前に起動する
+    pool = multiprocessing.Pool(args.readers)
+    from inference import MonotaROInference
+
+    engine = MonotaROInference()
+    if not engine.model_loaded:
+        print("[Warning] 満足度モデルがロードできないため、ルールベースで予測します")
+    writer = PredictionWriter(args.output)
+    print(f"Scoring dialogues from {len(files)} files with batch size {args.batch_size}, "
+          f"{args.readers} readers -> {args.output}")
+
+    dialogues = 0
+    correct = 0
+    labeled = 0
+    batches = 0
+    buffer = []
+    start = time.perf_counter()
+
+    def flush(batch):
+        nonlocal dialogues, correct, labeled, batches
+        results = engine.score_dialogues([(text, category) for _, _, text, category, _ in batch])
+        rows = []
+        for (path, row_index, _, category, label), result in zip(batch, results):
+            rows.append({
+                "source": os.path.relpath(path),
+                "row": row_index,
+                "category": category,
+                "satisfaction": result["satisfaction"],
+                "satisfaction_class": result["satisfaction_class"],
+                "confidence": result["confidence"],
+                "model_based": result["model_based"],
+                "label": label,
+            })
+            if label is not None:
+                labeled += 1
+                correct += int(label == result["satisfaction"])
+        writer.write(rows)
+        dialogues += len(batch)
+        batches += 1
+        if batches % args.progress_every == 0:
+            elapsed = time.perf_counter() - start
+            print(f"  {dialogues} dialogues, {elapsed:.1f}s ({dialogues / elapsed:.1f} dialogues/s)")
+
+    try:
+        for records in pool.imap(read_dialogues, files):
+            for record in records:
+                if args.limit is not None and dialogues + len(buffer) >= args.limit:
+                    break
+                buffer.append(record)
+                if len(buffer) >= args.batch_size:
+                    flush(buffer)
+                    buffer = []
+            if args.limit is not None and dialogues + len(buffer) >= args.limit:
+                break
+        if buffer:
+            flush(buffer)
+    finally:
+        pool.terminate()
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    print("=" * 60)
+    print(f" Dialogues : {dialogues} ({len(files)} files)")
+    print(f" Elapsed   : {elapsed:.1f}s")
+    print(f" Throughput: {dialogues / elapsed if elapsed > 0 else 0.0:.1f} dialogues/s")
+    if labeled:
+        print(f" Accuracy  : {correct / labeled * 100:.2f}% ({labeled} labeled dialogues)")
+    print(f" Output    : {args.output}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
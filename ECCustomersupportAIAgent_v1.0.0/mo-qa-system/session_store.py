@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Session Store
+会話ごとの対話状態 (カテゴリ・商品・履歴) を保持するセッションストア
+
+重いエンジン (モデル・トークナイザ・カタログ) は全リクエストで共有し、
+会話ごとの小さな状態だけをここで管理する。
+"""
+
+import re
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+
+
+# デフォルト設定
+DEFAULT_MAX_SESSIONS = 10000      # 保持するセッション数の上限 (LRU で追い出し)
+DEFAULT_TTL_SECONDS = 30 * 60     # 最終アクセスからの有効期限
+DEFAULT_MAX_HISTORY = 20          # セッションあたりの履歴エントリ上限
+DEFAULT_MAX_ENTRY_CHARS = 2000    # 履歴 1 エントリあたりの文字数上限
+
+# new_session_id() が発行する形式 (uuid4 の 16 進 32 文字)
+SESSION_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+def is_valid_session_id(session_id) -> bool:
+    """発行する形式・長さのセッション ID か"""
+    return isinstance(session_id, str) and SESSION_ID_PATTERN.fullmatch(session_id) is not None
+
+
+def session_shard(session_id: str, count: int) -> int:
+    """セッション ID の担当シャード (マルチプロセス起動時のワーカー番号)"""
+    return zlib.crc32(session_id.encode("utf-8")) % count
+
+
+class DialogueSession:
+    """1 会話分の対話状態"""
+
+    def __init__(self, session_id: str, max_history=DEFAULT_MAX_HISTORY,
+                 max_entry_chars=DEFAULT_MAX_ENTRY_CHARS):
+        self.session_id = session_id
+        self.max_history = max_history
+        self.max_entry_chars = max_entry_chars
+
+        self.current_category = None
+        self.current_product = None
+        self.current_price = None
+        self.current_params = {}
+        self.current_qa_list = []
+        self.current_qa_index = None
+        self.dialogue_history = []
+        # 履歴エントリごとのトークンID (dialogue_history と同じ並び、未トークン化は None)
+        self.history_token_ids = []
+        self.token_cache_owner = None
+
+        self.created_at = time.time()
+        self.last_access = self.created_at
+        # 同一セッションへの同時リクエストを直列化する
+        self.lock = threading.Lock()
+
+    def append_history(self, entry: str):
+        """履歴に追加 (上限を超えた古いエントリは破棄)"""
+        self.dialogue_history.append(entry[:self.max_entry_chars])
+        self.history_token_ids.append(None)
+        overflow = len(self.dialogue_history) - self.max_history
+        if overflow > 0:
+            del self.dialogue_history[:overflow]
+            del self.history_token_ids[:overflow]
+
+    def clear_history(self):
+        """履歴をクリア"""
+        self.dialogue_history = []
+        self.history_token_ids = []
+
+    def cached_token_ids(self, owner):
+        """履歴のトークンキャッシュを取得 (トークナイザが変わっていれば破棄)"""
+        if self.token_cache_owner is not owner:
+            self.history_token_ids = [None] * len(self.dialogue_history)
+            self.token_cache_owner = owner
+        return self.history_token_ids
+
+    def reset_product(self):
+        """商品選択と関連情報をクリア"""
+        self.current_product = None
+        self.current_price = None
+        self.current_params = {}
+        self.current_qa_list = []
+        self.current_qa_index = None
+
+    def touch(self):
+        self.last_access = time.time()
+
+
+class SessionStore:
+    """スレッドセーフな LRU + TTL セッションストア
+
+    shard=(index, count) を設定すると、新規に発行するセッション ID を
+    session_shard(id, count) == index となるものに限る (マルチプロセス起動時に、
+    発行したワーカーへ以降のリクエストが振り分けられるようにする)。
+    """
+
+    def __init__(self, max_sessions=DEFAULT_MAX_SESSIONS, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 max_history=DEFAULT_MAX_HISTORY, max_entry_chars=DEFAULT_MAX_ENTRY_CHARS, shard=None):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_history = max_history
+        self.max_entry_chars = max_entry_chars
+        self.shard = shard
+
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+        self.expired = 0
+
+    def new_session_id(self) -> str:
+        while True:
+            session_id = uuid.uuid4().hex
+            if self.shard is None or session_shard(session_id, self.shard[1]) == self.shard[0]:
+                return session_id
+
+    def get_or_create(self, session_id=None):
+        """セッションを取得 (存在しない・期限切れの場合は新規作成)
+
+        新規作成するセッションの ID は常に new_session_id() で発行する
+        (クライアントが指定した未知の ID は使わない: セッション固定化の防止)。
+
+        Returns:
+            (session, created)
+        """
+        now = time.time()
+        with self._lock:
+            if is_valid_session_id(session_id):
+                session = self._sessions.get(session_id)
+                if session is not None:
+                    if now - session.last_access <= self.ttl_seconds:
+                        session.last_access = now
+                        self._sessions.move_to_end(session_id)
+                        return session, False
+                    del self._sessions[session_id]
+                    self.expired += 1
+
+            session_id = self.new_session_id()
+            session = DialogueSession(session_id, self.max_history, self.max_entry_chars)
+            self._sessions[session_id] = session
+            self._evict_locked(now)
+            return session, True
+
+    def get(self, session_id):
+        """既存セッションを取得 (なければ None)"""
+        if not is_valid_session_id(session_id):
+            return None
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if time.time() - session.last_access > self.ttl_seconds:
+                del self._sessions[session_id]
+                self.expired += 1
+                return None
+            session.touch()
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def remove(self, session_id) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def purge_expired(self) -> int:
+        """期限切れセッションを削除し、削除数を返す"""
+        with self._lock:
+            before = len(self._sessions)
+            self._evict_locked(time.time())
+            return before - len(self._sessions)
+
+    def _evict_locked(self, now):
+        # 先頭が最も古いアクセスなので、期限切れは先頭から順に削除できる
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if now - oldest.last_access > self.ttl_seconds:
+                self._sessions.popitem(last=False)
+                self.expired += 1
+            elif len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+            else:
+                break
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def __len__(self):
+        return self.count()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "active_sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "ttl_seconds": self.ttl_seconds,
+                "max_history": self.max_history,
+                "evicted": self.evicted,
+                "expired": self.expired,
+            }
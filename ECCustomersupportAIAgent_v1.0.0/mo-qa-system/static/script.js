@@ -147,15 +147,53 @@ async function sendMessage() {
     showLoading(true);
 
     try {
-        const res = await fetch(`${API_BASE}/api/chat`, {
+        const res = await fetch(`${API_BASE}/api/chat/stream`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ message: text })
         });
-        const data = await res.json();
 
+        if (!res.ok) {
+            // 入力エラー・サーバーエラーは再送せず、API のエラーメッセージを表示
+            const data = await res.json().catch(() => ({}));
+            showLoading(false);
+            addMessage(data.error || "申し訳ございません。エラーが発生しました。", 'bot');
+            return;
+        }
+
+        if (!res.body) {
+            // ストリーミング非対応: 一括応答の API で再送
+            const fallback = await fetch(`${API_BASE}/api/chat`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ message: text })
+            });
+            const data = await fallback.json();
+            showLoading(false);
+            if (fallback.ok) {
+                addMessage(data.response, 'bot', data);
+            } else {
+                addMessage(data.error || "申し訳ございません。エラーが発生しました。", 'bot');
+            }
+            return;
+        }
+
+        let bubble = null;
+        await readEventStream(res, (event, data) => {
+            if (event === 'answer') {
+                // 回答を先に表示し、満足度・知識グラフ推論は届いた時点で追加する
+                showLoading(false);
+                bubble = addMessage(data.response, 'bot');
+            } else if (event === 'satisfaction' && bubble) {
+                addSatisfactionTag(bubble, data);
+            } else if (event === 'insight' && bubble) {
+                addInsight(bubble, data.insight);
+            } else if (event === 'error') {
+                showLoading(false);
+                addMessage("申し訳ございません。エラーが発生しました。", 'bot');
+            }
+        });
         showLoading(false);
-        addMessage(data.response, 'bot', data);
 
     } catch (e) {
         showLoading(false);
@@ -163,6 +201,35 @@ async function sendMessage() {
     }
 }
 
+/**
+ * Read Server-Sent Events from a fetch response
+ */
+async function readEventStream(res, onEvent) {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            block.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+            if (data) onEvent(event, JSON.parse(data));
+        }
+    }
+}
+
 /**
  * Reset
  */
@@ -225,27 +292,37 @@ function addMessage(text, type, meta = null) {
         ? '<div class="avatar" style="background:#cc0000; color:white; display:flex; align-items:center; justify-content:center; border-radius:50%; width:32px; height:32px;"><i class="fas fa-user"></i></div>'
         : '<div class="avatar operator-avatar" style="background:#888888; color:white; display:flex; align-items:center; justify-content:center; border-radius:50%; width:32px; height:32px;"><i class="fas fa-headset"></i></div>';
 
-    let metaHtml = '';
-    if (meta && type === 'bot') {
-        const satLabel = meta.satisfaction_label || 'Neutral';
-        const satClass = meta.satisfaction === 2 ? 'positive' : (meta.satisfaction === 0 ? 'negative' : 'neutral');
-        metaHtml = `
-            <div class="satisfaction-tag ${satClass}">
-                <span class="sat-prefix">顧客満足度予測:</span> ${satLabel}
-            </div>
-        `;
-    }
-
     msgDiv.innerHTML = `
         ${type === 'bot' ? avatarHtml : ''}
         <div class="bubble">
-            ${escapeHtml(text)}
-            ${metaHtml}
+            <span class="bubble-text">${escapeHtml(text)}</span>
         </div>
         ${type === 'user' ? avatarHtml : ''}
     `;
 
     chatBox.appendChild(msgDiv);
+    const bubble = msgDiv.querySelector('.bubble');
+    if (meta && type === 'bot') {
+        addSatisfactionTag(bubble, meta);
+    }
+    chatBox.scrollTop = chatBox.scrollHeight;
+    return bubble;
+}
+
+function addSatisfactionTag(bubble, meta) {
+    const satLabel = meta.satisfaction_label || 'Neutral';
+    const satClass = meta.satisfaction === 2 ? 'positive' : (meta.satisfaction === 0 ? 'negative' : 'neutral');
+    const tag = document.createElement('div');
+    tag.className = `satisfaction-tag ${satClass}`;
+    tag.innerHTML = `<span class="sat-prefix">顧客満足度予測:</span> ${escapeHtml(satLabel)}`;
+    bubble.appendChild(tag);
+    chatBox.scrollTop = chatBox.scrollHeight;
+}
+
+function addInsight(bubble, insight) {
+    // 満足度タグより前 (回答の直後) に追加する
+    const textSpan = bubble.querySelector('.bubble-text');
+    textSpan.insertAdjacentHTML('beforeend', '<br><br>' + escapeHtml(insight));
     chatBox.scrollTop = chatBox.scrollHeight;
 }
 
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Distilled Student Checkpoint
+知識蒸留で学習した小型の満足度モデル (student) のチェックポイント形式
+
+student は HighAccuracyClassifierV2 と同じ構造 (バックボーン + トピック埋め込み + 分類ヘッド) で、
+バックボーンの層数・隠れ次元だけが小さい。事前学習済みの重みがないため、state_dict に加えて
+バックボーンの設定とトークナイザー名を同じファイルに保存し、ロード時は設定から骨組みを作る。
+教師モデル (best_model_v2.pt) は従来どおり state_dict のみのファイル。
+
+学習は reproduce/run_distillation.py、推論は MODEL_PATH に student のファイルを指定する。
+"""
+
+import os
+
+STUDENT_FORMAT = "monotaro-student-v1"
+
+
+def save_student(model, path: str, tokenizer_name: str, backbone_config: dict, info: dict):
+    """student の state_dict・バックボーンの設定・学習情報を保存"""
+    import torch
+
+    tmp_path = path + ".tmp"
+    torch.save({
+        "format": STUDENT_FORMAT,
+        "tokenizer": tokenizer_name,
+        "backbone_config": backbone_config,
+        "state_dict": model.state_dict(),
+        "info": info,
+    }, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_student(path: str):
+    """student のチェックポイントならその内容を返す (テンソルはメモリマップ、通常の state_dict なら None)
+
+    Returns:
+        {"tokenizer", "backbone_config", "state_dict", "info"} または None
+    """
+    import torch
+
+    if not os.path.exists(path):
+        return None
+    try:
+        payload = torch.load(path, map_location="cpu", weights_only=True, mmap=True)
+    except RuntimeError:
+        # メモリマップできない旧形式のファイルは student ではない
+        return None
+    return payload if is_student(payload) else None
+
+
+def is_student(payload) -> bool:
+    return isinstance(payload, dict) and payload.get("format") == STUDENT_FORMAT
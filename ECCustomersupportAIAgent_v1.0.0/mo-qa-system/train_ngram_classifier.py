@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO Q&A System - Cascade First-tier Trainer
+満足度カスケードの 1 段目 (文字 n-gram ハッシュ + 線形モデル) を学習する。
+
+学習データは run_full_pipeline.py と同じ (reproduce/data/train/data_turn/dialogue_1〜50.csv、
+対話の全ターンを連結、sat を 3 クラスに変換、カテゴリ名を特徴量に追加)。
+チャットでは 1 段目に直近の履歴だけが渡るため、各対話をチャットとして再生し、顧客の発話ごとに
+inference.chat_window_text と同じ入力 (ラベルは対話の sat) も学習データに加える (--no-chat-windows で無効)。
+reproduce/data/valid で正解率・マクロ F1 と、信頼度の閾値ごとの「1 段目で確定する割合」を表示する。
+
+出力:
+    satisfaction_ngram.npz  (inference.py の CASCADE_MODEL_PATH、存在すればカスケードが有効になる)
+
+使い方:
+    python train_ngram_classifier.py --epochs 20
+"""
+
+import argparse
+import csv
+import os
+import time
+
+import numpy as np
+
+from inference import chat_window_text
+from ngram_classifier import HashedNgramClassifier, NGRAM_SIZES, NUM_FEATURES
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(os.path.dirname(current_dir), "reproduce", "data")
+DEFAULT_OUTPUT = os.environ.get('CASCADE_MODEL_PATH', os.path.join(current_dir, "satisfaction_ngram.npz"))
+
+
+def sat_to_3class(sat: int) -> int:
+    """満足度 (1-5) を 3 クラスに変換 (学習時と同じ)"""
+    if sat <= 2:
+        return 0
+    elif sat <= 4:
+        return 1
+    return 2
+
+
+def chat_window_texts(turns):
+    """対話をチャットとして再生し、顧客の発話ごとにチャットで 1 段目に渡すテキストを返す
+
+    履歴の作り方は benchmarks/eval_cascade.py の再生と同じ (接頭辞のない発話は顧客の発話として扱う)。
+    """
+    history, texts = [], []
+    for turn in turns:
+        if turn.startswith("A:"):
+            history.append(f"A: {turn[2:].strip()}")
+            continue
+        message = turn[2:].strip() if turn.startswith("Q:") else turn
+        if not message:
+            continue
+        history.append(f"Q: {message}")
+        texts.append(chat_window_text(history, message))
+    return texts
+
+
+def load_split(mode: str, chat_windows=False):
+    """run_full_pipeline.load_dataset と同じファイルから (テキスト, カテゴリ, ラベル) を読む
+
+    chat_windows=True の場合は、対話ごとにチャットの各ターンの入力 (chat_window_texts) も加える。
+    """
+    file_range = range(1, 51) if mode == "train" else range(1, 6)
+    texts, categories, labels = [], [], []
+    for i in file_range:
+        path = os.path.join(DATA_DIR, mode, "data_turn", f"dialogue_{i}.csv")
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                sat = (row.get("sat") or "").strip()
+                if not sat.isdigit():
+                    continue
+                turns = [t.strip() for t in row.get("sent", "").split("|||") if t.strip()]
+                windows = chat_window_texts(turns) if chat_windows else []
+                texts.extend([" ".join(turns)] + windows)
+                categories.extend([row.get("first_category", "")] * (1 + len(windows)))
+                labels.extend([sat_to_3class(int(sat))] * (1 + len(windows)))
+    return texts, categories, labels
+
+
+def macro_f1(labels, preds, num_classes=3):
+    scores = []
+    for c in range(num_classes):
+        tp = sum(int(y == c and p == c) for y, p in zip(labels, preds))
+        fp = sum(int(y != c and p == c) for y, p in zip(labels, preds))
+        fn = sum(int(y == c and p != c) for y, p in zip(labels, preds))
+        scores.append(2 * tp / (2 * tp + fp + fn) if tp else 0.0)
+    return sum(scores) / num_classes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="満足度カスケードの 1 段目を学習する")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="重みの保存先 (.npz)")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--lr", type=float, default=2.0)
+    parser.add_argument("--num-features", type=int, default=NUM_FEATURES, help="ハッシュ特徴量の次元数")
+    parser.add_argument("--ngram", type=int, nargs="+", default=list(NGRAM_SIZES), help="文字 n-gram の長さ")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-chat-windows", action="store_true",
+                        help="チャットの各ターンの入力を学習データに加えない (対話全体のみ)")
+    args = parser.parse_args()
+
+    train = load_split("train", chat_windows=not args.no_chat_windows)
+    valid = load_split("valid")
+    if not train[0]:
+        print("!!! reproduce/data/train に対話データがありません。gen_monotaro_mock_data.py を先に実行してください。")
+        return
+    counts = np.bincount(train[2], minlength=3)
+    print(f"Train: {len(train[0])} | Valid: {len(valid[0])} | Label distribution: 0={counts[0]}, 1={counts[1]}, 2={counts[2]}")
+
+    classifier = HashedNgramClassifier(num_features=args.num_features, ngram_sizes=args.ngram)
+    start = time.time()
+    classifier.train(*train, epochs=args.epochs, batch_size=args.batch_size, lr=args.lr, seed=args.seed,
+                     log=lambda epoch, loss: print(f"  Epoch {epoch}: loss={loss:.4f}"))
+    print(f"Trained in {time.time() - start:.1f}s")
+
+    if valid[0]:
+        start = time.perf_counter()
+        outputs = [classifier.predict(text, category) for text, category in zip(valid[0], valid[1])]
+        elapsed = time.perf_counter() - start
+        preds = [pred for pred, _ in outputs]
+        confidences = np.array([conf for _, conf in outputs])
+        correct = np.array([int(p == y) for p, y in zip(preds, valid[2])])
+        print("=" * 60)
+        print(f" Valid accuracy: {correct.mean() * 100:.2f}% | Macro F1: {macro_f1(valid[2], preds) * 100:.2f}%")
+        print(f" Latency: {elapsed / len(preds) * 1e6:.0f} us/dialogue")
+        print(f" {'threshold':>10}{'accepted':>10}{'acc (accepted)':>16}")
+        for threshold in (0.5, 0.6, 0.7, 0.8, 0.9, 0.95):
+            accepted = confidences >= threshold
+            acc = correct[accepted].mean() * 100 if accepted.any() else 0.0
+            print(f" {threshold:>10.2f}{accepted.mean() * 100:>9.1f}%{acc:>15.2f}%")
+        print("=" * 60)
+
+    classifier.save(args.output)
+    print(f"Saved: {args.output} ({os.path.getsize(args.output) / 1024 / 1024:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
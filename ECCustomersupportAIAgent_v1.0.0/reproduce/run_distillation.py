@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+MonotaRO 版 知識蒸留パイプライン (CPU 推論用の小型 student)
+
+run_full_pipeline.py で学習した best_model_v2.pt (XLM-RoBERTa、教師) の出力分布を
+ソフトラベルとして、層数・隠れ次元の小さいバックボーンを持つ student を学習する。
+
+1. データ読み込み・データ拡張・トークン化は run_full_pipeline.py と同じ (load_dataset / collate_fn)
+2. 教師の logits を学習データ全件について 1 回だけ計算 (拡張後の同じ入力で student を学習)
+3. 損失 = SOFT_WEIGHT * T^2 * KL(教師 || student, 温度 T) + (1 - SOFT_WEIGHT) * Focal Loss (正解ラベル)
+4. student の単語埋め込みは教師の埋め込みを主成分分析で STUDENT_HIDDEN 次元に射影して初期化
+5. 分類ヘッドは HighAccuracyClassifierV2 と同じ構造 (推論側のインターフェースは変わらない)
+
+出力:
+    best_model_student.pt          (mo-qa-system/student.py の形式、MODEL_PATH に指定して推論)
+    best_model_student.report.json (教師と student のパラメータ数・CPU レイテンシ・検証 F1)
+"""
+
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+import torch.optim as optim
+from sklearn.metrics import accuracy_score, precision_recall_fscore_support
+from torch.utils.data import DataLoader
+from tqdm import tqdm
+from transformers import AutoConfig, AutoModel, get_linear_schedule_with_warmup
+
+from run_full_pipeline import (
+    MODEL_NAME, NUM_CLASSES, FocalLoss, HighAccuracyClassifierV2, collate_fn, load_dataset, monotaro_dir,
+    tokenizer,
+)
+
+sys.path.insert(0, os.path.join(monotaro_dir, "mo-qa-system"))
+from student import save_student
+
+# ==========================================
+# Config (蒸留)
+# ==========================================
+TEACHER_PATH = os.path.join(monotaro_dir, "best_model_v2.pt")
+STUDENT_PATH = os.path.join(monotaro_dir, "best_model_student.pt")
+STUDENT_LAYERS = 4
+STUDENT_HIDDEN = 256
+STUDENT_HEADS = 4
+STUDENT_INTERMEDIATE = 1024
+TEMPERATURE = 2.0
+SOFT_WEIGHT = 0.7        # ソフトラベル (KL) の重み、残りは正解ラベルの Focal Loss
+BATCH_SIZE = 32
+EPOCHS = 10
+LR = 2e-4                # 事前学習なしの小型バックボーンのため教師より大きい
+WARMUP_RATIO = 0.1
+PATIENCE = 3
+LATENCY_SAMPLES = 200    # CPU レイテンシの計測件数 (バッチサイズ 1)
+DEVICE = 'cpu'
+
+
+# ==========================================
+# Models
+# ==========================================
+
+def build_teacher():
+    """run_full_pipeline.py と同じ構成の教師をロード"""
+    backbone = AutoModel.from_pretrained(MODEL_NAME)
+    backbone.resize_token_embeddings(len(tokenizer))
+    teacher = HighAccuracyClassifierV2(backbone, hidden_size=backbone.config.hidden_size, topic_num=24,
+                                       num_classes=NUM_CLASSES)
+    teacher.load_state_dict(torch.load(TEACHER_PATH, map_location=DEVICE, weights_only=True))
+    return teacher.to(DEVICE).eval()
+
+
+def build_student(teacher):
+    """教師のバックボーン設定から層数・隠れ次元だけを小さくした student を作る"""
+    config = AutoConfig.for_model(**{
+        **teacher.backbone.config.to_dict(),
+        "num_hidden_layers": STUDENT_LAYERS,
+        "hidden_size": STUDENT_HIDDEN,
+        "num_attention_heads": STUDENT_HEADS,
+        "intermediate_size": STUDENT_INTERMEDIATE,
+    })
+    backbone = AutoModel.from_config(config)
+    init_embeddings_from_teacher(backbone, teacher.backbone)
+    return HighAccuracyClassifierV2(backbone, hidden_size=STUDENT_HIDDEN, topic_num=24,
+                                    num_classes=NUM_CLASSES).to(DEVICE)
+
+
+@torch.no_grad()
+def init_embeddings_from_teacher(student_backbone, teacher_backbone):
+    """教師の単語・位置埋め込みを、単語埋め込みの主成分で student の隠れ次元に射影して初期化"""
+    teacher_emb = teacher_backbone.embeddings
+    student_emb = student_backbone.embeddings
+    if STUDENT_HIDDEN > teacher_backbone.config.hidden_size:
+        return
+    words = teacher_emb.word_embeddings.weight
+    mean = words.mean(dim=0)
+    _, _, components = torch.pca_lowrank(words - mean, q=STUDENT_HIDDEN, center=False)
+    # 射影後の値の大きさを student の初期化 (initializer_range) にそろえる
+    projected = (words - mean) @ components
+    scale = student_backbone.config.initializer_range / projected.std()
+    student_emb.word_embeddings.weight.copy_(projected * scale)
+    positions = teacher_emb.position_embeddings.weight
+    student_emb.position_embeddings.weight.copy_((positions - positions.mean(dim=0)) @ components * scale)
+    print(f"    Initialized embeddings by PCA ({words.shape[1]} -> {STUDENT_HIDDEN} dims)")
+
+
+def count_parameters(model):
+    total = sum(p.numel() for p in model.parameters())
+    embeddings = sum(p.numel() for p in model.backbone.embeddings.parameters())
+    return {"total": total, "non_embedding": total - embeddings}
+
+
+# ==========================================
+# Soft labels / Loss
+# ==========================================
+
+@torch.no_grad()
+def attach_teacher_logits(teacher, data):
+    """学習データの各サンプルに教師の logits を付ける (拡張後の入力で 1 回だけ計算)"""
+    loader = DataLoader(data, batch_size=BATCH_SIZE, shuffle=False, collate_fn=collate_fn)
+    offset = 0
+    for inp, mask, top, _ in tqdm(loader, desc="Teacher soft labels"):
+        logits = teacher(inp.to(DEVICE), mask.to(DEVICE), top.to(DEVICE)).cpu()
+        for row in logits:
+            data[offset]['teacher_logits'] = row
+            offset += 1
+
+
+def distill_collate_fn(data):
+    input_ids, attention_mask, topics, labels = collate_fn(data)
+    teacher_logits = torch.stack([d['teacher_logits'] for d in data])
+    return input_ids, attention_mask, topics, labels, teacher_logits
+
+
+def distillation_loss(student_logits, teacher_logits, labels, hard_criterion):
+    soft = F.kl_div(F.log_softmax(student_logits / TEMPERATURE, dim=-1),
+                    F.softmax(teacher_logits / TEMPERATURE, dim=-1), reduction='batchmean')
+    return SOFT_WEIGHT * soft * TEMPERATURE ** 2 + (1 - SOFT_WEIGHT) * hard_criterion(student_logits, labels)
+
+
+# ==========================================
+# Evaluation
+# ==========================================
+
+@torch.no_grad()
+def evaluate(model, loader):
+    model.eval()
+    all_preds, all_trues = [], []
+    for batch in loader:
+        inp, mask, top, lbl = [b.to(DEVICE) for b in batch[:4]]
+        preds = torch.argmax(model(inp, mask, top), dim=1)
+        all_preds.extend(preds.cpu().numpy())
+        all_trues.extend(lbl.cpu().numpy())
+    acc = accuracy_score(all_trues, all_preds) * 100
+    _, _, f1, _ = precision_recall_fscore_support(all_trues, all_preds, average='macro', zero_division=0)
+    return acc, f1 * 100
+
+
+@torch.no_grad()
+def measure_latency(model, data):
+    """バッチサイズ 1 (チャット 1 ターン相当) の CPU レイテンシ (ms)"""
+    model.eval()
+    samples = data[:LATENCY_SAMPLES]
+    for d in samples[:5]:
+        model(*[b.to(DEVICE) for b in collate_fn([d])[:3]])  # ウォームアップ
+    latencies = []
+    for d in samples:
+        inp, mask, top, _ = collate_fn([d])
+        start = time.perf_counter()
+        model(inp, mask, top)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {"p50_ms": round(float(np.percentile(latencies, 50)), 2),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 2)}
+
+
+# ==========================================
+# Main
+# ==========================================
+
+def main():
+    print(f">>> Distillation: {STUDENT_LAYERS} layers, hidden {STUDENT_HIDDEN}, T={TEMPERATURE}, "
+          f"soft weight={SOFT_WEIGHT}")
+    if not os.path.exists(TEACHER_PATH):
+        print(f"!!! Teacher not found: {TEACHER_PATH} (run run_full_pipeline.py first)")
+        exit(1)
+
+    print(">>> [1/5] Loading Data...")
+    train_data = load_dataset('train')
+    valid_data = load_dataset('valid')
+    if len(train_data) == 0:
+        print("!!! No training data found.")
+        exit(1)
+
+    train_labels = [d['label'] for d in train_data]
+    label_counts = [max(train_labels.count(i), 1) for i in range(NUM_CLASSES)]
+    class_weights = torch.tensor([len(train_labels) / (NUM_CLASSES * c) for c in label_counts]).float()
+
+    print(">>> [2/5] Teacher Soft Labels...")
+    teacher = build_teacher()
+    attach_teacher_logits(teacher, train_data)
+
+    print(">>> [3/5] Building Student...")
+    student = build_student(teacher)
+    teacher_params, student_params = count_parameters(teacher), count_parameters(student)
+    print(f"    Teacher: {teacher_params['total'] / 1e6:.1f}M params | Student: {student_params['total'] / 1e6:.1f}M "
+          f"({student_params['non_embedding'] / 1e6:.1f}M without embeddings)")
+
+    train_loader = DataLoader(train_data, batch_size=BATCH_SIZE, shuffle=True, collate_fn=distill_collate_fn)
+    valid_loader = DataLoader(valid_data, batch_size=BATCH_SIZE, shuffle=False, collate_fn=collate_fn)
+    optimizer = optim.AdamW(student.parameters(), lr=LR, weight_decay=0.01)
+    total_steps = len(train_loader) * EPOCHS
+    scheduler = get_linear_schedule_with_warmup(optimizer, int(total_steps * WARMUP_RATIO), total_steps)
+    hard_criterion = FocalLoss(gamma=2.0, alpha=class_weights.to(DEVICE))
+    info = {
+        "teacher": os.path.basename(TEACHER_PATH),
+        "layers": STUDENT_LAYERS,
+        "hidden_size": STUDENT_HIDDEN,
+        "temperature": TEMPERATURE,
+        "soft_weight": SOFT_WEIGHT,
+    }
+
+    print(f">>> [4/5] Distilling for {EPOCHS} epochs...")
+    best_acc = -1
+    patience_counter = 0
+    for epoch in range(EPOCHS):
+        student.train()
+        total_loss = 0
+        for batch in tqdm(train_loader, desc=f"Epoch {epoch+1}/{EPOCHS}"):
+            inp, mask, top, lbl, teacher_logits = [b.to(DEVICE) for b in batch]
+            optimizer.zero_grad()
+            loss = distillation_loss(student(inp, mask, top), teacher_logits, lbl, hard_criterion)
+            if torch.isnan(loss):
+                continue
+            loss.backward()
+            torch.nn.utils.clip_grad_norm_(student.parameters(), 1.0)
+            optimizer.step()
+            scheduler.step()
+            total_loss += loss.item()
+
+        acc, f1 = evaluate(student, valid_loader)
+        print(f"    Epoch {epoch+1}: Loss={total_loss:.2f}, Acc={acc:.2f}%, F1={f1:.2f}%")
+        if acc > best_acc:
+            best_acc = acc
+            patience_counter = 0
+            save_student(student, STUDENT_PATH, MODEL_NAME, student.backbone.config.to_dict(),
+                         {**info, "epoch": epoch + 1})
+        else:
+            patience_counter += 1
+            if patience_counter >= PATIENCE:
+                print(f">>> Early stopping at epoch {epoch+1}")
+                break
+
+    print(">>> [5/5] Teacher vs Student...")
+    student.load_state_dict(torch.load(STUDENT_PATH, map_location=DEVICE, weights_only=True)["state_dict"])
+    report = {"valid_samples": len(valid_data), "torch_threads": torch.get_num_threads()}
+    for name, model, params in (("teacher", teacher, teacher_params), ("student", student, student_params)):
+        acc, f1 = evaluate(model, valid_loader)
+        report[name] = {"params": params, "latency": measure_latency(model, valid_data),
+                        "accuracy": round(acc, 2), "macro_f1": round(f1, 2)}
+
+    teacher_ms = report["teacher"]["latency"]["p50_ms"]
+    print("\n" + "=" * 72)
+    print(" MonotaRO Distillation RESULTS (valid, CPU, batch size 1)")
+    print("=" * 72)
+    print(f" {'model':<10}{'params':>10}{'non-emb':>10}{'p50 ms':>10}{'p95 ms':>10}{'speedup':>9}"
+          f"{'acc':>8}{'F1':>8}")
+    for name in ("teacher", "student"):
+        r = report[name]
+        print(f" {name:<10}{r['params']['total'] / 1e6:>9.1f}M{r['params']['non_embedding'] / 1e6:>9.1f}M"
+              f"{r['latency']['p50_ms']:>10.2f}{r['latency']['p95_ms']:>10.2f}"
+              f"{teacher_ms / r['latency']['p50_ms']:>8.2f}x{r['accuracy']:>7.2f}%{r['macro_f1']:>7.2f}%")
+    print("-" * 72)
+    print(f" Student: {STUDENT_PATH}")
+    print(f" Serve with: MODEL_PATH={STUDENT_PATH} python mo-qa-system/app.py")
+    print("=" * 72)
+
+    report_path = os.path.splitext(STUDENT_PATH)[0] + ".report.json"
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f" Report: {report_path}")
+
+
+if __name__ == "__main__":
+    main()